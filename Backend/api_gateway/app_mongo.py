@@ -1,5 +1,5 @@
 # api_gateway/app_mongo.py
-from flask import Flask, jsonify, request, g, make_response
+from flask import Flask, jsonify, request, g, make_response, Response, stream_with_context
 import requests
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -7,10 +7,24 @@ from requests.exceptions import ConnectionError, Timeout, RequestException
 import logging
 import os
 import json
+import random
 from datetime import datetime
 import time
 import jwt
 from logging.handlers import RotatingFileHandler
+from werkzeug.middleware.proxy_fix import ProxyFix
+from api_gateway.compression import ResponseCompression
+from api_gateway.concurrency import ConcurrencyLimits, PRIORITY_BULK, PRIORITY_CRITICAL, PRIORITY_NORMAL
+from api_gateway.events import EventHub
+from api_gateway.hedging import HedgingPolicy
+from api_gateway.ip_rules import IPRules
+from api_gateway.quotas import UserQuotas
+from api_gateway.rate_limiting import ROLE_NAMES
+from api_gateway.request_store import RequestLogStore
+from api_gateway.rollups import GRANULARITIES, RollupEngine
+from api_gateway.upstreams import Upstream
+from deadlines import DEADLINE_HEADER, Deadline, parse_deadline_header
+from health_probes import HealthMonitor, register_health_routes
 
 # Importar configuración según el entorno
 if os.getenv('PORT') or os.getenv('FLASK_ENV') == 'production':
@@ -23,6 +37,17 @@ else:
 
 app = Flask(__name__)
 
+# Render termina TLS en su proxy: remote_addr sería la IP del proxy para todos los clientes.
+# Se confía solo en los últimos TRUSTED_PROXY_COUNT saltos de X-Forwarded-For (los que
+# añade la infraestructura), así un cliente no puede suplantar su IP con la cabecera.
+TRUSTED_PROXY_COUNT = int(os.getenv('TRUSTED_PROXY_COUNT', 1))
+if TRUSTED_PROXY_COUNT > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_COUNT)
+
+# Compresión negociada (gzip/br/zstd); registrada la primera para ejecutarse tras el resto de after_request
+response_compression = ResponseCompression()
+response_compression.init_app(app)
+
 # Configuración de logging básico y seguro
 LOG_DIR = 'logs'
 LOG_FILE = 'logs/api_gateway_mongo.log'
@@ -62,6 +87,14 @@ def setup_logger():
 # Inicializar logger
 logger = setup_logger()
 
+# Muestreo del log de acceso: errores y peticiones lentas siempre, el resto a LOG_SAMPLE_RATE
+LOG_SAMPLE_RATE = min(max(float(os.getenv('LOG_SAMPLE_RATE', 0.1)), 0.0), 1.0)
+LOG_SLOW_REQUEST_MS = float(os.getenv('LOG_SLOW_REQUEST_MS', 500))
+
+# Almacén columnar de peticiones y agregados por minuto/hora/día para /logs/stats
+request_store = RequestLogStore()
+rollups = RollupEngine()
+
 # Configuración de Rate Limiting para protección contra ataques
 limiter = Limiter(
     get_remote_address,
@@ -71,6 +104,10 @@ limiter = Limiter(
     strategy="fixed-window"
 )
 
+# Listas de IPs permitidas/bloqueadas (CIDR): bloqueo antes que nada, y las permitidas sin rate limiting
+ip_rules = IPRules()
+ip_rules.init_app(app, limiter)
+
 # Configuración CORS centralizada usando la configuración del entorno
 print(f"🌐 [GATEWAY] Configurando CORS con origins: {config.CORS_ORIGINS}")
 print(f"🔍 [GATEWAY] Tipo de config: {type(config).__name__}")
@@ -111,7 +148,7 @@ def after_request(response):
 
 
 
-# URLs de los microservicios MongoDB
+# URLs de los microservicios MongoDB (varias réplicas separadas por comas)
 AUTH_SERVICE_URL = getattr(config, 'AUTH_SERVICE_URL', 'http://localhost:5001')
 USER_SERVICE_URL = getattr(config, 'USER_SERVICE_URL', 'http://localhost:5002')
 TASK_SERVICE_URL = getattr(config, 'TASK_SERVICE_URL', 'http://localhost:5003')
@@ -121,6 +158,38 @@ print(f"   Auth Service: {AUTH_SERVICE_URL}")
 print(f"   User Service: {USER_SERVICE_URL}")
 print(f"   Task Service: {TASK_SERVICE_URL}")
 
+# Réplicas de cada servicio con balanceo y chequeos de salud
+UPSTREAMS = {
+    AUTH_SERVICE_URL: Upstream('auth_service', AUTH_SERVICE_URL),
+    USER_SERVICE_URL: Upstream('user_service', USER_SERVICE_URL),
+    TASK_SERVICE_URL: Upstream('task_service', TASK_SERVICE_URL)
+}
+
+# Límite de concurrencia adaptativo por upstream (para el servicio entero, no por réplica)
+concurrency_limits = ConcurrencyLimits()
+
+# Segundo intento para GET de un recurso cuando el primero supera el p95 de la ruta
+hedging = HedgingPolicy()
+
+# Listados y búsquedas: lo primero que se descarta cuando un upstream se satura
+BULK_READ_PATHS = ('tasks', 'users')
+BULK_READ_PREFIXES = ('tasks/search', 'tasks/status/', 'tasks/changes', 'tasks/export')
+
+# Presupuesto de tiempo por ruta (ms): cubre todos los reintentos y se propaga a los
+# servicios en X-Request-Timeout-Ms para que corten a la vez sus consultas a MongoDB
+GATEWAY_DEFAULT_BUDGET_MS = int(os.getenv('GATEWAY_DEFAULT_BUDGET_MS', 30000))
+ROUTE_BUDGETS_MS = {
+    '/login': 15000,
+    '/register': 15000,
+    '/info': 5000,
+    '/task/<task_id>': 10000,
+    '/tasks/status/<status>': 15000,
+    '/tasks/search': 20000,
+    '/tasks/changes': 20000
+}
+# Ajustes sin redeploy de código: ROUTE_BUDGETS_MS='{"/tasks": 45000}'
+ROUTE_BUDGETS_MS.update(json.loads(os.getenv('ROUTE_BUDGETS_MS', '{}')))
+
 # Función para extraer información del usuario del token JWT
 def extract_user_from_token():
     """Extraer información del usuario del token JWT de manera segura"""
@@ -128,12 +197,20 @@ def extract_user_from_token():
         auth_header = request.headers.get('Authorization')
         if auth_header and auth_header.startswith('Bearer '):
             token = auth_header.split(' ')[1]
-            # Decodificar token (sin verificar para extraer info)
-            payload = jwt.decode(token, options={"verify_signature": False})
+            try:
+                payload = jwt.decode(token, config.JWT_SECRET, algorithms=["HS256"])
+                verified = True
+            except jwt.InvalidTokenError:
+                # Decodificar token (sin verificar para extraer info); el rol no es fiable
+                payload = jwt.decode(token, options={"verify_signature": False})
+                verified = False
             return {
                 'user_id': payload.get('user_id'),
                 'username': payload.get('username'),
-                'role_id': payload.get('role_id')
+                'role_id': payload.get('role_id'),
+                'role': payload.get('role') or ROLE_NAMES.get(payload.get('role_id')),
+                'purpose': payload.get('purpose'),
+                'verified': verified
             }
     except Exception as e:
         logger.warning(f"Error extrayendo usuario del token: {e}")
@@ -142,24 +219,12 @@ def extract_user_from_token():
 
 # Función para registrar petición de API de manera segura
 def log_api_request():
-    """Registrar información de la petición entrante de manera segura"""
+    """Guardar el inicio y el usuario de la petición (se registra junto con la respuesta)"""
     try:
         g.start_time = time.time()
         
         user_info = extract_user_from_token()
-        
-        log_data = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "method": request.method,
-            "endpoint": getattr(request, 'endpoint', 'unknown'),
-            "path": request.path,
-            "url": request.url,
-            "user_agent": request.headers.get('User-Agent', 'N/A'),
-            "ip_address": request.remote_addr,
-            "user": user_info
-        }
-        
-        logger.info(f"REQUEST_START: {json.dumps(log_data)}")
+        g.user_info = user_info
     except Exception as e:
         logger.error(f"Error en log_api_request: {e}")
         # No fallar si hay error en logging
@@ -185,19 +250,42 @@ def log_api_response(response):
         elif request.path.startswith('/task/'):
             service_name = "task_service_mongo"
         
-        log_data = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "method": request.method,
-            "endpoint": getattr(request, 'endpoint', 'unknown'),
-            "path": request.path,
-            "service": service_name,
-            "status_code": response.status_code,
-            "response_time_ms": response_time_ms,
-            "response_time_seconds": response_time_seconds,
-            "content_length": getattr(response, 'content_length', 0)
-        }
+        user_info = getattr(g, 'user_info', None) or {}
         
-        logger.info(f"RESPONSE_END: {json.dumps(log_data)}")
+        # Errores y peticiones lentas se registran siempre y con detalle
+        always_log = response.status_code >= 400 or response_time_ms >= LOG_SLOW_REQUEST_MS
+        sample_rate = 1.0 if always_log else LOG_SAMPLE_RATE
+        if sample_rate >= 1.0 or random.random() < sample_rate:
+            # Un solo registro por petición; sample_rate permite reponderar las estadísticas
+            log_data = {
+                "timestamp": datetime.utcnow().isoformat(),
+                "method": request.method,
+                "endpoint": getattr(request, 'endpoint', 'unknown'),
+                "path": request.path,
+                "service": service_name,
+                "status_code": response.status_code,
+                "response_time_ms": response_time_ms,
+                "response_time_seconds": response_time_seconds,
+                "content_length": getattr(response, 'content_length', 0),
+                "ip_address": request.remote_addr,
+                "user": user_info or None,
+                "sample_rate": sample_rate
+            }
+            if always_log:
+                log_data["url"] = request.url
+                log_data["user_agent"] = request.headers.get('User-Agent', 'N/A')
+            
+            logger.info(f"ACCESS: {json.dumps(log_data)}")
+        
+        now = time.time()
+        request_store.append(
+            now, request.method, service_name, response.status_code, response_time_ms,
+            user_id=user_info.get('user_id'), username=user_info.get('username')
+        )
+        # Plantilla de la ruta de Flask (/task/<task_id>): cardinalidad acotada para los sketches
+        route = f"{request.method} {request.url_rule.rule}" if request.url_rule else f"{request.method} (sin ruta)"
+        rollups.record(now, request.method, service_name, response.status_code, response_time_ms,
+                       username=user_info.get('username'), route=route)
     except Exception as e:
         logger.error(f"Error en log_api_response: {e}")
         # No fallar si hay error en logging
@@ -210,52 +298,155 @@ def before_request():
     """Middleware que se ejecuta antes de cada petición"""
     log_api_request()
 
+# Cuotas por usuario y rol (después de extraer el usuario del token en before_request)
+user_quotas = UserQuotas()
+user_quotas.init_app(app, lambda: getattr(g, 'user_info', None))
+
 # Middleware para registrar respuestas de manera segura
 @app.after_request
 def after_request(response):
     """Middleware que se ejecuta después de cada petición"""
     return log_api_response(response)
 
+def request_priority(service_url, path):
+    """Clase de tráfico de la petición para el límite de concurrencia"""
+    if service_url == AUTH_SERVICE_URL or path in ('login', 'register') or 'health' in path or path.endswith(('livez', 'readyz')):
+        return PRIORITY_CRITICAL
+    if request.method == 'GET' and (path in BULK_READ_PATHS or path.startswith(BULK_READ_PREFIXES)):
+        return PRIORITY_BULK
+    return PRIORITY_NORMAL
+
+def request_deadline():
+    """Deadline de la petición: presupuesto de la ruta, acotado por el que envíe el cliente"""
+    rule = request.url_rule.rule if request.url_rule else None
+    budget_ms = ROUTE_BUDGETS_MS.get(rule, GATEWAY_DEFAULT_BUDGET_MS)
+    client_budget_ms = parse_deadline_header(request.headers)
+    if client_budget_ms is not None:
+        budget_ms = min(budget_ms, client_budget_ms)
+    return Deadline(budget_ms)
+
 def proxy_request(service_url, path):
-    """Función auxiliar para hacer proxy de requests con retry automático"""
-    url = f"{service_url}/{path}"
+    """Proxy con límite de concurrencia adaptativo: si el upstream está saturado, 503 inmediato"""
+    g.deadline = request_deadline()
+    upstream_limiter = concurrency_limits.get(UPSTREAMS[service_url].name)
+    if not upstream_limiter.try_acquire(request_priority(service_url, path)):
+        retry_after = upstream_limiter.retry_after()
+        print(f"⛔ [PROXY] {upstream_limiter.name} saturado, descartando {request.method} /{path}")
+        error_response = jsonify({
+            "error": "Servicio saturado. Intenta de nuevo más tarde.",
+            "retry_after": retry_after
+        })
+        error_response.status_code = 503
+        error_response.headers['Retry-After'] = str(retry_after)
+        return add_cors_headers(error_response)
+    
+    g.upstream_attempt_start = time.perf_counter()
+    try:
+        response = forward_request(service_url, path, g.deadline)
+    except Exception:
+        upstream_limiter.release((time.perf_counter() - g.upstream_attempt_start) * 1000, False)
+        raise
+    
+    # El hueco se libera al terminar de enviar el cuerpo (que puede seguir llegando del
+    # upstream por trozos), y la latencia es la del último intento, sin las esperas entre reintentos
+    attempt_start = g.upstream_attempt_start
+    # 5xx, timeouts y errores de conexión cuentan como sobrecarga del upstream
+    ok = response.status_code < 500
+    response.call_on_close(
+        lambda: upstream_limiter.release((time.perf_counter() - attempt_start) * 1000, ok)
+    )
+    return response
+
+def deadline_exceeded(url):
+    """504 cuando el presupuesto de la petición se agota antes de obtener respuesta"""
+    print(f"⌛ [PROXY] Presupuesto agotado para {url}")
+    error_response = jsonify({"error": "Timeout del servicio"})
+    error_response.status_code = 504
+    return add_cors_headers(error_response)
+
+# Cabeceras del upstream que se conservan al reenviar el cuerpo sin tocarlo
+PASSTHROUGH_HEADERS = ('Content-Length', 'Content-Encoding', 'Cache-Control', 'ETag', 'Last-Modified')
+UPSTREAM_CHUNK_SIZE = 64 * 1024
+
+def stream_upstream_body(resp):
+    """Cuerpo del upstream por trozos, tal como llega (una respuesta ya comprimida sigue comprimida)"""
+    try:
+        for chunk in resp.raw.stream(UPSTREAM_CHUNK_SIZE, decode_content=False):
+            yield chunk
+    finally:
+        resp.close()
+
+def forward_request(service_url, path, deadline):
+    """Función auxiliar para hacer proxy de requests con retry automático dentro del deadline"""
+    upstream = UPSTREAMS[service_url]
+    url = f"{upstream.name}/{path}"
     
     headers = {}
     for key, value in request.headers:
-        if key.lower() not in ['host', 'content-length', 'connection']:
+        if key.lower() not in ['host', 'content-length', 'connection', DEADLINE_HEADER.lower()]:
             headers[key] = value
     
+    # Agregar headers específicos para evitar problemas
+    if 'Content-Type' not in headers and request.is_json:
+        headers['Content-Type'] = 'application/json'
+    # El cuerpo del upstream se reenvía sin decodificar: solo codificaciones que el cliente acepte
+    headers.setdefault('Accept-Encoding', 'identity')
+    
+    # Los intentos de hedging corren en otros hilos: leer la petición antes
+    method = request.method
+    params = request.args
+    body = request.get_json() if request.is_json else None
+    hedge_route = hedging.route_for(method, path)
+    # Réplicas ya usadas: reintentos y hedges van a otra si la hay
+    tried = []
+    
+    def send():
+        return upstream.request(
+            requests,
+            method,
+            path,
+            tried=tried,
+            params=params,
+            json=body,
+            # El servicio recibe lo que queda del presupuesto, no el total
+            headers={**headers, DEADLINE_HEADER: deadline.header_value()},
+            timeout=deadline.remaining_seconds(),
+            allow_redirects=False,
+            # El cuerpo se lee al reenviarlo al cliente, no antes
+            stream=True
+        )
+    
     # Implementar retry automático para servicios externos
     max_retries = 3
     retry_delay = 2  # segundos
     
     for attempt in range(max_retries):
+        if deadline.expired():
+            return deadline_exceeded(url)
+        g.upstream_attempt_start = time.perf_counter()
         try:
-            # Agregar headers específicos para evitar problemas
-            if 'Content-Type' not in headers and request.is_json:
-                headers['Content-Type'] = 'application/json'
-            
             print(f"🔄 [PROXY] Intento {attempt + 1}/{max_retries} para {url}")
             
-            resp = requests.request(
-                method=request.method,
-                url=url,
-                json=request.get_json() if request.is_json else None,
-                headers=headers,
-                timeout=120,  # Aumentar timeout para Render
-                allow_redirects=False
-            )
+            if hedge_route:
+                resp = hedging.call(hedge_route, send, deadline.remaining_seconds())
+            else:
+                resp = send()
             
             # Si llegamos aquí, la petición fue exitosa
             print(f"✅ [PROXY] Petición exitosa a {url}")
             
-            # Crear respuesta con headers CORS apropiados
-            try:
-                response_data = resp.json()
-                response = jsonify(response_data)
-            except ValueError:
-                response = jsonify({"message": resp.text})
+            # JSON y binarios (p. ej. el QR de /auth/otp/qr): reenviar el cuerpo tal cual,
+            # por trozos y sin decodificar; la compresión hacia el cliente se hace al vuelo
+            content_type = resp.headers.get('Content-Type', '')
+            if content_type and not content_type.startswith('text/'):
+                response = Response(stream_upstream_body(resp), status=resp.status_code, content_type=content_type)
+                for header in PASSTHROUGH_HEADERS:
+                    if header in resp.headers:
+                        response.headers[header] = resp.headers[header]
+                return add_cors_headers(response)
             
+            # Texto u otros: envolver en JSON como siempre
+            response = jsonify({"message": resp.text})
             response.status_code = resp.status_code
             
             # Usar función centralizada para CORS
@@ -264,8 +455,8 @@ def proxy_request(service_url, path):
         except (ConnectionError, Timeout, RequestException) as e:
             print(f"❌ [PROXY] Intento {attempt + 1} falló: {type(e).__name__}")
             
-            # Si es el último intento, devolver error
-            if attempt == max_retries - 1:
+            # Si es el último intento o no queda presupuesto para otro, devolver error
+            if attempt == max_retries - 1 or deadline.remaining_seconds() <= retry_delay:
                 if isinstance(e, ConnectionError):
                     error_response = jsonify({"error": "Servicio no disponible"})
                     error_response.status_code = 503
@@ -279,7 +470,6 @@ def proxy_request(service_url, path):
                 return add_cors_headers(error_response)
             
             # Esperar antes del siguiente intento
-            import time
             time.sleep(retry_delay)
 
 # Manejo de errores para rate limiting
@@ -331,15 +521,31 @@ def get_tasks_proxy():
 @app.route('/task', methods=['POST'])
 def create_task_proxy():
     """Proxy para crear una nueva tarea en el Task Service MongoDB"""
-    return proxy_request(TASK_SERVICE_URL, 'task')
+    response = proxy_request(TASK_SERVICE_URL, 'task')
+    if response.status_code < 400:
+        event_hub.notify_tasks_changed()
+    return response
 
 @app.route('/task/<task_id>', methods=['GET', 'PUT', 'DELETE'])
 @limiter.limit("50 per minute")  # Límite moderado para tareas
 def task_proxy(task_id):
     """Proxy para operaciones específicas de tarea en el Task Service MongoDB"""
-    return proxy_request(TASK_SERVICE_URL, f'task/{task_id}')
+    response = proxy_request(TASK_SERVICE_URL, f'task/{task_id}')
+    if request.method != 'GET' and response.status_code < 400:
+        event_hub.notify_tasks_changed()
+    return response
 
 # Endpoints adicionales de tareas
+@app.route('/tasks/search', methods=['GET'])
+def tasks_search_proxy():
+    """Proxy para la búsqueda de tareas (?q=&mode=text|prefix&page=&limit=&fields=)"""
+    return proxy_request(TASK_SERVICE_URL, 'tasks/search')
+
+@app.route('/tasks/changes', methods=['GET'])
+def tasks_changes_proxy():
+    """Proxy para la sincronización incremental de tareas (?since=<watermark>)"""
+    return proxy_request(TASK_SERVICE_URL, 'tasks/changes')
+
 @app.route('/tasks/status/<status>', methods=['GET'])
 def tasks_by_status_proxy(status):
     """Proxy para obtener tareas por status del Task Service MongoDB"""
@@ -370,115 +576,182 @@ def root():
         }
     }), 200
 
+LOGS_STATS_TOP_ROUTES = int(os.getenv('LOGS_STATS_TOP_ROUTES', 20))
+# Ventana de /logs/stats (y del evento stats de /events) cuando no se indica from ni to
+LOGS_STATS_DEFAULT_WINDOW_HOURS = int(os.getenv('LOGS_STATS_DEFAULT_WINDOW_HOURS', 24))
+
+def bucket_to_stats(bucket):
+    """Convertir un bucket de rollups al formato de estadísticas de las gráficas"""
+    stats = {
+        'total_requests': bucket.count,
+        'requests_by_method': {'GET': 0, 'POST': 0, 'PUT': 0, 'DELETE': 0, 'OPTIONS': 0},
+        'requests_by_service': {'auth_service_mongo': 0, 'user_service_mongo': 0, 'task_service_mongo': 0, 'api_gateway': 0},
+        'requests_by_status': {'2xx': 0, '3xx': 0, '4xx': 0, '5xx': 0},
+        'response_times': {'fast': 0, 'medium': 0, 'slow': 0},  # <100ms, 100-500ms, >500ms
+        'top_users': {},
+        'hourly_distribution': {str(i).zfill(2): 0 for i in range(24)},
+        'total_responses': bucket.latency.count,
+        'average_response_time': 0,
+        'min_response_time': round(bucket.latency.min or 0, 2),
+        'max_response_time': round(bucket.latency.max or 0, 2),
+        'percentiles': bucket.latency.percentiles(),
+        'percentiles_by_service': {
+            service: sketch.percentiles() for service, sketch in bucket.service_latency.items()
+        },
+        # Rutas con más tráfico primero
+        'percentiles_by_route': {
+            route: dict(sketch.percentiles(), count=sketch.count)
+            for route, sketch in sorted(bucket.route_latency.items(), key=lambda x: x[1].count, reverse=True)[:LOGS_STATS_TOP_ROUTES]
+        },
+        'success_rate': 0
+    }
+    
+    for method, count in bucket.methods.items():
+        if method in stats['requests_by_method']:
+            stats['requests_by_method'][method] += count
+    
+    for service, count in bucket.services.items():
+        if service in stats['requests_by_service']:
+            stats['requests_by_service'][service] += count
+    
+    for status_class, count in bucket.statuses.items():
+        if status_class in stats['requests_by_status']:
+            stats['requests_by_status'][status_class] += count
+    
+    for hour, count in bucket.hours.items():
+        stats['hourly_distribution'][str(hour).zfill(2)] += count
+    
+    # Clasificar response time a partir del sketch de latencias
+    stats['response_times']['fast'] = bucket.latency.count_below(100)
+    stats['response_times']['medium'] = bucket.latency.count_below(500) - stats['response_times']['fast']
+    stats['response_times']['slow'] = bucket.count - stats['response_times']['fast'] - stats['response_times']['medium']
+    
+    # Calcular estadísticas adicionales
+    if stats['total_responses'] > 0:
+        # Promedio sobre las respuestas medidas, no sobre todas las peticiones
+        stats['average_response_time'] = round(bucket.latency_sum / stats['total_responses'], 2)
+    if stats['total_requests'] > 0:
+        stats['success_rate'] = round((stats['requests_by_status']['2xx'] / stats['total_requests']) * 100, 1)
+    
+    # Ordenar usuarios por cantidad de peticiones
+    stats['top_users'] = dict(sorted(bucket.users.items(), key=lambda x: x[1], reverse=True)[:10])
+    
+    return stats
+
+def default_window(start, end):
+    """Sin from ni to: las últimas LOGS_STATS_DEFAULT_WINDOW_HOURS horas (no todo el histórico)"""
+    if start is None and end is None:
+        return time.time() - LOGS_STATS_DEFAULT_WINDOW_HOURS * 3600, None, True
+    return start, end, False
+
+def compute_logs_stats(start=None, end=None, granularity='hour'):
+    """Estadísticas de [start, end) combinando los rollups (None si no hay peticiones)"""
+    start, end, defaulted = default_window(start, end)
+    total, series = rollups.query(start, end, granularity)
+    if total.count == 0 and defaulted:
+        return None
+    
+    stats = bucket_to_stats(total)
+    stats['series'] = [
+        {
+            'start': datetime.utcfromtimestamp(bucket_start).isoformat() + 'Z',
+            'total_requests': bucket.count,
+            'requests_by_status': dict(bucket.statuses),
+            'average_response_time': round(bucket.latency_sum / bucket.latency.count, 2) if bucket.latency.count else 0,
+            'percentiles': bucket.latency.percentiles()
+        }
+        for bucket_start, bucket in series
+    ]
+    return stats
+
+def compute_raw_logs_stats(start=None, end=None):
+    """Estadísticas exactas de [start, end) leyendo el almacén de peticiones (None si no hay particiones)"""
+    start, end, _ = default_window(start, end)
+    summary = request_store.summarize(start, end)
+    if summary is None:
+        return None
+    
+    stats = {
+        'total_requests': summary['total'],
+        'requests_by_method': {'GET': 0, 'POST': 0, 'PUT': 0, 'DELETE': 0, 'OPTIONS': 0},
+        'requests_by_service': {'auth_service_mongo': 0, 'user_service_mongo': 0, 'task_service_mongo': 0, 'api_gateway': 0},
+        'requests_by_status': {'2xx': 0, '3xx': 0, '4xx': 0, '5xx': 0},
+        'response_times': summary['latency_buckets'],
+        'top_users': dict(sorted(summary['users'].items(), key=lambda x: x[1], reverse=True)[:10]),
+        'hourly_distribution': {str(i).zfill(2): 0 for i in range(24)},
+        'total_responses': summary['total'],
+        'average_response_time': round(summary['latency_sum'] / summary['total'], 2) if summary['total'] else 0,
+        'min_response_time': round(summary['latency_min'], 2),
+        'max_response_time': round(summary['latency_max'], 2),
+        'percentiles': summary['percentiles'],
+        'success_rate': 0
+    }
+    
+    for method, count in summary['methods'].items():
+        if method in stats['requests_by_method']:
+            stats['requests_by_method'][method] += count
+    
+    for service, count in summary['services'].items():
+        if service in stats['requests_by_service']:
+            stats['requests_by_service'][service] += count
+    
+    for status, count in summary['statuses'].items():
+        status_class = f"{status // 100}xx"
+        if status_class in stats['requests_by_status']:
+            stats['requests_by_status'][status_class] += count
+    
+    for hour, count in summary['hours'].items():
+        stats['hourly_distribution'][str(hour).zfill(2)] += count
+    
+    if stats['total_requests'] > 0:
+        stats['success_rate'] = round((stats['requests_by_status']['2xx'] / stats['total_requests']) * 100, 1)
+    
+    return stats
+
+def parse_time_param(value):
+    """Parámetro de tiempo como epoch (segundos) o ISO 8601; devuelve epoch o lanza ValueError"""
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            return (parsed - datetime(1970, 1, 1)).total_seconds()
+        return parsed.timestamp()
+
 @app.route('/logs/stats', methods=['GET'])
 @limiter.limit("50 per minute")  # Límite moderado para estadísticas
 def get_logs_stats():
-    """Endpoint para obtener estadísticas de logs para las gráficas"""
+    """Endpoint para obtener estadísticas de logs para las gráficas (?from=&to=&granularity=&source=)"""
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in GRANULARITIES:
+        return jsonify({"error": f"granularity inválida. Debe ser una de: {list(GRANULARITIES)}"}), 400
+    # rollups: series por granularidad; raw: ventana y percentiles exactos desde el almacén de peticiones
+    source = request.args.get('source', 'rollups')
+    if source not in ('rollups', 'raw'):
+        return jsonify({"error": "source inválido. Debe ser 'rollups' o 'raw'"}), 400
     try:
-        # Leer el archivo de logs
-        if not os.path.exists(LOG_FILE):
-            return jsonify({"error": "Archivo de logs no encontrado"}), 404
-        
-        with open(LOG_FILE, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-        
-        # Contadores para estadísticas
-        stats = {
-            'total_requests': 0,
-            'requests_by_method': {'GET': 0, 'POST': 0, 'PUT': 0, 'DELETE': 0, 'OPTIONS': 0},
-            'requests_by_service': {'auth_service_mongo': 0, 'user_service_mongo': 0, 'task_service_mongo': 0, 'api_gateway': 0},
-            'requests_by_status': {'2xx': 0, '3xx': 0, '4xx': 0, '5xx': 0},
-            'response_times': {'fast': 0, 'medium': 0, 'slow': 0},  # <100ms, 100-500ms, >500ms
-            'top_users': {},
-            'hourly_distribution': {str(i).zfill(2): 0 for i in range(24)},
-            'average_response_time': 0,
-            'success_rate': 0
-        }
-        
-        total_response_time = 0
-        successful_requests = 0
-        
-        # Procesar cada línea del log
-        for line in lines:
-            if 'REQUEST_START:' in line:
-                try:
-                    # Extraer datos del log
-                    log_start = line.find('REQUEST_START:') + len('REQUEST_START:')
-                    log_data = json.loads(line[log_start:])
-                    
-                    # Contar por método
-                    method = log_data.get('method', 'UNKNOWN')
-                    if method in stats['requests_by_method']:
-                        stats['requests_by_method'][method] += 1
-                    
-                    # Contar por usuario
-                    user = log_data.get('user', {})
-                    if user and user.get('username'):
-                        username = user['username']
-                        stats['top_users'][username] = stats['top_users'].get(username, 0) + 1
-                    
-                    # Distribución por hora
-                    timestamp = log_data.get('timestamp', '')
-                    if timestamp:
-                        try:
-                            hour = datetime.fromisoformat(timestamp.replace('Z', '+00:00')).hour
-                            stats['hourly_distribution'][str(hour).zfill(2)] += 1
-                        except:
-                            pass
-                    
-                    stats['total_requests'] += 1
-                    
-                except json.JSONDecodeError:
-                    continue
-            
-            elif 'RESPONSE_END:' in line:
-                try:
-                    # Extraer datos del log
-                    log_start = line.find('RESPONSE_END:') + len('RESPONSE_END:')
-                    log_data = json.loads(line[log_start:])
-                    
-                    # Contar por servicio
-                    service = log_data.get('service', 'unknown')
-                    if service in stats['requests_by_service']:
-                        stats['requests_by_service'][service] += 1
-                    
-                    # Contar por status code
-                    status_code = log_data.get('status_code', 0)
-                    if 200 <= status_code < 300:
-                        stats['requests_by_status']['2xx'] += 1
-                        successful_requests += 1
-                    elif 300 <= status_code < 400:
-                        stats['requests_by_status']['3xx'] += 1
-                    elif 400 <= status_code < 500:
-                        stats['requests_by_status']['4xx'] += 1
-                    elif 500 <= status_code < 600:
-                        stats['requests_by_status']['5xx'] += 1
-                    
-                    # Clasificar response time
-                    response_time_ms = log_data.get('response_time_ms', 0)
-                    total_response_time += response_time_ms
-                    
-                    if response_time_ms < 100:
-                        stats['response_times']['fast'] += 1
-                    elif response_time_ms < 500:
-                        stats['response_times']['medium'] += 1
-                    else:
-                        stats['response_times']['slow'] += 1
-                        
-                except json.JSONDecodeError:
-                    continue
-        
-        # Calcular estadísticas adicionales
-        if stats['total_requests'] > 0:
-            stats['average_response_time'] = round(total_response_time / stats['total_requests'], 2)
-            stats['success_rate'] = round((successful_requests / stats['total_requests']) * 100, 1)
-        
-        # Ordenar usuarios por cantidad de peticiones
-        stats['top_users'] = dict(sorted(stats['top_users'].items(), key=lambda x: x[1], reverse=True)[:10])
+        start = parse_time_param(request.args['from']) if request.args.get('from') else None
+        end = parse_time_param(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"error": "Parámetros from/to inválidos (epoch o ISO 8601)"}), 400
+    
+    try:
+        if source == 'raw':
+            stats = compute_raw_logs_stats(start, end)
+        else:
+            stats = compute_logs_stats(start, end, granularity)
+        if stats is None:
+            return jsonify({"error": "No hay registros de peticiones"}), 404
         
         return jsonify({
             "success": True,
             "data": stats,
+            "range": {
+                "from": request.args.get('from'),
+                "to": request.args.get('to'),
+                "granularity": granularity,
+                "source": source
+            },
             "timestamp": datetime.utcnow().isoformat()
         })
         
@@ -486,25 +759,88 @@ def get_logs_stats():
         logger.error(f"Error obteniendo estadísticas de logs: {e}")
         return jsonify({"error": "Error interno del servidor"}), 500
 
+# ===========================================
+# ========= SERVER-SENT EVENTS (/events) ====
+# ===========================================
+
+# Cada suscriptor ocupa un hilo de gthread mientras dura la conexión: el límite se
+# deja por debajo de los hilos del worker para que siempre queden SSE_RESERVED_THREADS
+# libres para el resto de peticiones
+GATEWAY_THREADS = int(os.getenv('GATEWAY_THREADS', 32))
+SSE_RESERVED_THREADS = int(os.getenv('SSE_RESERVED_THREADS', 16))
+SSE_MAX_SUBSCRIBERS = max(0, min(int(os.getenv('SSE_MAX_SUBSCRIBERS', GATEWAY_THREADS // 4)),
+                                 GATEWAY_THREADS - SSE_RESERVED_THREADS))
+SSE_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', 100))
+SSE_HEARTBEAT_SECONDS = int(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+SSE_POLL_SECONDS = int(os.getenv('SSE_POLL_SECONDS', 5))
+SSE_STATS_SECONDS = int(os.getenv('SSE_STATS_SECONDS', 30))
+
+# Sesión compartida por el hilo productor para reutilizar la conexión al Task Service
+_events_session = requests.Session()
+
+def fetch_task_changes(watermark):
+    """Consultar /tasks/changes del Task Service con un token interno del gateway"""
+    token = jwt.encode({"sub": "api_gateway", "role": "service"}, config.JWT_SECRET, algorithm="HS256")
+    resp = UPSTREAMS[TASK_SERVICE_URL].request(
+        _events_session,
+        'GET',
+        'tasks/changes',
+        params={"since": watermark},
+        headers={"Authorization": f"Bearer {token}"},
+        timeout=10
+    )
+    if resp.status_code != 200:
+        logger.warning(f"SSE: /tasks/changes respondió {resp.status_code}")
+        return None
+    return resp.json()
+
+event_hub = EventHub(
+    fetch_task_changes=fetch_task_changes,
+    compute_stats=compute_logs_stats,
+    max_subscribers=SSE_MAX_SUBSCRIBERS,
+    queue_size=SSE_QUEUE_SIZE,
+    heartbeat_interval=SSE_HEARTBEAT_SECONDS,
+    poll_interval=SSE_POLL_SECONDS,
+    stats_interval=SSE_STATS_SECONDS
+)
+
+@app.route('/events', methods=['GET'])
+def events_stream():
+    """Stream SSE con notificaciones de tareas y deltas de estadísticas de logs"""
+    # Solo usuarios con un token válido: los eventos se filtran por usuario
+    user_info = extract_user_from_token()
+    if not user_info or not user_info['verified'] or not user_info['user_id'] or user_info['purpose']:
+        return jsonify({"error": "Token requerido"}), 401
+    
+    subscriber = event_hub.subscribe(str(user_info['user_id']), is_admin=user_info['role_id'] == 1)
+    if subscriber is None:
+        response = jsonify({"error": "Demasiados suscriptores de eventos. Intenta de nuevo más tarde."})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(SSE_POLL_SECONDS * 6)
+        return response
+    
+    response = Response(stream_with_context(event_hub.stream(subscriber)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# ===========================================
+# ========= LIVENESS / READINESS ============
+# ===========================================
+
+# Las réplicas de cada upstream se sondean en segundo plano sobre su /livez (upstreams.py).
+# No son críticas: el gateway sigue listo (y responde 503 por ruta) aunque un servicio esté caído.
+health_monitor = HealthMonitor("API Gateway (MongoDB)")
+for _upstream in UPSTREAMS.values():
+    health_monitor.add_probe(_upstream.name, _upstream.probe, critical=False)
+register_health_routes(app, health_monitor)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint para Render"""
     try:
-        # Verificar configuración
-        print(f"🔍 [HEALTH] Verificando configuración...")
-        print(f"   FLASK_ENV: {os.getenv('FLASK_ENV')}")
-        print(f"   PORT: {os.getenv('PORT')}")
-        print(f"   Tipo de config: {type(config).__name__}")
-        print(f"   Módulo de config: {config.__module__}")
-        print(f"   CORS Origins: {config.CORS_ORIGINS}")
-        
-        # Probar conexión a MongoDB
-        try:
-            from database_mongo import mongo_db
-            connected = mongo_db.connect()
-            mongodb_status = "connected" if connected else "disconnected"
-        except Exception as e:
-            mongodb_status = f"error: {str(e)}"
+        # Estado de los servicios desde la última sonda en segundo plano (no abre conexiones)
+        readiness = health_monitor.snapshot()
         
         return jsonify({
             'status': 'healthy',
@@ -513,7 +849,10 @@ def health_check():
             'port': os.getenv('PORT', 'unknown'),
             'config_type': type(config).__name__,
             'config_module': config.__module__,
-            'mongodb': mongodb_status,
+            'upstreams': readiness['dependencies'],
+            'replicas': {upstream.name: upstream.stats() for upstream in UPSTREAMS.values()},
+            'concurrency': concurrency_limits.stats(),
+            'hedging': hedging.stats(),
             'cors_origins': config.CORS_ORIGINS,
             'timestamp': datetime.utcnow().isoformat()
         }), 200
@@ -539,7 +878,10 @@ def root():
             "users": "/user/*", 
             "tasks": "/task/*",
             "health": "/health",
-            "logs": "/logs/stats"
+            "liveness": "/livez",
+            "readiness": "/readyz",
+            "logs": "/logs/stats",
+            "events": "/events"
         }
     })
 
@@ -0,0 +1,189 @@
+# api_gateway/compression.py - Compresión de respuestas negociada con Accept-Encoding
+"""
+Comprime las respuestas del gateway según lo que acepte el cliente: brotli y zstd si
+las librerías están instaladas (`brotli`/`brotlicffi`, `zstandard`), gzip siempre.
+Entre las que acepta el cliente se usa la primera de ENCODING_PREFERENCE; los valores
+q de Accept-Encoding solo deciden qué se acepta (q=0 lo excluye).
+
+No se comprime:
+- por debajo de COMPRESSION_MIN_SIZE bytes (si se conoce el tamaño);
+- lo que ya trae Content-Encoding (p. ej. una respuesta ya comprimida del upstream);
+- tipos que no ganan nada (imágenes, zip...) ni los streams SSE, que deben llegar
+  evento a evento.
+
+El cuerpo se comprime por trozos a medida que se envía: las respuestas del proxy que
+llegan en streaming desde el upstream no se acumulan en memoria, y cada trozo se
+vacía (sync flush) para que el cliente reciba datos sin esperar al final.
+"""
+
+import os
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 4))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv('COMPRESSION_ZSTD_LEVEL', 3))
+
+# Tamaño de los trozos en que se comprime un cuerpo ya completo en memoria
+COMPRESSION_CHUNK_SIZE = 64 * 1024
+
+ENCODING_PREFERENCE = ('br', 'zstd', 'gzip')
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+UNCOMPRESSIBLE_TYPES = ('text/event-stream',)
+
+
+class GzipEncoder:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk):
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, quality):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, chunk):
+        return self._compressor.process(chunk) + self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, chunk):
+        return self._compressor.compress(chunk) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+def parse_accept_encoding(header):
+    """{codificación: q} a partir de la cabecera Accept-Encoding"""
+    accepted = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+class ResponseCompression:
+    """Negociación y compresión en streaming de las respuestas de una app Flask"""
+
+    def __init__(self, min_size=COMPRESSION_MIN_SIZE, gzip_level=COMPRESSION_GZIP_LEVEL,
+                 brotli_quality=COMPRESSION_BROTLI_QUALITY, zstd_level=COMPRESSION_ZSTD_LEVEL,
+                 enabled=COMPRESSION_ENABLED):
+        self.min_size = min_size
+        self.enabled = enabled
+        self.encoders = {'gzip': lambda: GzipEncoder(gzip_level)}
+        if brotli is not None:
+            self.encoders['br'] = lambda: BrotliEncoder(brotli_quality)
+        if zstandard is not None:
+            self.encoders['zstd'] = lambda: ZstdEncoder(zstd_level)
+
+    def negotiate(self, accept_encoding):
+        """Codificación a usar para el cliente (None si no acepta ninguna disponible)"""
+        accepted = parse_accept_encoding(accept_encoding or '')
+        wildcard = accepted.get('*', 0.0)
+        for name in ENCODING_PREFERENCE:
+            if name in self.encoders and accepted.get(name, wildcard) > 0:
+                return name
+        return None
+
+    @staticmethod
+    def compressible(response):
+        mimetype = response.mimetype or ''
+        return mimetype.startswith(COMPRESSIBLE_TYPES) and not mimetype.startswith(UNCOMPRESSIBLE_TYPES)
+
+    @staticmethod
+    def _compress_stream(encoder, chunks, close=None):
+        try:
+            for chunk in chunks:
+                if chunk:
+                    data = encoder.compress(chunk)
+                    if data:
+                        yield data
+            yield encoder.finish()
+        finally:
+            if close is not None:
+                close()
+
+    def compress_response(self, response):
+        if (not self.enabled or request.method == 'HEAD' or response.status_code < 200
+                or response.status_code in (204, 304) or response.direct_passthrough):
+            return response
+        if 'Content-Encoding' in response.headers:
+            # Ya codificada (p. ej. por el upstream según el Accept-Encoding reenviado):
+            # una caché intermedia no debe servirla a clientes que no la acepten
+            response.vary.add('Accept-Encoding')
+            return response
+        if not self.compressible(response):
+            return response
+
+        # La respuesta depende de Accept-Encoding aunque esta vez no se comprima
+        response.vary.add('Accept-Encoding')
+        length = response.content_length
+        if length is not None and length < self.min_size:
+            return response
+        encoding = self.negotiate(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+
+        if response.is_sequence:
+            # Cuerpo ya en memoria: comprimir por trozos igualmente, sin copiarlo entero
+            body = memoryview(response.get_data())
+            chunks = (bytes(body[i:i + COMPRESSION_CHUNK_SIZE]) for i in range(0, len(body), COMPRESSION_CHUNK_SIZE))
+            close = None
+        else:
+            # Stream (p. ej. cuerpo del upstream): se comprime a medida que llega
+            chunks = response.iter_encoded()
+            close = getattr(response.response, 'close', None)
+
+        response.response = self._compress_stream(self.encoders[encoding](), chunks, close)
+        response.headers['Content-Encoding'] = encoding
+        response.headers.pop('Content-Length', None)
+        etag = response.headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            # El cuerpo ya no es idéntico byte a byte al de la ETag fuerte
+            response.headers['ETag'] = f"W/{etag}"
+        return response
+
+    def init_app(self, app):
+        """Registrar la compresión; conviene hacerlo antes que el resto de after_request
+        para que se ejecute la última (Flask los ejecuta en orden inverso)"""
+        app.after_request(self.compress_response)
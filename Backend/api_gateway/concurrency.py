@@ -0,0 +1,139 @@
+# api_gateway/concurrency.py - Límite de concurrencia adaptativo por servicio upstream
+"""
+Cada servicio upstream tiene un límite de peticiones en vuelo que se ajusta con AIMD
+según la latencia observada:
+
+- Aumento aditivo: cada respuesta sana con el límite en uso suma 1/limit (≈ +1 por
+  ventana completa de peticiones).
+- Disminución multiplicativa: si la latencia suavizada supera tolerance × la latencia
+  base (más un margen absoluto) o el upstream devuelve 5xx/timeout, el límite se
+  multiplica por backoff, como mucho una vez por RTT.
+
+La latencia base es la mínima observada en la ventana actual y la anterior
+(BASELINE_WINDOW_SECONDS): un servicio que se degrada no la arrastra de inmediato, y
+tras un par de ventanas se acepta la nueva latencia como normal. Cuando no hay
+capacidad la petición se descarta al momento (503 + Retry-After) en lugar de ocupar
+un hilo del worker esperando.
+
+Prioridades: cada clase puede usar una fracción del límite (PRIORITY_SHARES), de modo
+que el tráfico de autenticación y health sigue pasando cuando las lecturas masivas ya
+se están descartando. El estado es por proceso (cada worker limita sus propios hilos).
+"""
+
+import os
+import threading
+import time
+
+CONCURRENCY_INITIAL_LIMIT = int(os.getenv('CONCURRENCY_INITIAL_LIMIT', 20))
+CONCURRENCY_MIN_LIMIT = int(os.getenv('CONCURRENCY_MIN_LIMIT', 2))
+CONCURRENCY_MAX_LIMIT = int(os.getenv('CONCURRENCY_MAX_LIMIT', 200))
+CONCURRENCY_TOLERANCE = float(os.getenv('CONCURRENCY_TOLERANCE', 2.0))
+CONCURRENCY_LATENCY_SLACK_MS = float(os.getenv('CONCURRENCY_LATENCY_SLACK_MS', 50))
+CONCURRENCY_BACKOFF = 0.9
+
+# Fracción del límite que puede ocupar cada clase de tráfico
+PRIORITY_CRITICAL = 'critical'
+PRIORITY_NORMAL = 'normal'
+PRIORITY_BULK = 'bulk'
+PRIORITY_SHARES = {
+    PRIORITY_CRITICAL: 1.0,   # auth y health
+    PRIORITY_NORMAL: 0.9,     # lecturas puntuales y escrituras
+    PRIORITY_BULK: 0.7        # listados y búsquedas
+}
+
+# Suavizado de la latencia reciente y ventana del mínimo que sirve de latencia base
+RTT_SMOOTHING = 0.2
+BASELINE_WINDOW_SECONDS = 30
+
+
+class AdaptiveLimiter:
+    """Límite AIMD de peticiones en vuelo hacia un upstream"""
+
+    def __init__(self, name, initial=CONCURRENCY_INITIAL_LIMIT, min_limit=CONCURRENCY_MIN_LIMIT,
+                 max_limit=CONCURRENCY_MAX_LIMIT, tolerance=CONCURRENCY_TOLERANCE,
+                 slack_ms=CONCURRENCY_LATENCY_SLACK_MS):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.slack_ms = slack_ms
+        self.inflight = 0
+        self.rtt_ms = None
+        self.baseline_ms = None
+        self._window_start = time.monotonic()
+        self._window_min = None
+        self._previous_min = None
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._stats = {'accepted': 0, 'shed': 0, 'decreases': 0}
+
+    def try_acquire(self, priority=PRIORITY_NORMAL):
+        """Reservar un hueco; False si la clase de tráfico ya no tiene capacidad"""
+        share = PRIORITY_SHARES.get(priority, PRIORITY_SHARES[PRIORITY_NORMAL])
+        with self._lock:
+            if self.inflight >= max(self.limit * share, 1):
+                self._stats['shed'] += 1
+                return False
+            self.inflight += 1
+            self._stats['accepted'] += 1
+            return True
+
+    def release(self, latency_ms, ok=True):
+        """Liberar el hueco y ajustar el límite con la latencia y el resultado"""
+        now = time.monotonic()
+        with self._lock:
+            in_use = self.inflight
+            self.inflight -= 1
+
+            self.rtt_ms = latency_ms if self.rtt_ms is None else self.rtt_ms + (latency_ms - self.rtt_ms) * RTT_SMOOTHING
+            if now - self._window_start >= BASELINE_WINDOW_SECONDS:
+                self._previous_min, self._window_min = self._window_min, None
+                self._window_start = now
+            if self._window_min is None or latency_ms < self._window_min:
+                self._window_min = latency_ms
+            self.baseline_ms = min(m for m in (self._window_min, self._previous_min) if m is not None)
+
+            overloaded = not ok or self.rtt_ms > self.baseline_ms * self.tolerance + self.slack_ms
+            if overloaded:
+                # Una sola reducción por RTT: las respuestas de la misma ráfaga no cuentan doble
+                if (now - self._last_decrease) * 1000 >= self.rtt_ms:
+                    self.limit = max(self.min_limit, self.limit * CONCURRENCY_BACKOFF)
+                    self._last_decrease = now
+                    self._stats['decreases'] += 1
+            elif in_use >= self.limit / 2:
+                # Solo crecer si el límite se está usando de verdad
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def retry_after(self):
+        """Segundos sugeridos al cliente cuando se descarta su petición"""
+        return max(1, int(round((self.rtt_ms or 1000) / 1000)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limit': round(self.limit, 1),
+                'inflight': self.inflight,
+                'rtt_ms': round(self.rtt_ms, 1) if self.rtt_ms is not None else None,
+                'baseline_ms': round(self.baseline_ms, 1) if self.baseline_ms is not None else None,
+                **self._stats
+            }
+
+
+class ConcurrencyLimits:
+    """Registro de limitadores por nombre de upstream"""
+
+    def __init__(self, **limiter_options):
+        self._options = limiter_options
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        limiter = self._limiters.get(name)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.setdefault(name, AdaptiveLimiter(name, **self._options))
+        return limiter
+
+    def stats(self):
+        return {name: limiter.stats() for name, limiter in list(self._limiters.items())}
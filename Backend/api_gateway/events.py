@@ -0,0 +1,218 @@
+# api_gateway/events.py
+"""
+Server-Sent Events para el API Gateway
+Un único hilo por proceso consulta los cambios de tareas y las estadísticas de logs
+y reparte los eventos a los suscriptores mediante colas acotadas.
+
+Cada suscriptor es un usuario autenticado y solo recibe lo que puede ver: las tareas
+que creó (todas si es administrador) y las estadísticas sin top_users salvo que sea
+administrador.
+"""
+
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class Subscriber:
+    """Conexión SSE con su propia cola acotada (backpressure)"""
+
+    def __init__(self, max_queue, user_id=None, is_admin=False):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.user_id = user_id
+        self.is_admin = is_admin
+        self.closed = False
+        self.resyncs = 0
+
+    def offer(self, event):
+        """Encolar un evento sin bloquear al productor.
+
+        Si el cliente no consume a tiempo se vacía su cola y se le envía un único
+        evento 'resync': el cliente vuelve a sincronizar con /tasks/changes en
+        lugar de que el gateway acumule memoria por él.
+        """
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self._drain()
+            self.resyncs += 1
+            self.queue.put_nowait(('resync', {"reason": "slow_consumer"}))
+
+    def _drain(self):
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                return
+
+
+def format_sse(event_type, data):
+    """Serializar un evento en el formato de texto SSE"""
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+
+def tasks_view(subscriber, data):
+    """Cambios de tareas visibles para el suscriptor (None si no le afecta ninguno)"""
+    def visible(entries):
+        return [task_id for task_id, owner in entries if subscriber.is_admin or owner == subscriber.user_id]
+
+    changed = visible(data['changed'])
+    deleted = visible(data['deleted'])
+    if not changed and not deleted:
+        return None
+    return {"changed": changed, "deleted": deleted, "watermark": data['watermark']}
+
+
+def stats_view(subscriber, data):
+    """Estadísticas para el suscriptor: los nombres de usuario solo para administradores"""
+    if subscriber.is_admin:
+        return data
+    stats = {key: value for key, value in data['data'].items() if key != 'top_users'}
+    if not stats:
+        return None
+    return {"full": data['full'], "data": stats}
+
+
+class EventHub:
+    """Fan-out de eventos: un hilo productor por proceso, N suscriptores"""
+
+    def __init__(self, fetch_task_changes, compute_stats, max_subscribers=200,
+                 queue_size=100, heartbeat_interval=15, poll_interval=5, stats_interval=30):
+        self.fetch_task_changes = fetch_task_changes
+        self.compute_stats = compute_stats
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.stats_interval = stats_interval
+
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._watermark = None
+        self._last_stats = None
+
+    # ---------- Suscriptores ----------
+
+    def subscribe(self, user_id, is_admin=False):
+        """Registrar un suscriptor; devuelve None si se alcanzó el límite"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscriber = Subscriber(self.queue_size, user_id=user_id, is_admin=is_admin)
+            self._subscribers.add(subscriber)
+            if self._last_stats is not None:
+                snapshot = stats_view(subscriber, {"full": True, "data": self._last_stats})
+                if snapshot is not None:
+                    subscriber.offer(('stats', snapshot))
+            self._ensure_thread()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.closed = True
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event_type, data, view=None):
+        """Enviar un evento a los suscriptores activos; view(suscriptor, data) lo filtra"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            payload = view(subscriber, data) if view is not None else data
+            if payload is not None:
+                subscriber.offer((event_type, payload))
+
+    def notify_tasks_changed(self):
+        """Adelantar la siguiente consulta de cambios (p. ej. tras un POST/PUT/DELETE)"""
+        self._wakeup.set()
+
+    def stream(self, subscriber):
+        """Generador SSE para una conexión: eventos, heartbeats y limpieza al desconectar"""
+        try:
+            yield f"retry: {self.poll_interval * 1000}\n\n"
+            while not subscriber.closed:
+                try:
+                    event_type, data = subscriber.queue.get(timeout=self.heartbeat_interval)
+                except queue.Empty:
+                    yield f": heartbeat {int(time.time())}\n\n"
+                    continue
+                yield format_sse(event_type, data)
+        finally:
+            self.unsubscribe(subscriber)
+
+    # ---------- Productor ----------
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='sse-hub', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # Empezar unos segundos atrás para tolerar diferencias de reloj con el Task Service
+        start = datetime.utcnow() - timedelta(seconds=self.poll_interval)
+        self._watermark = f"{start.isoformat()}|{'0' * 24}"
+        next_stats = 0
+
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    # Sin suscriptores no se consulta nada; el próximo subscribe relanza el hilo
+                    self._thread = None
+                    return
+            self._poll_tasks()
+
+            if time.monotonic() >= next_stats:
+                self._poll_stats()
+                next_stats = time.monotonic() + self.stats_interval
+
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _poll_tasks(self):
+        try:
+            has_more = True
+            while has_more:
+                changes = self.fetch_task_changes(self._watermark)
+                if changes is None:
+                    return
+                has_more = changes.get('has_more', False)
+                self._watermark = changes.get('watermark', self._watermark)
+
+                # (id, creador): sin creador conocido solo lo reciben los administradores
+                changed = [(task['id'], task.get('created_by')) for task in changes.get('tasks', [])]
+                deleted_owners = changes.get('deleted_owners', {})
+                deleted = [(task_id, deleted_owners.get(task_id)) for task_id in changes.get('deleted', [])]
+                if changed or deleted:
+                    self.publish('tasks', {
+                        "changed": changed,
+                        "deleted": deleted,
+                        "watermark": self._watermark
+                    }, view=tasks_view)
+        except Exception as e:
+            print(f"⚠️ [SSE] Error consultando cambios de tareas: {e}")
+
+    def _poll_stats(self):
+        try:
+            stats = self.compute_stats()
+        except Exception as e:
+            print(f"⚠️ [SSE] Error calculando estadísticas: {e}")
+            return
+        if stats is None:
+            return
+
+        previous = self._last_stats
+        self._last_stats = stats
+        if previous is None:
+            self.publish('stats', {"full": True, "data": stats}, view=stats_view)
+            return
+
+        delta = {key: value for key, value in stats.items() if previous.get(key) != value}
+        if delta:
+            self.publish('stats', {"full": False, "data": delta}, view=stats_view)
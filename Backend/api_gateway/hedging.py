@@ -0,0 +1,228 @@
+# api_gateway/hedging.py - Peticiones de respaldo (hedging) para lecturas idempotentes
+"""
+Para los GET de un recurso concreto (HEDGE_ROUTES), si el primer intento no ha
+respondido cuando se alcanza el p95 observado de la ruta, se lanza un segundo intento
+a otra réplica (o por otra conexión si solo hay una) y se usa la primera respuesta que
+llegue. La otra se descarta al
+terminar (requests no permite abortarla, pero su resultado ya no bloquea a nadie).
+
+Así la cola de latencia de una instancia lenta de Render se sustituye por la de un
+segundo intento, a cambio de como mucho HEDGE_BUDGET_RATIO de carga extra:
+
+- Presupuesto global (token bucket): cada petición elegible deposita
+  HEDGE_BUDGET_RATIO fichas y cada hedge consume una. Con 0.05 nunca se envían más
+  hedges que un 5% de las peticiones, aunque el upstream entero esté lento.
+- Retardo por ruta: p95 de las latencias de la ventana actual y la anterior
+  (HEDGE_WINDOW_SECONDS), con un sketch por ruta. Hasta tener HEDGE_MIN_SAMPLES
+  muestras la ruta no se cubre.
+
+Los intentos se ejecutan en un pool de hilos por worker creado tras el fork; si el pool
+está lleno la petición sigue el camino normal, sin hedge.
+"""
+
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from api_gateway.sketches import LatencySketch
+
+HEDGING_ENABLED = os.getenv('HEDGING_ENABLED', 'true').lower() == 'true'
+HEDGE_BUDGET_RATIO = float(os.getenv('HEDGE_BUDGET_RATIO', 0.05))
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 0.95))
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', 50))
+HEDGE_MIN_DELAY_MS = float(os.getenv('HEDGE_MIN_DELAY_MS', 10))
+HEDGE_WINDOW_SECONDS = int(os.getenv('HEDGE_WINDOW_SECONDS', 60))
+HEDGE_MAX_WORKERS = int(os.getenv('HEDGE_MAX_WORKERS', 32))
+
+# Fichas acumulables: permite una ráfaga corta de hedges tras un periodo tranquilo
+HEDGE_BUDGET_BURST = 10
+# El p95 se recalcula como mucho una vez por segundo por ruta
+DELAY_REFRESH_SECONDS = 1.0
+
+# Rutas del upstream (GET) que se pueden repetir sin efectos secundarios
+HEDGE_ROUTES = {
+    'task/<id>': re.compile(r'task/[^/]+'),
+    'users/<id>': re.compile(r'users/[^/]+')
+}
+
+
+def _discard(future):
+    """Cerrar la respuesta de un intento que no se usa para liberar su conexión"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    close = getattr(future.result(), 'close', None)
+    if close is not None:
+        close()
+
+
+class RouteLatency:
+    """Latencias recientes de una ruta y contadores de hedging"""
+
+    def __init__(self):
+        self.current = LatencySketch()
+        self.previous = LatencySketch()
+        self.window_start = time.monotonic()
+        self.delay_ms = None
+        self.delay_checked = 0.0
+        self.stats = {'requests': 0, 'hedged': 0, 'hedge_wins': 0, 'budget_exhausted': 0}
+
+    def add(self, latency_ms, now):
+        if now - self.window_start >= HEDGE_WINDOW_SECONDS:
+            self.previous, self.current = self.current, LatencySketch()
+            self.window_start = now
+        self.current.add(latency_ms)
+
+    def hedge_delay_ms(self, now):
+        if now - self.delay_checked >= DELAY_REFRESH_SECONDS:
+            self.delay_checked = now
+            recent = LatencySketch().merge(self.previous).merge(self.current)
+            if recent.count < HEDGE_MIN_SAMPLES:
+                self.delay_ms = None
+            else:
+                self.delay_ms = max(HEDGE_MIN_DELAY_MS, recent.quantile(HEDGE_PERCENTILE))
+        return self.delay_ms
+
+
+class HedgingPolicy:
+    """Decide cuándo lanzar un segundo intento y lleva el presupuesto global"""
+
+    def __init__(self, routes=HEDGE_ROUTES, budget_ratio=HEDGE_BUDGET_RATIO,
+                 max_workers=HEDGE_MAX_WORKERS, enabled=HEDGING_ENABLED):
+        self.routes = routes
+        self.budget_ratio = budget_ratio
+        self.max_workers = max_workers
+        self.enabled = enabled
+        self._tokens = 0.0
+        self._inflight = 0
+        self._routes = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def route_for(self, method, path):
+        """Nombre de la ruta cubierta por hedging (None si la petición no es elegible)"""
+        if not self.enabled or method != 'GET':
+            return None
+        for name, pattern in self.routes.items():
+            if pattern.fullmatch(path):
+                return name
+        return None
+
+    def _route(self, name):
+        route = self._routes.get(name)
+        if route is None:
+            with self._lock:
+                route = self._routes.setdefault(name, RouteLatency())
+        return route
+
+    def _get_executor(self):
+        """Pool de hilos del worker (se crea tras el fork, en la primera petición)"""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='hedge')
+        return self._executor
+
+    def _reserve(self, slots):
+        """Reservar hilos del pool sin esperar; False si no caben"""
+        with self._lock:
+            if self._inflight + slots > self.max_workers:
+                return False
+            self._inflight += slots
+            return True
+
+    def _release(self, future):
+        with self._lock:
+            self._inflight -= 1
+
+    def _withdraw(self):
+        """Consumir una ficha del presupuesto global para un hedge"""
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def _timed(self, route, send):
+        start = time.perf_counter()
+        response = send()
+        if response.status_code < 500:
+            with self._lock:
+                route.add((time.perf_counter() - start) * 1000, time.monotonic())
+        return response
+
+    def call(self, name, send, timeout):
+        """Ejecutar send() con un posible hedge; devuelve la primera respuesta que llegue"""
+        route = self._route(name)
+        with self._lock:
+            route.stats['requests'] += 1
+            self._tokens = min(HEDGE_BUDGET_BURST, self._tokens + self.budget_ratio)
+            delay_ms = route.hedge_delay_ms(time.monotonic())
+
+        if delay_ms is None or delay_ms / 1000 >= timeout or not self._reserve(1):
+            return self._timed(route, send)
+
+        executor = self._get_executor()
+        primary = executor.submit(self._timed, route, send)
+        primary.add_done_callback(self._release)
+        done, _ = wait([primary], timeout=delay_ms / 1000)
+        if done:
+            return primary.result()
+
+        if not self._reserve(1):
+            return primary.result()
+        if not self._withdraw():
+            self._release(None)
+            with self._lock:
+                route.stats['budget_exhausted'] += 1
+            return primary.result()
+
+        with self._lock:
+            route.stats['hedged'] += 1
+        hedge = executor.submit(self._timed, route, send)
+        hedge.add_done_callback(self._release)
+
+        pending = {primary, hedge}
+        error = None
+        failed = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            done = list(done)
+            for index, future in enumerate(done):
+                # Intentos aún por revisar: los pendientes y los que terminaron a la vez
+                others = bool(pending) or index < len(done) - 1
+                try:
+                    response = future.result()
+                except Exception as e:
+                    # Si un intento falla, esperar al otro antes de dar la petición por perdida
+                    error = error or e
+                    continue
+                if response.status_code >= 500 and others:
+                    failed = response
+                    continue
+                if failed is not None:
+                    # El 5xx del otro intento ya no se devuelve: liberar su conexión
+                    failed.close()
+                if future is hedge:
+                    with self._lock:
+                        route.stats['hedge_wins'] += 1
+                (hedge if future is primary else primary).add_done_callback(_discard)
+                return response
+        if failed is not None:
+            return failed
+        raise error
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'budget_tokens': round(self._tokens, 2),
+                'routes': {
+                    name: {
+                        **route.stats,
+                        'hedge_delay_ms': round(route.delay_ms, 1) if route.delay_ms is not None else None
+                    }
+                    for name, route in self._routes.items()
+                }
+            }
@@ -0,0 +1,190 @@
+# api_gateway/ip_rules.py - Reglas de IPs permitidas/bloqueadas con soporte CIDR
+"""
+Listas de IPs permitidas y bloqueadas (IPv4 e IPv6, direcciones sueltas o bloques
+CIDR) compiladas en un trie binario de prefijos por familia.
+
+La búsqueda recorre como mucho un nodo por bit del prefijo (32 en IPv4, 128 en IPv6),
+así que su coste no depende del número de reglas. Gana la regla con el prefijo más
+largo (`deny 10.0.0.0/8` + `allow 10.1.2.3` permite solo esa IP del bloque); con el
+mismo prefijo gana `deny`.
+
+Reglas: ALLOWED_IPS / BLOCKED_IPS de rate_limiting.py más el fichero IP_RULES_FILE
+(una regla por línea, `allow <ip|cidr>` o `deny <ip|cidr>`, `#` para comentarios).
+Cada worker revisa la fecha de modificación del fichero como mucho cada
+IP_RULES_RELOAD_SECONDS y recompila las reglas sin reiniciar.
+
+Las reglas se evalúan sobre request.remote_addr, que en el gateway es la IP real del
+cliente gracias a ProxyFix (TRUSTED_PROXY_COUNT en app_mongo.py), no la del proxy de Render.
+"""
+
+import ipaddress
+import os
+import threading
+import time
+
+from flask import jsonify, request
+
+from api_gateway.rate_limiting import ALLOWED_IPS, BLOCKED_IPS, LOGGING_CONFIG
+
+IP_RULES_FILE = os.getenv('IP_RULES_FILE', 'ip_rules.txt')
+IP_RULES_RELOAD_SECONDS = float(os.getenv('IP_RULES_RELOAD_SECONDS', 5))
+
+ALLOW = 'allow'
+DENY = 'deny'
+
+# Nombres que aparecen en las listas y no son direcciones
+HOST_ALIASES = {'localhost': ('127.0.0.1', '::1')}
+
+
+class PrefixTrie:
+    """Trie binario de prefijos: nodo = [hijo0, hijo1, acción]"""
+
+    def __init__(self, bits):
+        self.bits = bits
+        self.root = [None, None, None]
+        self.size = 0
+
+    def insert(self, network, action):
+        value = int(network.network_address)
+        node = self.root
+        for shift in range(self.bits - 1, self.bits - 1 - network.prefixlen, -1):
+            bit = (value >> shift) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        # Con el mismo prefijo en las dos listas gana deny
+        if node[2] != DENY:
+            node[2] = action
+        self.size += 1
+
+    def lookup(self, value):
+        """Acción del prefijo más largo que contiene a value (None si ninguno)"""
+        node = self.root
+        match = node[2]
+        for shift in range(self.bits - 1, -1, -1):
+            node = node[(value >> shift) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                match = node[2]
+        return match
+
+
+def parse_rule_file(path):
+    """Reglas (acción, red) de un fichero; las líneas inválidas se ignoran con aviso"""
+    rules = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = line.split()
+            if len(parts) != 2 or parts[0].lower() not in (ALLOW, DENY):
+                print(f"⚠️ [IP_RULES] {path}:{number}: regla inválida '{line}'")
+                continue
+            rules.append((parts[0].lower(), parts[1]))
+    return rules
+
+
+class IPRules:
+    """Reglas de acceso por IP compiladas en tries, recargables en caliente"""
+
+    def __init__(self, allowed=ALLOWED_IPS, blocked=BLOCKED_IPS, path=IP_RULES_FILE,
+                 reload_interval=IP_RULES_RELOAD_SECONDS):
+        self.static_rules = [(ALLOW, entry) for entry in allowed] + [(DENY, entry) for entry in blocked]
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0
+        self._tries = self.compile(self.static_rules)
+        self.reload()
+
+    @staticmethod
+    def compile(rules):
+        """Construir los tries IPv4/IPv6 a partir de pares (acción, ip|cidr|alias)"""
+        tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+        for action, entry in rules:
+            for target in HOST_ALIASES.get(entry, (entry,)):
+                try:
+                    network = ipaddress.ip_network(target, strict=False)
+                except ValueError:
+                    print(f"⚠️ [IP_RULES] Dirección o CIDR inválido: {target}")
+                    continue
+                tries[network.version].insert(network, action)
+        return tries
+
+    def reload(self, force=False):
+        """Recompilar si el fichero de reglas cambió (o desapareció)"""
+        try:
+            mtime = os.stat(self.path).st_mtime if self.path else None
+        except FileNotFoundError:
+            mtime = None
+        if not force and mtime == self._mtime:
+            return False
+        with self._lock:
+            rules = list(self.static_rules)
+            if mtime is not None:
+                try:
+                    rules.extend(parse_rule_file(self.path))
+                except OSError as e:
+                    print(f"⚠️ [IP_RULES] No se pudo leer {self.path}: {e}")
+                    return False
+            tries = self.compile(rules)
+            # Cambio de referencia atómico: las peticiones en curso siguen con los tries anteriores
+            self._tries = tries
+            self._mtime = mtime
+        print(f"🛡️ [IP_RULES] Reglas cargadas: {tries[4].size} IPv4, {tries[6].size} IPv6")
+        return True
+
+    def _maybe_reload(self):
+        """Revisar el fichero cada reload_interval; recompilar en segundo plano si cambió"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.reload_interval
+        try:
+            mtime = os.stat(self.path).st_mtime if self.path else None
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._mtime and not self._lock.locked():
+            # Compilar miles de reglas no debe retrasar la petición que detecta el cambio
+            threading.Thread(target=self.reload, name='ip-rules-reload', daemon=True).start()
+
+    def match(self, ip):
+        """ALLOW, DENY o None para una IP en texto"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        return self._tries[address.version].lookup(int(address))
+
+    def is_allowed(self, ip):
+        return self.match(ip) == ALLOW
+
+    def is_blocked(self, ip):
+        return self.match(ip) == DENY
+
+    # ---------- Integración con Flask ----------
+
+    def init_app(self, app, limiter=None):
+        """Rechazar IPs bloqueadas y eximir del rate limiting a las permitidas"""
+
+        def enforce_ip_rules():
+            self._maybe_reload()
+            if self.is_blocked(request.remote_addr):
+                if LOGGING_CONFIG.get('log_blocked_ips'):
+                    print(f"🚫 [IP_RULES] Petición bloqueada de {request.remote_addr}: {request.method} {request.path}")
+                return jsonify({"error": "Acceso denegado"}), 403
+            return None
+
+        # Primero de todos los before_request: una IP bloqueada no consume cupo del limiter
+        # (que registra el suyo al crearse con app=) ni recibe un 429 en lugar del 403
+        app.before_request_funcs.setdefault(None, []).insert(0, enforce_ip_rules)
+
+        if limiter is not None:
+            @limiter.request_filter
+            def ip_allowlisted():
+                return self.is_allowed(request.remote_addr)
@@ -3,8 +3,16 @@
 """
 Log Monitor para API Gateway
 Script para monitorear logs en tiempo real
+
+El seguimiento usa inotify (Linux) sobre el directorio del log y, si no está
+disponible, sondea el fichero. Las últimas líneas se leen por bloques desde el
+final, y el inodo del fichero se vigila para continuar con el nuevo log cuando
+RotatingFileHandler rota el actual.
 """
 
+import ctypes
+import ctypes.util
+import select
 import time
 import os
 import json
@@ -12,61 +20,256 @@ from datetime import datetime
 import argparse
 
 LOG_FILE = 'logs/api_gateway.log'
+MONGO_LOG_FILE = 'logs/api_gateway_mongo.log'
 
-def tail_logs(follow=True, lines=10):
-    """Monitorear logs en tiempo real (similar a tail -f)"""
-    if not os.path.exists(LOG_FILE):
-        print(f"❌ Archivo de log no encontrado: {LOG_FILE}")
+# Tamaño de bloque para leer el log desde el final
+TAIL_BLOCK_SIZE = 8192
+
+# Intervalo de sondeo cuando no hay inotify (segundos)
+POLL_INTERVAL = 0.5
+
+# Aun con inotify, revisar rotaciones al menos cada segundo
+INOTIFY_TIMEOUT = 1.0
+
+# Eventos de inotify sobre el directorio: escritura, creación, renombrado y borrado
+IN_MODIFY = 0x00000002
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+WATCH_MASK = IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+def default_log_file():
+    """Log del gateway MongoDB si existe, si no el del gateway MySQL"""
+    return MONGO_LOG_FILE if os.path.exists(MONGO_LOG_FILE) else LOG_FILE
+
+def inotify_watch(directory):
+    """Descriptor de inotify que vigila `directory` (None si no está disponible)"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, os.fsencode(directory), WATCH_MASK) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        # Sin libc o sin inotify (macOS, Windows)
+        return None
+
+class LogFilter:
+    """Filtros por status, servicio, usuario y latencia mínima"""
+
+    def __init__(self, status=None, service=None, user=None, min_latency=None):
+        # status admite códigos y clases separados por comas: "500,4xx"
+        self.status = [value.strip().lower() for value in status.split(',')] if status else None
+        self.service = service
+        self.user = user
+        self.min_latency = min_latency
+
+    @property
+    def active(self):
+        return any(value is not None for value in (self.status, self.service, self.user, self.min_latency))
+
+    def _status_matches(self, status):
+        if not isinstance(status, int):
+            return False
+        code = str(status)
+        return any(
+            code[0] == pattern[0] if pattern.endswith('xx') else code == pattern
+            for pattern in self.status
+        )
+
+    def matches(self, line):
+        if not self.active:
+            return True
+        start = line.find('{')
+        if start == -1:
+            return False
+        try:
+            data = json.loads(line[start:])
+        except (json.JSONDecodeError, ValueError):
+            return False
+        
+        if self.status and not self._status_matches(data.get('status_code')):
+            return False
+        if self.service and self.service not in (data.get('service') or ''):
+            return False
+        if self.user and (data.get('user') or {}).get('username') != self.user:
+            return False
+        if self.min_latency is not None and (data.get('response_time_ms') or 0) < self.min_latency:
+            return False
+        return True
+
+class LogFollower:
+    """Lectura del final de un log y seguimiento de las líneas nuevas entre rotaciones"""
+
+    def __init__(self, path, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._file = None
+        self._inode = None
+        self._buffer = b''
+        self._inotify_fd = None
+
+    def _open(self):
+        self._file = open(self.path, 'rb')
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._buffer = b''
+
+    def _reverse_lines(self, end):
+        """Líneas desde `end` hacia atrás, leyendo bloques de TAIL_BLOCK_SIZE"""
+        position = end
+        remainder = b''
+        while position > 0:
+            size = min(TAIL_BLOCK_SIZE, position)
+            position -= size
+            self._file.seek(position)
+            lines = (self._file.read(size) + remainder).split(b'\n')
+            # La primera línea del bloque puede estar cortada: se completa con el siguiente
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line.decode('utf-8', errors='replace')
+        if remainder.strip():
+            yield remainder.decode('utf-8', errors='replace')
+
+    def tail(self, lines=10, predicate=None):
+        """Últimas `lines` líneas (que cumplan predicate) sin leer el fichero entero"""
+        self._open()
+        end = self._file.seek(0, os.SEEK_END)
+        selected = []
+        if lines > 0:
+            for line in self._reverse_lines(end):
+                if predicate is None or predicate(line):
+                    selected.append(line)
+                    if len(selected) >= lines:
+                        break
+        # El seguimiento continúa justo donde terminó la lectura inicial
+        self._file.seek(end)
+        return list(reversed(selected))
+
+    def _read_lines(self):
+        chunk = self._file.read()
+        if not chunk:
+            return []
+        lines = (self._buffer + chunk).split(b'\n')
+        # Guardar la última línea si aún no está completa
+        self._buffer = lines.pop()
+        return [line.decode('utf-8', errors='replace') for line in lines if line.strip()]
+
+    def _rotated(self):
+        """True si el path apunta a otro inodo (rotación); reinicia si el log se truncó"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            # Entre el renombrado y la creación del nuevo log
+            return False
+        if stat.st_ino != self._inode:
+            return True
+        if stat.st_size < self._file.tell():
+            self._file.seek(0)
+            self._buffer = b''
+        return False
+
+    def _wait(self):
+        if self._inotify_fd is None:
+            time.sleep(self.poll_interval)
+            return
+        readable, _, _ = select.select([self._inotify_fd], [], [], INOTIFY_TIMEOUT)
+        if readable:
+            # Solo interesa que hubo cambios: vaciar la cola de eventos
+            try:
+                while os.read(self._inotify_fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def start_watch(self):
+        """Activar inotify sobre el directorio del log; devuelve el modo de seguimiento"""
+        if self._inotify_fd is None:
+            self._inotify_fd = inotify_watch(os.path.dirname(os.path.abspath(self.path)))
+        return 'inotify' if self._inotify_fd is not None else f'sondeo cada {self.poll_interval}s'
+
+    def follow(self):
+        """Generador de líneas nuevas; sigue al nuevo fichero tras cada rotación"""
+        if self._file is None:
+            self._open()
+            self._file.seek(0, os.SEEK_END)
+        self.start_watch()
+        try:
+            while True:
+                yield from self._read_lines()
+                if self._rotated():
+                    # Terminar el fichero rotado y seguir el nuevo desde el principio
+                    yield from self._read_lines()
+                    if self._buffer.strip():
+                        yield self._buffer.decode('utf-8', errors='replace')
+                    self._file.close()
+                    self._open()
+                    print(f"🔁 Log rotado, siguiendo el nuevo archivo: {self.path}")
+                    continue
+                self._wait()
+        finally:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._inotify_fd is not None:
+                os.close(self._inotify_fd)
+                self._inotify_fd = None
+
+def run_monitor(display, follow=True, lines=10, log_filter=None, path=None, width=80, label='líneas'):
+    """Mostrar el final del log y, si follow, las líneas nuevas que cumplan el filtro"""
+    path = path or default_log_file()
+    log_filter = log_filter or LogFilter()
+    if not os.path.exists(path):
+        print(f"❌ Archivo de log no encontrado: {path}")
         return
     
+    follower = LogFollower(path)
+    
     # Leer las últimas líneas
-    with open(LOG_FILE, 'r', encoding='utf-8') as f:
-        all_lines = f.readlines()
-        last_lines = all_lines[-lines:] if len(all_lines) > lines else all_lines
+    last_lines = follower.tail(lines, log_filter.matches if log_filter.active else None)
     
     # Mostrar las últimas líneas
-    print(f"📝 Últimas {len(last_lines)} líneas del log:")
-    print("-" * 80)
+    print(f"📝 Últimas {len(last_lines)} {label} del log:")
+    print("-" * width)
     for line in last_lines:
-        print(line.strip())
+        display(line, live=False)
     
     if not follow:
         return
     
-    print(f"\n🔄 Monitoreando logs en tiempo real... (Ctrl+C para salir)")
-    print("-" * 80)
-    
-    # Monitorear en tiempo real
-    file_size = os.path.getsize(LOG_FILE)
+    mode = follower.start_watch()
+    print(f"\n🔄 Monitoreando logs en tiempo real ({mode})... (Ctrl+C para salir)")
+    print("-" * width)
     
     try:
-        while True:
-            current_size = os.path.getsize(LOG_FILE)
-            
-            if current_size > file_size:
-                # Nuevas líneas disponibles
-                with open(LOG_FILE, 'r', encoding='utf-8') as f:
-                    f.seek(file_size)
-                    new_lines = f.readlines()
-                    
-                    for line in new_lines:
-                        if line.strip():
-                            print(f"[{datetime.now().strftime('%H:%M:%S')}] {line.strip()}")
-                
-                file_size = current_size
-            
-            time.sleep(0.1)  # Verificar cada 100ms
-            
+        for line in follower.follow():
+            if log_filter.matches(line):
+                display(line, live=True)
     except KeyboardInterrupt:
         print("\n👋 Monitoreo detenido")
 
-def parse_and_display_log(line):
+def display_raw(line, live=False):
+    if live:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {line.strip()}")
+    else:
+        print(line.strip())
+
+def tail_logs(follow=True, lines=10, log_filter=None, path=None):
+    """Monitorear logs en tiempo real (similar a tail -f)"""
+    run_monitor(display_raw, follow, lines, log_filter, path)
+
+def parse_and_display_log(line, live=False):
     """Parsear y mostrar una línea de log de manera formateada"""
     try:
         # Buscar JSON en la línea
         start = line.find('{')
         if start == -1:
-            return line
+            print(line.strip())
+            return
         
         json_str = line[start:]
         data = json.loads(json_str)
@@ -78,18 +281,19 @@ def parse_and_display_log(line):
         service = data.get('service', 'N/A')
         status = data.get('status_code', 'N/A')
         response_time = data.get('response_time_ms', 'N/A')
-        user = data.get('user', {}).get('username', 'anonymous')
+        user = (data.get('user') or {}).get('username', 'anonymous')
         
         # Determinar tipo de log
+        status_icon = ""
         if 'REQUEST_START' in line:
             log_type = "📤 REQUEST"
-        elif 'RESPONSE_END' in line:
+        elif 'RESPONSE_END' in line or 'ACCESS' in line:
             log_type = "📥 RESPONSE"
             # Icono según status
-            status_icon = "✅" if status < 400 else "⚠️" if status < 500 else "❌"
+            if isinstance(status, int):
+                status_icon = "✅" if status < 400 else "⚠️" if status < 500 else "❌"
         else:
             log_type = "📋 LOG"
-            status_icon = ""
         
         # Formatear timestamp
         try:
@@ -99,65 +303,21 @@ def parse_and_display_log(line):
             time_str = timestamp
         
         # Mostrar información formateada
-        if 'RESPONSE_END' in line:
+        if 'RESPONSE_END' in line or 'ACCESS' in line:
             print(f"{time_str} {log_type} {status_icon} {method:6s} {path:30s} | "
-                  f"Service: {service:12s} | Status: {status:3s} | "
-                  f"Time: {response_time:6s}ms | User: {user}")
+                  f"Service: {service:12s} | Status: {str(status):3s} | "
+                  f"Time: {str(response_time):6s}ms | User: {user}")
         else:
             print(f"{time_str} {log_type} {method:6s} {path:30s} | "
                   f"Service: {service:12s} | User: {user}")
-        
+    
     except (json.JSONDecodeError, ValueError):
         # Si no es JSON, mostrar la línea original
         print(line.strip())
 
-def monitor_formatted(follow=True, lines=10):
+def monitor_formatted(follow=True, lines=10, log_filter=None, path=None):
     """Monitorear logs con formato mejorado"""
-    if not os.path.exists(LOG_FILE):
-        print(f"❌ Archivo de log no encontrado: {LOG_FILE}")
-        return
-    
-    # Leer las últimas líneas
-    with open(LOG_FILE, 'r', encoding='utf-8') as f:
-        all_lines = f.readlines()
-        last_lines = all_lines[-lines:] if len(all_lines) > lines else all_lines
-    
-    # Mostrar las últimas líneas formateadas
-    print(f"📝 Últimas {len(last_lines)} entradas del log:")
-    print("-" * 100)
-    for line in last_lines:
-        if line.strip():
-            parse_and_display_log(line)
-    
-    if not follow:
-        return
-    
-    print(f"\n🔄 Monitoreando logs en tiempo real... (Ctrl+C para salir)")
-    print("-" * 100)
-    
-    # Monitorear en tiempo real
-    file_size = os.path.getsize(LOG_FILE)
-    
-    try:
-        while True:
-            current_size = os.path.getsize(LOG_FILE)
-            
-            if current_size > file_size:
-                # Nuevas líneas disponibles
-                with open(LOG_FILE, 'r', encoding='utf-8') as f:
-                    f.seek(file_size)
-                    new_lines = f.readlines()
-                    
-                    for line in new_lines:
-                        if line.strip():
-                            parse_and_display_log(line)
-                
-                file_size = current_size
-            
-            time.sleep(0.1)  # Verificar cada 100ms
-            
-    except KeyboardInterrupt:
-        print("\n👋 Monitoreo detenido")
+    run_monitor(parse_and_display_log, follow, lines, log_filter, path, width=100, label='entradas')
 
 def main():
     parser = argparse.ArgumentParser(description='Log Monitor para API Gateway')
@@ -167,20 +327,36 @@ def main():
                        help='No seguir el archivo en tiempo real')
     parser.add_argument('--raw', action='store_true',
                        help='Mostrar logs en formato raw (sin formatear)')
+    parser.add_argument('--file', default=None,
+                       help=f'Archivo de log (default: {MONGO_LOG_FILE} si existe, si no {LOG_FILE})')
+    parser.add_argument('--status', default=None,
+                       help='Filtrar por status: códigos o clases separados por comas (ej: 500,4xx)')
+    parser.add_argument('--service', default=None,
+                       help='Filtrar por servicio (ej: task_service_mongo o task)')
+    parser.add_argument('--user', default=None,
+                       help='Filtrar por nombre de usuario')
+    parser.add_argument('--min-latency', type=float, default=None,
+                       help='Mostrar solo respuestas con tiempo >= N ms')
     
     args = parser.parse_args()
     
+    path = args.file or default_log_file()
+    log_filter = LogFilter(args.status, args.service, args.user, args.min_latency)
+    
     print("🔍 Iniciando monitor de logs...")
-    print(f"📁 Archivo: {LOG_FILE}")
+    print(f"📁 Archivo: {path}")
     print(f"📊 Líneas iniciales: {args.lines}")
     print(f"🔄 Seguimiento en tiempo real: {'No' if args.no_follow else 'Sí'}")
     print(f"📝 Formato: {'Raw' if args.raw else 'Formateado'}")
+    if log_filter.active:
+        filters = {'status': args.status, 'servicio': args.service, 'usuario': args.user, 'latencia >=': args.min_latency}
+        print("🔎 Filtros: " + ", ".join(f"{name} {value}" for name, value in filters.items() if value is not None))
     print("=" * 80)
     
     if args.raw:
-        tail_logs(follow=not args.no_follow, lines=args.lines)
+        tail_logs(follow=not args.no_follow, lines=args.lines, log_filter=log_filter, path=path)
     else:
-        monitor_formatted(follow=not args.no_follow, lines=args.lines)
+        monitor_formatted(follow=not args.no_follow, lines=args.lines, log_filter=log_filter, path=path)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -3,16 +3,38 @@
 """
 Log Viewer para API Gateway
 Script para visualizar y analizar logs del sistema de gestión de tareas
+
+Analiza todos los logs del gateway (actual y rotados, también comprimidos con gzip)
+en paralelo: cada fichero se divide en rangos de bytes que procesa un pool de
+procesos, y los resultados parciales (LogStats) se combinan al final.
 """
 
+import gzip
+import heapq
 import json
 import os
+import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from collections import defaultdict, Counter
 import argparse
 
-LOG_FILE = 'logs/api_gateway.log'
+from sketches import LatencySketch
+
+LOG_DIR = 'logs'
+
+# api_gateway.log, api_gateway_mongo.log y sus backups (.1, .2, ... y .gz)
+LOG_FILE_PATTERN = re.compile(r'^api_gateway(_mongo)?\.log(\.\d+)?(\.gz)?$')
+
+# Tamaño de cada rango de bytes que procesa un worker
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Por debajo de este tamaño la búsqueda por timestamp deja de dividir el rango
+SEEK_MIN_SPAN = 64 * 1024
+
+# Segmentos variables de una ruta (ids numéricos u ObjectId de MongoDB)
+ID_SEGMENT = re.compile(r'^(\d+|[0-9a-fA-F]{24})$')
 
 def parse_log_line(line):
     """Parsear una línea de log y extraer la información JSON"""
@@ -27,79 +49,225 @@ def parse_log_line(line):
     except (json.JSONDecodeError, ValueError):
         return None
 
-def load_logs():
-    """Cargar todos los logs del archivo"""
-    logs = []
-    
-    if not os.path.exists(LOG_FILE):
-        print(f"Archivo de log no encontrado: {LOG_FILE}")
-        return logs
-    
-    with open(LOG_FILE, 'r', encoding='utf-8') as f:
-        for line in f:
-            data = parse_log_line(line)
-            if data:
-                logs.append(data)
-    
-    return logs
+def normalize_route(method, path):
+    """Agrupar rutas con ids: GET /task/42 -> GET /task/:id"""
+    segments = [':id' if ID_SEGMENT.match(segment) else segment for segment in path.split('/')]
+    return f"{method} {'/'.join(segments)}"
 
-def filter_logs_by_time(logs, hours=24):
-    """Filtrar logs por tiempo (últimas N horas)"""
-    cutoff_time = datetime.now() - timedelta(hours=hours)
-    
-    filtered_logs = []
-    for log in logs:
-        try:
-            log_time = datetime.fromisoformat(log['timestamp'].replace('Z', '+00:00'))
-            if log_time >= cutoff_time:
-                filtered_logs.append(log)
-        except (ValueError, KeyError):
-            continue
-    
-    return filtered_logs
+def format_percentiles(sketch):
+    """p50/p90/p99/p999 de un sketch en una línea"""
+    return " | ".join(f"{name}: {value:.2f}ms" for name, value in sketch.percentiles().items())
 
-def analyze_logs(logs):
-    """Analizar logs y generar estadísticas"""
-    if not logs:
-        print("No hay logs para analizar")
-        return
-    
-    # Contadores
-    total_requests = len(logs)
-    requests_by_service = Counter()
-    requests_by_method = Counter()
-    requests_by_status = Counter()
-    response_times = []
-    users = Counter()
-    
-    # Procesar cada log
-    for log in logs:
+class LogStats:
+    """Resultado parcial mergeable del análisis de un rango de logs"""
+
+    def __init__(self, limit=10):
+        self.limit = limit
+        self.total_requests = 0
+        self.requests_by_service = Counter()
+        self.requests_by_method = Counter()
+        self.requests_by_status = Counter()
+        self.users = Counter()
+        # Sketches de latencia (memoria acotada, sin guardar cada tiempo de respuesta)
+        self.response_times = LatencySketch()
+        self.response_times_by_service = defaultdict(LatencySketch)
+        self.response_times_by_route = defaultdict(LatencySketch)
+        self.total_response_time = 0.0
+        # Los `limit` logs (y errores) más recientes: heaps de (timestamp, posición, log)
+        self.recent = []
+        self.errors = []
+
+    def _keep_recent(self, heap, key, log):
+        if len(heap) < self.limit:
+            heapq.heappush(heap, (key, log))
+        elif key > heap[0][0]:
+            heapq.heapreplace(heap, (key, log))
+
+    def add(self, log, position):
+        """Acumular un log; position identifica la línea para desempatar"""
+        # Un registro muestreado con sample_rate 0.1 representa 10 peticiones
+        sample_rate = log.get('sample_rate') or 1.0
+        weight = 1.0 / sample_rate
+        self.total_requests += weight
+        
         # Servicio
         service = log.get('service', 'unknown')
-        requests_by_service[service] += 1
+        self.requests_by_service[service] += weight
         
         # Método HTTP
         method = log.get('method', 'unknown')
-        requests_by_method[method] += 1
+        self.requests_by_method[method] += weight
         
         # Status code
         status = log.get('status_code', 0)
-        requests_by_status[status] += 1
+        self.requests_by_status[status] += weight
         
         # Response time
         response_time = log.get('response_time_ms', 0)
         if response_time > 0:
-            response_times.append(response_time)
+            self.response_times.add(response_time, weight)
+            self.total_response_time += response_time * weight
+            self.response_times_by_service[service].add(response_time, weight)
+            self.response_times_by_route[normalize_route(method, log.get('path', ''))].add(response_time, weight)
         
         # Usuario (si está disponible)
         user_info = log.get('user')
         if user_info and user_info.get('username'):
-            users[user_info['username']] += 1
+            self.users[user_info['username']] += weight
+        
+        key = (log.get('timestamp', ''), position)
+        self._keep_recent(self.recent, key, log)
+        if isinstance(status, int) and status >= 400:
+            self._keep_recent(self.errors, key, log)
+
+    def merge(self, other):
+        self.total_requests += other.total_requests
+        self.requests_by_service.update(other.requests_by_service)
+        self.requests_by_method.update(other.requests_by_method)
+        self.requests_by_status.update(other.requests_by_status)
+        self.users.update(other.users)
+        self.response_times.merge(other.response_times)
+        for service, sketch in other.response_times_by_service.items():
+            self.response_times_by_service[service].merge(sketch)
+        for route, sketch in other.response_times_by_route.items():
+            self.response_times_by_route[route].merge(sketch)
+        self.total_response_time += other.total_response_time
+        for key, log in other.recent:
+            self._keep_recent(self.recent, key, log)
+        for key, log in other.errors:
+            self._keep_recent(self.errors, key, log)
+        return self
+
+    def recent_logs(self):
+        """Logs más recientes, del más nuevo al más antiguo"""
+        return [log for _, log in sorted(self.recent, key=lambda x: x[0], reverse=True)]
+
+    def error_logs(self):
+        return [log for _, log in sorted(self.errors, key=lambda x: x[0], reverse=True)]
+
+def discover_log_files(log_dir=LOG_DIR):
+    """Logs actuales y rotados del gateway (MySQL y MongoDB), incluidos los .gz"""
+    if not os.path.isdir(log_dir):
+        return []
+    return sorted(
+        os.path.join(log_dir, name) for name in os.listdir(log_dir)
+        if LOG_FILE_PATTERN.match(name)
+    )
+
+def first_timestamp_after(f, offset, end):
+    """Timestamp del primer log completo que empieza después de offset (None si no hay)"""
+    f.seek(offset)
+    if offset > 0:
+        f.readline()  # Línea partida
+    while f.tell() < end:
+        line = f.readline()
+        if not line:
+            break
+        data = parse_log_line(line.decode('utf-8', errors='replace'))
+        if data and data.get('timestamp'):
+            return data['timestamp']
+    return None
+
+def seek_timestamp(path, cutoff, size):
+    """Offset desde el que hay logs >= cutoff (búsqueda binaria; los logs se escriben en orden)"""
+    lo, hi = 0, size
+    with open(path, 'rb') as f:
+        while hi - lo > SEEK_MIN_SPAN:
+            mid = (lo + hi) // 2
+            timestamp = first_timestamp_after(f, mid, hi)
+            if timestamp is None or timestamp >= cutoff:
+                hi = mid
+            else:
+                lo = mid
+    return lo
+
+def plan_tasks(files, cutoff=None, cutoff_epoch=None):
+    """Dividir los ficheros en tareas (ruta, inicio, fin) saltando lo anterior a cutoff"""
+    tasks = []
+    for path in files:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        # Un fichero no modificado desde antes del corte solo tiene logs anteriores
+        if cutoff_epoch is not None and stat.st_mtime < cutoff_epoch:
+            continue
+        if path.endswith('.gz'):
+            # gzip no permite saltar a un offset: el fichero entero en una tarea
+            tasks.append((path, 0, None))
+            continue
+        start = seek_timestamp(path, cutoff, stat.st_size) if cutoff else 0
+        for offset in range(start, stat.st_size, CHUNK_SIZE):
+            tasks.append((path, offset, min(offset + CHUNK_SIZE, stat.st_size)))
+    return tasks
+
+def process_range(task):
+    """Worker: analizar las líneas que empiezan en [inicio, fin) de un fichero"""
+    path, start, end, cutoff, limit = task
+    stats = LogStats(limit)
+    
+    if end is None:
+        with gzip.open(path, 'rb') as f:
+            for number, line in enumerate(f):
+                data = parse_log_line(line.decode('utf-8', errors='replace'))
+                if data and (not cutoff or data.get('timestamp', '') >= cutoff):
+                    stats.add(data, (path, number))
+        return stats
+    
+    with open(path, 'rb') as f:
+        # Cada línea pertenece al rango donde empieza
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()
+        position = f.tell()
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            data = parse_log_line(line.decode('utf-8', errors='replace'))
+            if data and (not cutoff or data.get('timestamp', '') >= cutoff):
+                stats.add(data, (path, position))
+            position += len(line)
+    return stats
+
+def collect_stats(hours=24, limit=10, workers=None, log_dir=LOG_DIR):
+    """Analizar en paralelo todos los logs de las últimas `hours` horas"""
+    files = discover_log_files(log_dir)
+    if not files:
+        print(f"No se encontraron archivos de log en: {log_dir}")
+        return None
+    
+    # Los timestamps de los logs son UTC (datetime.utcnow().isoformat())
+    cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+    cutoff = cutoff_time.isoformat()
+    cutoff_epoch = (cutoff_time - datetime(1970, 1, 1)).total_seconds()
+    
+    tasks = [(path, start, end, cutoff, limit) for path, start, end in plan_tasks(files, cutoff, cutoff_epoch)]
+    print(f" {len(files)} archivos de log, {len(tasks)} rangos a procesar")
+    
+    stats = LogStats(limit)
+    if len(tasks) <= 1 or workers == 1:
+        for task in tasks:
+            stats.merge(process_range(task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for partial in executor.map(process_range, tasks):
+                stats.merge(partial)
+    return stats
+
+def analyze_logs(stats):
+    """Mostrar las estadísticas acumuladas en un LogStats"""
+    if stats is None or not stats.total_requests:
+        print("No hay logs para analizar")
+        return
     
-    # Calcular estadísticas de response time
-    avg_response_time = sum(response_times) / len(response_times) if response_times else 0
-    max_response_time = max(response_times) if response_times else 0
-    min_response_time = min(response_times) if response_times else 0
+    total_requests = stats.total_requests
+    response_times = stats.response_times
+    
+    # Calcular estadísticas de response time (promedio sobre las respuestas, no las peticiones)
+    avg_response_time = stats.total_response_time / response_times.count if response_times.count else 0
+    max_response_time = response_times.max or 0
+    min_response_time = response_times.min or 0
     
     # Mostrar estadísticas
     print("\n" + "="*60)
@@ -107,34 +275,51 @@ def analyze_logs(logs):
     print("="*60)
     
     print(f"\n RESUMEN GENERAL:")
-    print(f"   Total de requests: {total_requests}")
+    print(f"   Total de requests: {total_requests:.0f}")
     print(f"   Tiempo promedio de respuesta: {avg_response_time:.2f}ms")
     print(f"   Tiempo máximo de respuesta: {max_response_time:.2f}ms")
     print(f"   Tiempo mínimo de respuesta: {min_response_time:.2f}ms")
+    if response_times.count:
+        print(f"   Percentiles: {format_percentiles(response_times)}")
+    
+    if stats.response_times_by_service:
+        print(f"\n PERCENTILES POR SERVICIO:")
+        for service, sketch in sorted(stats.response_times_by_service.items(), key=lambda x: x[1].count, reverse=True):
+            print(f"   {service}: {format_percentiles(sketch)}")
+    
+    if stats.response_times_by_route:
+        print(f"\n PERCENTILES POR RUTA (top 10):")
+        for route, sketch in sorted(stats.response_times_by_route.items(), key=lambda x: x[1].count, reverse=True)[:10]:
+            print(f"   {route} ({sketch.count:.0f}): {format_percentiles(sketch)}")
     
     print(f"\n REQUESTS POR SERVICIO:")
-    for service, count in requests_by_service.most_common():
+    for service, count in stats.requests_by_service.most_common():
         percentage = (count / total_requests) * 100
-        print(f"   {service}: {count} ({percentage:.1f}%)")
+        print(f"   {service}: {count:.0f} ({percentage:.1f}%)")
     
     print(f"\n REQUESTS POR MÉTODO HTTP:")
-    for method, count in requests_by_method.most_common():
+    for method, count in stats.requests_by_method.most_common():
         percentage = (count / total_requests) * 100
-        print(f"   {method}: {count} ({percentage:.1f}%)")
+        print(f"   {method}: {count:.0f} ({percentage:.1f}%)")
     
     print(f"\n CÓDIGOS DE ESTADO:")
-    for status, count in requests_by_status.most_common():
+    for status, count in stats.requests_by_status.most_common():
         percentage = (count / total_requests) * 100
         status_icon = "OK" if status < 400 else "Warning" if status < 500 else "Error"
-        print(f"   {status_icon} {status}: {count} ({percentage:.1f}%)")
+        print(f"   {status_icon} {status}: {count:.0f} ({percentage:.1f}%)")
     
-    if users:
+    if stats.users:
         print(f"\n USUARIOS MÁS ACTIVOS:")
-        for user, count in users.most_common(5):
-            print(f"   {user}: {count} requests")
+        for user, count in stats.users.most_common(5):
+            print(f"   {user}: {count:.0f} requests")
+
+def status_label(status):
+    if not isinstance(status, int):
+        return "Info"
+    return "OK" if status < 400 else "Warning" if status < 500 else "Error"
 
 def show_recent_logs(logs, limit=10):
-    """Mostrar los logs más recientes"""
+    """Mostrar los logs más recientes (ya ordenados del más nuevo al más antiguo)"""
     if not logs:
         print("No hay logs para mostrar")
         return
@@ -142,55 +327,47 @@ def show_recent_logs(logs, limit=10):
     print(f"\n ÚLTIMOS {limit} LOGS:")
     print("-" * 80)
     
-    # Ordenar por timestamp
-    sorted_logs = sorted(logs, key=lambda x: x.get('timestamp', ''), reverse=True)
-    
-    for i, log in enumerate(sorted_logs[:limit]):
+    for i, log in enumerate(logs[:limit]):
         timestamp = log.get('timestamp', 'N/A')
         method = log.get('method', 'N/A')
         path = log.get('path', 'N/A')
         service = log.get('service', 'N/A')
         status = log.get('status_code', 'N/A')
         response_time = log.get('response_time_ms', 'N/A')
-        user = log.get('user', {}).get('username', 'anonymous')
+        user = (log.get('user') or {}).get('username', 'anonymous')
         
         # Iconos según el status
-        status_icon = "OK" if status < 400 else "Warning" if status < 500 else "Error"
+        status_icon = status_label(status)
         
         print(f"{i+1:2d}. {status_icon} {method:6s} {path:30s} | "
-              f"Service: {service:12s} | Status: {status:3s} | "
-              f"Time: {response_time:6s}ms | User: {user}")
+              f"Service: {service:12s} | Status: {str(status):3s} | "
+              f"Time: {str(response_time):6s}ms | User: {user}")
 
 def show_error_logs(logs, limit=10):
-    """Mostrar solo los logs de error"""
-    error_logs = [log for log in logs if log.get('status_code', 200) >= 400]
-    
-    if not error_logs:
+    """Mostrar solo los logs de error (ya ordenados del más nuevo al más antiguo)"""
+    if not logs:
         print(" No hay errores en los logs")
         return
     
     print(f"\n ÚLTIMOS {limit} ERRORES:")
     print("-" * 80)
     
-    # Ordenar por timestamp
-    sorted_errors = sorted(error_logs, key=lambda x: x.get('timestamp', ''), reverse=True)
-    
-    for i, log in enumerate(sorted_errors[:limit]):
+    for i, log in enumerate(logs[:limit]):
         timestamp = log.get('timestamp', 'N/A')
         method = log.get('method', 'N/A')
         path = log.get('path', 'N/A')
         service = log.get('service', 'N/A')
         status = log.get('status_code', 'N/A')
         response_time = log.get('response_time_ms', 'N/A')
-        user = log.get('user', {}).get('username', 'anonymous')
+        user = (log.get('user') or {}).get('username', 'anonymous')
         
         print(f"{i+1:2d}. {method:6s} {path:30s} | "
-              f"Service: {service:12s} | Status: {status:3s} | "
-              f"Time: {response_time:6s}ms | User: {user}")
+              f"Service: {service:12s} | Status: {str(status):3s} | "
+              f"Time: {str(response_time):6s}ms | User: {user}")
 
 def main():
     parser = argparse.ArgumentParser(description='Log Viewer para API Gateway')
-    parser.add_argument('--hours', type=int, default=24, 
+    parser.add_argument('--hours', type=int, default=24,
                        help='Horas hacia atrás para filtrar logs (default: 24)')
     parser.add_argument('--recent', type=int, default=10,
                        help='Número de logs recientes a mostrar (default: 10)')
@@ -198,27 +375,29 @@ def main():
                        help='Mostrar solo logs de error')
     parser.add_argument('--stats', action='store_true',
                        help='Mostrar estadísticas de logs')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Procesos para el análisis (default: número de CPUs)')
+    parser.add_argument('--log-dir', default=LOG_DIR,
+                       help=f'Directorio de logs (default: {LOG_DIR})')
     
     args = parser.parse_args()
     
     print(" Cargando logs...")
-    logs = load_logs()
+    stats = collect_stats(args.hours, args.recent, args.workers, args.log_dir)
     
-    if not logs:
+    if stats is None or not stats.total_requests:
         print(" No se encontraron logs para analizar")
         return
     
-    # Filtrar por tiempo
-    filtered_logs = filter_logs_by_time(logs, args.hours)
-    print(f"Se encontraron {len(filtered_logs)} logs en las últimas {args.hours} horas")
+    print(f"Se encontraron {stats.total_requests:.0f} logs en las últimas {args.hours} horas (ponderados por muestreo)")
     
     if args.errors:
-        show_error_logs(filtered_logs, args.recent)
+        show_error_logs(stats.error_logs(), args.recent)
     elif args.stats:
-        analyze_logs(filtered_logs)
+        analyze_logs(stats)
     else:
-        show_recent_logs(filtered_logs, args.recent)
-        analyze_logs(filtered_logs)
+        show_recent_logs(stats.recent_logs(), args.recent)
+        analyze_logs(stats)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,263 @@
+# api_gateway/quotas.py - Cuotas por usuario y rol compartidas entre workers
+"""
+Cuotas de peticiones por usuario (user_id del JWT), con presupuesto según el rol
+(USER_QUOTAS en rate_limiting.py) y contadores de uso por usuario. Solo cuentan los
+tokens con firma verificada: con uno falso se podría gastar la cuota de otro usuario,
+así que esas peticiones quedan solo bajo el límite por IP.
+
+Los contadores viven en una tabla hash de slots fijos en un fichero mapeado en
+memoria (/dev/shm por defecto), compartida por todos los workers de gunicorn del
+host. Cada comprobación toma un lock (threading + fcntl), busca el slot del usuario
+con sondeo lineal y actualiza su ventana fija: unos microsegundos, sin ir a la base
+de datos. Si la tabla se llena, los slots sin uso desde QUOTA_IDLE_SECONDS se
+reutilizan; si aun así no hay sitio, la petición no se limita (fail-open).
+
+Layout de cada slot:
+    key_hash  uint64   hash del user_id (0 = slot libre)
+    user_id   32s
+    username  32s
+    role      16s
+    window    uint32   índice de la ventana fija actual (epoch // periodo)
+    count     uint32   peticiones en la ventana actual
+    last_seen uint32   epoch de la última petición
+    total     uint64   peticiones aceptadas desde que existe el slot
+    rejected  uint64   peticiones rechazadas por cuota
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: sin locks entre procesos, la tabla solo es fiable con un worker
+    fcntl = None
+
+from flask import g, jsonify, request
+
+from api_gateway.rate_limiting import USER_QUOTAS
+
+QUOTA_TABLE_PATH = os.getenv(
+    'QUOTA_TABLE_PATH',
+    os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'api_gateway_quotas')
+)
+QUOTA_TABLE_SLOTS = int(os.getenv('QUOTA_TABLE_SLOTS', 16384))
+QUOTA_IDLE_SECONDS = int(os.getenv('QUOTA_IDLE_SECONDS', 86400))
+
+# Rutas que no consumen cuota
+QUOTA_EXEMPT_PATHS = ('/', '/info', '/health')
+
+MAGIC = b'QUOTAv1\0'
+HEADER = struct.Struct('<8sI4x')
+SLOT = struct.Struct('<Q32s32s16sIII4xQQ')
+SLOT_KEY = struct.Struct('<Q32s')
+MAX_PROBES = 64
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+QuotaResult = namedtuple('QuotaResult', 'allowed limit remaining reset')
+
+
+def parse_limit(text):
+    """"120 per minute" -> (120, 60)"""
+    amount, _, period = text.split()
+    return int(amount), PERIODS[period.rstrip('s')]
+
+
+def _encode(value, size):
+    return str(value or '').encode('utf-8')[:size]
+
+
+def _decode(value):
+    return value.rstrip(b'\0').decode('utf-8', errors='replace')
+
+
+class UserQuotas:
+    """Tabla de cuotas por usuario en memoria compartida"""
+
+    def __init__(self, path=QUOTA_TABLE_PATH, slots=QUOTA_TABLE_SLOTS, quotas=USER_QUOTAS,
+                 idle_seconds=QUOTA_IDLE_SECONDS):
+        self.path = path
+        self.slots = slots
+        self.limits = {role: parse_limit(limit) for role, limit in quotas.items()}
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._size = HEADER.size + slots * SLOT.size
+        self._fd = None
+        self._map = None
+        self._open()
+
+    # ---------- Tabla compartida ----------
+
+    def _open(self):
+        """Abrir (o crear) el fichero de la tabla sin borrar los contadores de otros workers"""
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._file_lock()
+        try:
+            header = os.pread(self._fd, HEADER.size, 0)
+            valid = (
+                os.fstat(self._fd).st_size == self._size
+                and len(header) == HEADER.size
+                and HEADER.unpack(header) == (MAGIC, self.slots)
+            )
+            if not valid:
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self._size)
+                os.pwrite(self._fd, HEADER.pack(MAGIC, self.slots), 0)
+        finally:
+            self._file_unlock()
+        self._map = mmap.mmap(self._fd, self._size)
+
+    def _file_lock(self):
+        if fcntl is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, 0)
+
+    def _file_unlock(self):
+        if fcntl is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, 0)
+
+    def _find_slot(self, key_hash, user_key, now):
+        """Offset del slot del usuario (lo reclama si es nuevo); None si la tabla está llena"""
+        home = key_hash % self.slots
+        reusable = None
+        for probe in range(min(MAX_PROBES, self.slots)):
+            offset = HEADER.size + ((home + probe) % self.slots) * SLOT.size
+            stored_hash, stored_id = SLOT_KEY.unpack_from(self._map, offset)
+            if stored_hash == key_hash and stored_id.rstrip(b'\0') == user_key:
+                return offset
+            if stored_hash == 0:
+                # El usuario no está más adelante en la cadena: reclamar un slot
+                reusable = reusable if reusable is not None else offset
+                break
+            if reusable is None and now - SLOT.unpack_from(self._map, offset)[6] > self.idle_seconds:
+                # Slot abandonado: se puede reutilizar sin romper la cadena de sondeo
+                reusable = offset
+        if reusable is not None:
+            SLOT.pack_into(self._map, reusable, key_hash, user_key, b'', b'', 0, 0, int(now), 0, 0)
+        return reusable
+
+    # ---------- Cuotas ----------
+
+    def limit_for(self, role):
+        return self.limits.get(role) or self.limits['default']
+
+    def check(self, user_id, username=None, role=None, now=None):
+        """Consumir una petición de la cuota del usuario"""
+        now = now or time.time()
+        limit, period = self.limit_for(role)
+        window = int(now // period)
+        reset = int((window + 1) * period - now) or 1
+        user_key = _encode(user_id, 32)
+        key_hash = int.from_bytes(hashlib.blake2b(user_key, digest_size=8).digest(), 'little') or 1
+
+        with self._lock:
+            self._file_lock()
+            try:
+                offset = self._find_slot(key_hash, user_key, now)
+                if offset is None:
+                    return QuotaResult(True, limit, limit, reset)
+                _, _, _, _, stored_window, count, _, total, rejected = SLOT.unpack_from(self._map, offset)
+                if stored_window != window:
+                    count = 0
+                allowed = count < limit
+                if allowed:
+                    count += 1
+                    total += 1
+                else:
+                    rejected += 1
+                SLOT.pack_into(
+                    self._map, offset, key_hash, user_key, _encode(username, 32), _encode(role, 16),
+                    window, count, int(now), total, rejected
+                )
+            finally:
+                self._file_unlock()
+        return QuotaResult(allowed, limit, max(limit - count, 0), reset)
+
+    def usage(self, user_id=None, now=None):
+        """Uso por usuario: ventana actual, límite, aceptadas y rechazadas"""
+        now = now or time.time()
+        with self._lock:
+            self._file_lock()
+            try:
+                data = self._map[HEADER.size:self._size]
+            finally:
+                self._file_unlock()
+
+        report = []
+        for stored_hash, stored_id, username, role, window, count, last_seen, total, rejected in SLOT.iter_unpack(data):
+            if stored_hash == 0:
+                continue
+            stored_id = _decode(stored_id)
+            if user_id is not None and stored_id != str(user_id):
+                continue
+            role = _decode(role)
+            limit, period = self.limit_for(role)
+            report.append({
+                'user_id': stored_id,
+                'username': _decode(username),
+                'role': role or 'default',
+                'limit': f"{limit} per {period}s",
+                'current_window': count if window == int(now // period) else 0,
+                'total': total,
+                'rejected': rejected,
+                'last_seen': last_seen
+            })
+        report.sort(key=lambda item: item['total'], reverse=True)
+        return report
+
+    # ---------- Integración con Flask ----------
+
+    def init_app(self, app, get_user):
+        """Aplicar la cuota antes de cada petición; get_user devuelve el usuario del JWT"""
+
+        @app.before_request
+        def enforce_user_quota():
+            g.quota = None
+            if request.method == 'OPTIONS' or request.path in QUOTA_EXEMPT_PATHS or request.path.startswith('/health'):
+                return None
+            user = get_user()
+            # Sin firma verificada el user_id no es fiable: solo aplica el límite por IP
+            if not user or not user.get('user_id') or not user.get('verified'):
+                return None
+            g.quota = self.check(user['user_id'], user.get('username'), user.get('role'))
+            if not g.quota.allowed:
+                response = jsonify({
+                    "error": "Cuota de peticiones del usuario excedida",
+                    "retry_after": g.quota.reset
+                })
+                response.status_code = 429
+                response.headers['Retry-After'] = str(g.quota.reset)
+                return response
+            return None
+
+        @app.after_request
+        def add_quota_headers(response):
+            quota = getattr(g, 'quota', None)
+            if quota is not None:
+                response.headers['X-Quota-Limit'] = str(quota.limit)
+                response.headers['X-Quota-Remaining'] = str(quota.remaining)
+                response.headers['X-Quota-Reset'] = str(quota.reset)
+            return response
+
+        @app.route('/quotas/usage', methods=['GET'])
+        def quota_usage():
+            """Uso de cuota: todos los usuarios para admin, el propio para el resto"""
+            user = get_user()
+            if not user or not user.get('user_id') or not user.get('verified'):
+                return jsonify({"error": "Token válido requerido"}), 401
+            if user.get('role') == 'admin':
+                usage = self.usage()
+            else:
+                usage = self.usage(user['user_id'])
+            return jsonify({
+                "success": True,
+                "quotas": {role: f"{limit} per {period}s" for role, (limit, period) in self.limits.items()},
+                "usage": usage,
+                "timestamp": time.time()
+            })
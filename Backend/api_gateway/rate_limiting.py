@@ -37,6 +37,20 @@ RATE_LIMITS = {
     }
 }
 
+# Cuotas por usuario según el rol del JWT (se suman a los límites por IP)
+# 'default' se aplica a roles desconocidos y a tokens cuya firma no se pudo verificar
+USER_QUOTAS = {
+    'admin': "600 per minute",        # Administradores
+    'user': "120 per minute",         # Usuarios normales
+    'default': "60 per minute"        # Resto de roles
+}
+
+# Nombre del rol para los tokens que solo traen role_id (servicios MySQL)
+ROLE_NAMES = {
+    1: 'admin',
+    2: 'user'
+}
+
 # Configuración de almacenamiento
 STORAGE_CONFIG = {
     'type': 'memory',                 # Almacenamiento en memoria (para desarrollo)
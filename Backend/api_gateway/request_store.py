@@ -0,0 +1,328 @@
+# api_gateway/request_store.py - Almacén columnar de peticiones particionado por hora
+"""
+Registro compacto de cada petición del gateway para analítica.
+
+Estructura en disco:
+    logs/requests/<AAAAMMDDHH>/<pid>.<columna>   una partición por hora (UTC)
+    logs/requests/users.<pid>.tsv                diccionario código -> usuario
+
+Cada proceso escribe su propio segmento (un fichero por columna, anchura fija), así
+varios workers de gunicorn pueden escribir a la vez sin coordinarse y las columnas de
+un segmento nunca se desalinean. Columnas:
+
+    ts       float64  epoch en segundos
+    method   uint8    código de método HTTP (METHODS)
+    service  uint8    código de servicio (SERVICES)
+    status   uint16   código HTTP
+    latency  float32  milisegundos
+    user     uint32   crc32 del user_id (0 = anónimo)
+
+Las consultas mapean las columnas con mmap y trabajan sobre memoryview: el rango de
+tiempo se localiza con búsqueda binaria sobre `ts` (se escribe en orden) y los conteos y
+sumas se hacen en C (Counter, sum, max) sin parsear JSON. Es la fuente de
+`/logs/stats?source=raw`: ventanas exactas y percentiles exactos, a diferencia de los
+rollups, que redondean a su granularidad.
+
+El hilo de escritura borra cada REQUEST_STORE_PRUNE_SECONDS las particiones más antiguas
+que REQUEST_STORE_RETENTION_HOURS, así el disco ocupado queda acotado.
+"""
+
+import atexit
+import bisect
+import mmap
+import os
+import shutil
+import threading
+import time
+import zlib
+from array import array
+from collections import Counter
+
+from api_gateway.sketches import PERCENTILES
+
+METHODS = ('OTHER', 'GET', 'POST', 'PUT', 'DELETE', 'OPTIONS', 'PATCH', 'HEAD')
+SERVICES = ('api_gateway', 'auth_service_mongo', 'user_service_mongo', 'task_service_mongo')
+
+# columna -> typecode de array/memoryview
+COLUMNS = {
+    'ts': 'd',
+    'method': 'B',
+    'service': 'B',
+    'status': 'H',
+    'latency': 'f',
+    'user': 'I'
+}
+
+METHOD_CODES = {name: code for code, name in enumerate(METHODS)}
+SERVICE_CODES = {name: code for code, name in enumerate(SERVICES)}
+
+REQUEST_STORE_DIR = os.getenv('REQUEST_STORE_DIR', os.path.join('logs', 'requests'))
+REQUEST_STORE_FLUSH_RECORDS = int(os.getenv('REQUEST_STORE_FLUSH_RECORDS', 256))
+REQUEST_STORE_FLUSH_SECONDS = float(os.getenv('REQUEST_STORE_FLUSH_SECONDS', 1))
+REQUEST_STORE_RETENTION_HOURS = int(os.getenv('REQUEST_STORE_RETENTION_HOURS', 48))
+REQUEST_STORE_PRUNE_SECONDS = int(os.getenv('REQUEST_STORE_PRUNE_SECONDS', 3600))
+
+
+def partition_key(timestamp):
+    """Partición horaria (UTC) de un timestamp epoch"""
+    return time.strftime('%Y%m%d%H', time.gmtime(timestamp))
+
+
+def user_code(user_id):
+    """Código estable de 32 bits para un usuario (0 = anónimo)"""
+    if not user_id:
+        return 0
+    return zlib.crc32(str(user_id).encode('utf-8')) or 1
+
+
+class SegmentSlice:
+    """Columnas de un segmento restringidas a un rango de tiempo (memoryviews sin copia)"""
+
+    def __init__(self, columns, start, end):
+        self.columns = {name: view[start:end] for name, view in columns.items()}
+        self.count = end - start
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def release(self):
+        for view in self.columns.values():
+            view.release()
+
+
+class RequestLogStore:
+    """Almacén append-only de peticiones, particionado por hora"""
+
+    def __init__(self, directory=REQUEST_STORE_DIR, flush_records=REQUEST_STORE_FLUSH_RECORDS,
+                 flush_seconds=REQUEST_STORE_FLUSH_SECONDS, retention_hours=REQUEST_STORE_RETENTION_HOURS,
+                 prune_seconds=REQUEST_STORE_PRUNE_SECONDS):
+        self.directory = directory
+        self.flush_records = flush_records
+        self.flush_seconds = flush_seconds
+        self.retention_hours = retention_hours
+        self.prune_seconds = prune_seconds
+        self._lock = threading.Lock()
+        self._buffers = {}
+        self._pending = 0
+        self._users = {}
+        self._new_users = []
+        self._thread = None
+        os.makedirs(self.directory, exist_ok=True)
+        atexit.register(self.flush)
+
+    # ---------- Escritura ----------
+
+    def append(self, timestamp, method, service, status, latency_ms, user_id=None, username=None):
+        """Registrar una petición (se escribe a disco por lotes)"""
+        code = user_code(user_id or username)
+        with self._lock:
+            if code and code not in self._users:
+                self._users[code] = username or str(user_id)
+                self._new_users.append(code)
+            buffers = self._buffers.get(partition_key(timestamp))
+            if buffers is None:
+                buffers = {name: array(typecode) for name, typecode in COLUMNS.items()}
+                self._buffers[partition_key(timestamp)] = buffers
+            buffers['ts'].append(timestamp)
+            buffers['method'].append(METHOD_CODES.get(method, 0))
+            buffers['service'].append(SERVICE_CODES.get(service, 0))
+            buffers['status'].append(min(int(status), 65535))
+            buffers['latency'].append(latency_ms)
+            buffers['user'].append(code)
+            self._pending += 1
+            flush_now = self._pending >= self.flush_records
+        if flush_now:
+            self.flush()
+        else:
+            self._start_flusher()
+
+    def flush(self):
+        """Escribir los registros pendientes del proceso"""
+        with self._lock:
+            buffers, self._buffers = self._buffers, {}
+            new_users, self._new_users = self._new_users, []
+            self._pending = 0
+            users = [(code, self._users[code]) for code in new_users]
+            # Escribir dentro del lock mantiene el orden de `ts` dentro del segmento
+            pid = os.getpid()
+            for key, columns in sorted(buffers.items()):
+                partition_dir = os.path.join(self.directory, key)
+                os.makedirs(partition_dir, exist_ok=True)
+                for name, values in columns.items():
+                    with open(os.path.join(partition_dir, f"{pid}.{name}"), 'ab') as f:
+                        values.tofile(f)
+            if users:
+                with open(os.path.join(self.directory, f"users.{pid}.tsv"), 'a', encoding='utf-8') as f:
+                    f.writelines(f"{code}\t{name}\n" for code, name in users)
+
+    def _start_flusher(self):
+        """Hilo que vacía el buffer periódicamente aunque no lleguen más peticiones"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._flush_loop, name='request-store-flush', daemon=True)
+            self._thread.start()
+
+    def _flush_loop(self):
+        # La primera poda al arrancar limpia lo que dejaron procesos anteriores
+        next_prune = time.time()
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ [REQUEST_STORE] Error escribiendo registros: {e}")
+            if self.retention_hours > 0 and time.time() >= next_prune:
+                next_prune = time.time() + self.prune_seconds
+                try:
+                    self.prune(self.retention_hours)
+                except Exception as e:
+                    print(f"⚠️ [REQUEST_STORE] Error borrando particiones antiguas: {e}")
+
+    # ---------- Lectura ----------
+
+    def partitions(self, start=None, end=None):
+        """Particiones existentes que solapan [start, end) (epoch en segundos)"""
+        if not os.path.isdir(self.directory):
+            return []
+        first = partition_key(start) if start is not None else None
+        last = partition_key(end) if end is not None else None
+        keys = []
+        for name in sorted(os.listdir(self.directory)):
+            if not (len(name) == 10 and name.isdigit()):
+                continue
+            if first and name < first or last and name > last:
+                continue
+            keys.append(name)
+        return keys
+
+    def _open_segment(self, partition_dir, segment):
+        """Mapear las columnas de un segmento; None si está vacío"""
+        views = {}
+        maps = []
+        for name, typecode in COLUMNS.items():
+            path = os.path.join(partition_dir, f"{segment}.{name}")
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                return None, maps
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            maps.append(mapped)
+            itemsize = array(typecode).itemsize
+            usable = len(mapped) - len(mapped) % itemsize
+            views[name] = memoryview(mapped)[:usable].cast(typecode)
+        # Tras un corte a mitad de escritura, solo las filas presentes en todas las columnas
+        rows = min(len(view) for view in views.values())
+        return {name: view[:rows] for name, view in views.items()}, maps
+
+    def scan(self, start=None, end=None):
+        """Iterar SegmentSlice con las filas en [start, end) de cada segmento"""
+        self.flush()
+        for key in self.partitions(start, end):
+            partition_dir = os.path.join(self.directory, key)
+            segments = sorted({name.split('.', 1)[0] for name in os.listdir(partition_dir)})
+            for segment in segments:
+                columns, maps = self._open_segment(partition_dir, segment)
+                segment_slice = None
+                try:
+                    if columns is None:
+                        continue
+                    timestamps = columns['ts']
+                    lo = bisect.bisect_left(timestamps, start) if start is not None else 0
+                    hi = bisect.bisect_left(timestamps, end) if end is not None else len(timestamps)
+                    if hi > lo:
+                        segment_slice = SegmentSlice(columns, lo, hi)
+                        yield segment_slice
+                finally:
+                    # Liberar las vistas antes de cerrar los mmap
+                    if segment_slice is not None:
+                        segment_slice.release()
+                    if columns is not None:
+                        for view in columns.values():
+                            view.release()
+                    for mapped in maps:
+                        try:
+                            mapped.close()
+                        except BufferError:
+                            pass
+
+    def usernames(self):
+        """Diccionario código -> usuario de todos los procesos"""
+        users = dict(self._users)
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.startswith('users.') and name.endswith('.tsv'):
+                    with open(os.path.join(self.directory, name), 'r', encoding='utf-8') as f:
+                        for line in f:
+                            code, _, username = line.rstrip('\n').partition('\t')
+                            if code.isdigit():
+                                users.setdefault(int(code), username)
+        return users
+
+    def summarize(self, start=None, end=None):
+        """Conteos y latencias de [start, end); None si no hay particiones"""
+        if not self.partitions(start, end):
+            return None
+        total = 0
+        latency_sum = 0.0
+        latency_max = 0.0
+        latency_min = None
+        methods = Counter()
+        services = Counter()
+        statuses = Counter()
+        users = Counter()
+        hours = Counter()
+        buckets = {'fast': 0, 'medium': 0, 'slow': 0}  # <100ms, 100-500ms, >500ms
+        all_latencies = array('f')
+        for segment in self.scan(start, end):
+            total += segment.count
+            latencies = segment['latency']
+            all_latencies.frombytes(latencies.tobytes())
+            latency_sum += sum(latencies)
+            # Comparaciones con un método de float: map/sum recorren la columna en C
+            under_100 = sum(map((100.0).__gt__, latencies))
+            under_500 = sum(map((500.0).__gt__, latencies))
+            buckets['fast'] += under_100
+            buckets['medium'] += under_500 - under_100
+            buckets['slow'] += segment.count - under_500
+            latency_max = max(latency_max, max(latencies))
+            segment_min = min(latencies)
+            latency_min = segment_min if latency_min is None else min(latency_min, segment_min)
+            methods.update(segment['method'])
+            services.update(segment['service'])
+            statuses.update(segment['status'])
+            users.update(segment['user'])
+            timestamps = segment['ts']
+            # Distribución por hora: cada partición es una hora, basta con el primer registro
+            hours[time.gmtime(timestamps[0]).tm_hour] += segment.count
+
+        usernames = self.usernames()
+        users.pop(0, None)
+        # Percentiles exactos (rango más cercano) sobre las latencias de la ventana
+        ordered = sorted(all_latencies)
+        percentiles = {
+            name: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2) if ordered else None
+            for name, q in PERCENTILES
+        }
+        return {
+            'total': total,
+            'methods': {METHODS[code]: count for code, count in methods.items()},
+            'services': {SERVICES[code] if code < len(SERVICES) else 'unknown': count
+                         for code, count in services.items()},
+            'statuses': dict(statuses),
+            'users': {usernames.get(code, str(code)): count for code, count in users.items()},
+            'hours': dict(hours),
+            'latency_buckets': buckets,
+            'latency_sum': latency_sum,
+            'latency_min': latency_min or 0.0,
+            'latency_max': latency_max,
+            'percentiles': percentiles
+        }
+
+    def prune(self, max_age_hours):
+        """Borrar particiones más antiguas que max_age_hours (seguro con varios procesos)"""
+        cutoff = partition_key(time.time() - max_age_hours * 3600)
+        for key in self.partitions():
+            if key < cutoff:
+                shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
@@ -0,0 +1,400 @@
+# api_gateway/rollups.py - Agregados precalculados por minuto, hora y día
+"""
+Rollups de las peticiones del gateway para responder consultas por ventana de tiempo
+combinando unos pocos buckets en lugar de releer los registros.
+
+Cada bucket guarda conteos, clases de status, métodos, servicios, usuarios, hora del
+día, suma de latencias y sketches de latencia mergeables (global, por servicio y por
+ruta; las rutas se limitan a ROLLUP_MAX_ROUTES por bucket). Los usuarios se recortan a
+los ROLLUP_MAX_USERS con más peticiones al combinar y al persistir, así que sus conteos
+son un top aproximado.
+
+Estructura en disco (logs/rollups):
+    minute/<AAAAMMDDHH>.<escritor>.json   buckets de minuto de un proceso, una hora por fichero
+    hour/<AAAAMMDD>.json                  buckets de hora de un día (compactados)
+    day/<AAAAMM>.json                     buckets de día de un mes (compactados)
+
+Cada proceso acumula sus buckets de minuto en memoria y reescribe su fichero de la hora
+en curso periódicamente. La compactación (un solo proceso a la vez, con fichero de
+bloqueo) combina los minutos antiguos de todos los procesos en buckets de hora, y las
+horas antiguas en buckets de día. Cada petición está en un único nivel en todo momento,
+así que una consulta suma los buckets de todos los niveles que caen en la ventana.
+Los ficheros de día de meses anteriores a ROLLUP_DAY_RETENTION_DAYS se borran al compactar.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+
+from api_gateway.sketches import LatencySketch
+
+GRANULARITIES = {'minute': 60, 'hour': 3600, 'day': 86400}
+
+ROLLUP_DIR = os.getenv('ROLLUP_DIR', os.path.join('logs', 'rollups'))
+ROLLUP_FLUSH_SECONDS = float(os.getenv('ROLLUP_FLUSH_SECONDS', 10))
+ROLLUP_COMPACT_SECONDS = float(os.getenv('ROLLUP_COMPACT_SECONDS', 300))
+ROLLUP_MINUTE_RETENTION_HOURS = int(os.getenv('ROLLUP_MINUTE_RETENTION_HOURS', 24))
+ROLLUP_HOUR_RETENTION_DAYS = int(os.getenv('ROLLUP_HOUR_RETENTION_DAYS', 14))
+ROLLUP_DAY_RETENTION_DAYS = int(os.getenv('ROLLUP_DAY_RETENTION_DAYS', 365))
+ROLLUP_MAX_ROUTES = int(os.getenv('ROLLUP_MAX_ROUTES', 100))
+ROLLUP_MAX_USERS = int(os.getenv('ROLLUP_MAX_USERS', 100))
+
+# Ruta donde se acumulan las que superan ROLLUP_MAX_ROUTES
+OTHER_ROUTE = 'other'
+
+COMPACT_LOCK_STALE_SECONDS = 600
+
+
+def align(timestamp, granularity):
+    """Inicio (epoch, UTC) del bucket de `granularity` que contiene a timestamp"""
+    size = GRANULARITIES[granularity]
+    return int(timestamp // size * size)
+
+
+def status_class(status_code):
+    return f"{status_code // 100}xx" if 100 <= status_code < 600 else 'other'
+
+
+class Bucket:
+    """Agregado mergeable de un intervalo de tiempo"""
+
+    def __init__(self):
+        self.count = 0
+        self.statuses = Counter()
+        self.methods = Counter()
+        self.services = Counter()
+        self.users = Counter()
+        self.hours = Counter()
+        self.latency_sum = 0.0
+        self.latency = LatencySketch()
+        self.service_latency = {}
+        self.route_latency = {}
+
+    @staticmethod
+    def _sketch_for(sketches, key, limit=None):
+        sketch = sketches.get(key)
+        if sketch is None:
+            if limit is not None and len(sketches) >= limit and key != OTHER_ROUTE:
+                return Bucket._sketch_for(sketches, OTHER_ROUTE)
+            sketch = sketches[key] = LatencySketch()
+        return sketch
+
+    def _trim_users(self):
+        """Conservar solo los ROLLUP_MAX_USERS usuarios con más peticiones"""
+        if len(self.users) > ROLLUP_MAX_USERS:
+            self.users = Counter(dict(self.users.most_common(ROLLUP_MAX_USERS)))
+
+    @staticmethod
+    def _merge_sketches(target, source, limit=None):
+        for key, sketch in source.items():
+            Bucket._sketch_for(target, key, limit).merge(sketch)
+
+    def add(self, timestamp, method, service, status_code, latency_ms, username=None, route=None):
+        self.count += 1
+        self.statuses[status_class(status_code)] += 1
+        self.methods[method] += 1
+        self.services[service] += 1
+        if username:
+            self.users[username] += 1
+        self.hours[time.gmtime(timestamp).tm_hour] += 1
+        self.latency_sum += latency_ms
+        self.latency.add(latency_ms)
+        self._sketch_for(self.service_latency, service).add(latency_ms)
+        if route:
+            self._sketch_for(self.route_latency, route, ROLLUP_MAX_ROUTES).add(latency_ms)
+
+    def merge(self, other):
+        self.count += other.count
+        self.statuses.update(other.statuses)
+        self.methods.update(other.methods)
+        self.services.update(other.services)
+        self.users.update(other.users)
+        self._trim_users()
+        self.hours.update(other.hours)
+        self.latency_sum += other.latency_sum
+        self.latency.merge(other.latency)
+        self._merge_sketches(self.service_latency, other.service_latency)
+        self._merge_sketches(self.route_latency, other.route_latency, ROLLUP_MAX_ROUTES)
+        return self
+
+    def to_dict(self):
+        self._trim_users()
+        return {
+            "count": self.count,
+            "statuses": dict(self.statuses),
+            "methods": dict(self.methods),
+            "services": dict(self.services),
+            "users": dict(self.users),
+            "hours": {str(hour): count for hour, count in self.hours.items()},
+            "latency_sum": self.latency_sum,
+            "latency": self.latency.to_dict(),
+            "service_latency": {service: sketch.to_dict() for service, sketch in self.service_latency.items()},
+            "route_latency": {route: sketch.to_dict() for route, sketch in self.route_latency.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        bucket = cls()
+        bucket.count = data.get("count", 0)
+        bucket.statuses = Counter(data.get("statuses", {}))
+        bucket.methods = Counter(data.get("methods", {}))
+        bucket.services = Counter(data.get("services", {}))
+        bucket.users = Counter(data.get("users", {}))
+        bucket.hours = Counter({int(hour): count for hour, count in data.get("hours", {}).items()})
+        bucket.latency_sum = data.get("latency_sum", 0.0)
+        bucket.latency = LatencySketch.from_dict(data.get("latency", {}))
+        bucket.service_latency = {service: LatencySketch.from_dict(sketch)
+                                  for service, sketch in data.get("service_latency", {}).items()}
+        bucket.route_latency = {route: LatencySketch.from_dict(sketch)
+                                for route, sketch in data.get("route_latency", {}).items()}
+        return bucket
+
+
+def read_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data):
+    """Escritura atómica: fichero temporal y renombrado"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+class RollupEngine:
+    """Buckets de minuto en memoria, persistidos y compactados a hora y día"""
+
+    def __init__(self, directory=ROLLUP_DIR, flush_interval=ROLLUP_FLUSH_SECONDS,
+                 compact_interval=ROLLUP_COMPACT_SECONDS):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self._lock = threading.Lock()
+        self._minutes = {}
+        self._dirty_hours = set()
+        self._evicted_hours = set()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        self._writer_id = None
+        self._thread = None
+        self._last_compaction = 0
+        for granularity in GRANULARITIES:
+            os.makedirs(os.path.join(self.directory, granularity), exist_ok=True)
+
+    @property
+    def writer_id(self):
+        """Identificador único del proceso escritor (se regenera tras el fork de gunicorn)"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._writer_id = f"{self._pid}-{uuid.uuid4().hex[:6]}"
+            self._minutes = {}
+            self._dirty_hours = set()
+            self._evicted_hours = set()
+            self._thread = None
+        return self._writer_id
+
+    # ---------- Registro ----------
+
+    def record(self, timestamp, method, service, status_code, latency_ms, username=None, route=None):
+        """Acumular una petición en su bucket de minuto"""
+        self.writer_id
+        minute = align(timestamp, 'minute')
+        with self._lock:
+            bucket = self._minutes.get(minute)
+            if bucket is None:
+                bucket = self._minutes[minute] = Bucket()
+            bucket.add(timestamp, method, service, status_code, latency_ms, username, route)
+            self._dirty_hours.add(align(timestamp, 'hour'))
+        self._start()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='rollups', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+                if time.time() - self._last_compaction >= self.compact_interval:
+                    self._last_compaction = time.time()
+                    self.compact()
+            except Exception as e:
+                print(f"⚠️ [ROLLUPS] Error persistiendo agregados: {e}")
+
+    # ---------- Persistencia ----------
+
+    def _minute_path(self, hour_start, writer_id):
+        key = time.strftime('%Y%m%d%H', time.gmtime(hour_start))
+        return os.path.join(self.directory, 'minute', f"{key}.{writer_id}.json")
+
+    def flush(self):
+        """Reescribir los ficheros de las horas con cambios y soltar de memoria las ya cerradas"""
+        writer_id = self.writer_id
+        current_hour = align(time.time(), 'hour')
+        with self._flush_lock:
+            with self._lock:
+                dirty, self._dirty_hours = self._dirty_hours, set()
+                # Horas soltadas de memoria en flushes anteriores: su fichero ya tiene datos
+                evicted = set(self._evicted_hours)
+                snapshots = {}
+                for hour_start in dirty:
+                    snapshots[hour_start] = {
+                        str(minute): bucket.to_dict()
+                        for minute, bucket in self._minutes.items()
+                        if hour_start <= minute < hour_start + 3600
+                    }
+                # Las horas anteriores a la actual ya no recibirán más peticiones
+                for minute in [minute for minute in self._minutes if minute < current_hour - 3600]:
+                    self._evicted_hours.add(align(minute, 'hour'))
+                    del self._minutes[minute]
+
+            for hour_start, buckets in snapshots.items():
+                path = self._minute_path(hour_start, writer_id)
+                if hour_start in evicted:
+                    # Petición tardía en una hora ya soltada de memoria: sumar a lo persistido
+                    for minute, bucket_data in read_json(path, {}).items():
+                        if minute in buckets:
+                            bucket_data = Bucket.from_dict(bucket_data).merge(Bucket.from_dict(buckets[minute])).to_dict()
+                        buckets[minute] = bucket_data
+                write_json(path, buckets)
+
+    def _acquire_compaction_lock(self):
+        lock_path = os.path.join(self.directory, '.compact.lock')
+        try:
+            if time.time() - os.path.getmtime(lock_path) > COMPACT_LOCK_STALE_SECONDS:
+                os.remove(lock_path)
+        except OSError:
+            pass
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.close(fd)
+            return lock_path
+        except FileExistsError:
+            return None
+
+    def compact(self, now=None):
+        """Minutos antiguos -> buckets de hora; horas antiguas -> buckets de día"""
+        lock_path = self._acquire_compaction_lock()
+        if lock_path is None:
+            return
+        try:
+            now = now or time.time()
+            self._compact_level(
+                'minute', 'hour', '%Y%m%d',
+                cutoff=align(now - ROLLUP_MINUTE_RETENTION_HOURS * 3600, 'hour')
+            )
+            self._compact_level(
+                'hour', 'day', '%Y%m',
+                cutoff=align(now - ROLLUP_HOUR_RETENTION_DAYS * 86400, 'day')
+            )
+            if ROLLUP_DAY_RETENTION_DAYS > 0:
+                self._prune_days(now - ROLLUP_DAY_RETENTION_DAYS * 86400)
+        finally:
+            os.remove(lock_path)
+
+    def _compact_level(self, source, target, target_file_format, cutoff):
+        """Combinar los buckets de `source` anteriores a cutoff en buckets de `target`"""
+        source_dir = os.path.join(self.directory, source)
+        groups = {}
+        for name in os.listdir(source_dir):
+            if name.endswith('.json'):
+                groups.setdefault(name.split('.', 1)[0], []).append(os.path.join(source_dir, name))
+
+        for source_key, paths in groups.items():
+            source_buckets = []
+            for path in paths:
+                for start, bucket_data in self._bucket_map(read_json(path, {}), source).items():
+                    source_buckets.append((int(start), Bucket.from_dict(bucket_data)))
+            # Solo se compactan periodos completos que ya superaron la retención
+            if source_buckets and max(start for start, _ in source_buckets) >= cutoff:
+                continue
+
+            merged_targets = {}
+            for start, bucket in source_buckets:
+                target_start = align(start, target)
+                file_key = time.strftime(target_file_format, time.gmtime(target_start))
+                merged_targets.setdefault(file_key, {}).setdefault(target_start, Bucket()).merge(bucket)
+
+            for file_key, targets in merged_targets.items():
+                target_path = os.path.join(self.directory, target, f"{file_key}.json")
+                existing = read_json(target_path, {"buckets": {}, "merged": []})
+                if source_key in existing['merged']:
+                    continue
+                for target_start, bucket in targets.items():
+                    previous = existing['buckets'].get(str(target_start))
+                    if previous:
+                        bucket.merge(Bucket.from_dict(previous))
+                    existing['buckets'][str(target_start)] = bucket.to_dict()
+                # Registrar el origen evita contarlo dos veces si falla el borrado posterior
+                existing['merged'].append(source_key)
+                write_json(target_path, existing)
+
+            for path in paths:
+                os.remove(path)
+
+    def _prune_days(self, cutoff):
+        """Borrar los ficheros de día (uno por mes) de meses completos anteriores a cutoff"""
+        day_dir = os.path.join(self.directory, 'day')
+        cutoff_key = time.strftime('%Y%m', time.gmtime(cutoff))
+        for name in os.listdir(day_dir):
+            if name.endswith('.json') and name.split('.', 1)[0] < cutoff_key:
+                os.remove(os.path.join(day_dir, name))
+
+    @staticmethod
+    def _bucket_map(data, level):
+        return data if level == 'minute' else data.get('buckets', {})
+
+    # ---------- Consulta ----------
+
+    def _level_files(self, level, start, end):
+        """Ficheros de un nivel cuyo periodo puede solapar [start, end)"""
+        level_dir = os.path.join(self.directory, level)
+        file_format = {'minute': '%Y%m%d%H', 'hour': '%Y%m%d', 'day': '%Y%m'}[level]
+        first = time.strftime(file_format, time.gmtime(start)) if start is not None else None
+        last = time.strftime(file_format, time.gmtime(end)) if end is not None else None
+        for name in sorted(os.listdir(level_dir)):
+            if not name.endswith('.json'):
+                continue
+            key = name.split('.', 1)[0]
+            if first and key < first or last and key > last:
+                continue
+            yield os.path.join(level_dir, name)
+
+    def query(self, start=None, end=None, granularity='hour'):
+        """Combinar los buckets con inicio en [start, end).
+
+        Devuelve (total, serie) donde serie es [(inicio, Bucket)] agrupada por
+        `granularity`; los datos ya compactados a un nivel más grueso aparecen en el
+        inicio de su bucket.
+        """
+        self.flush()
+        total = Bucket()
+        series = {}
+        for level in ('minute', 'hour', 'day'):
+            for path in self._level_files(level, start, end):
+                for bucket_start, bucket_data in self._bucket_map(read_json(path, {}), level).items():
+                    bucket_start = int(bucket_start)
+                    if start is not None and bucket_start < start or end is not None and bucket_start >= end:
+                        continue
+                    bucket = Bucket.from_dict(bucket_data)
+                    total.merge(bucket)
+                    if GRANULARITIES[level] < GRANULARITIES[granularity]:
+                        series_start = align(bucket_start, granularity)
+                    else:
+                        series_start = bucket_start
+                    series.setdefault(series_start, Bucket()).merge(bucket)
+        return total, sorted(series.items())
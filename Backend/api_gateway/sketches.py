@@ -0,0 +1,127 @@
+# api_gateway/sketches.py - Sketches de latencia mergeables (estilo DDSketch)
+"""
+Histograma logarítmico de latencias con error relativo acotado.
+
+Cada valor x > 0 cae en el bin ceil(log(x) / log(gamma)), con
+gamma = (1 + alpha) / (1 - alpha); cualquier cuantil se estima con error relativo
+<= alpha. Dos sketches con el mismo alpha se combinan sumando bins, así que los
+buckets de minuto, hora y día se pueden agregar sin conservar las latencias.
+
+La memoria está acotada a `max_bins` bins: si se supera, los bins más bajos se
+colapsan en uno (solo pierden precisión los cuantiles más bajos; p50..p999 no se
+ven afectados mientras la cola alta quepa en los bins restantes).
+"""
+
+import math
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MAX_BINS = 2048
+
+# Cuantiles que se publican en /logs/stats y en el CLI
+PERCENTILES = (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('p999', 0.999))
+
+
+class LatencySketch:
+    """Sketch de cuantiles mergeable para latencias en milisegundos"""
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY, max_bins=DEFAULT_MAX_BINS):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value, weight=1):
+        if value <= 0:
+            self.zero_count += weight
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            if key in self.bins:
+                self.bins[key] += weight
+            else:
+                self.bins[key] = weight
+                if len(self.bins) > self.max_bins:
+                    self._collapse()
+        self.count += weight
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Solo se pueden combinar sketches con la misma precisión")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+        return self
+
+    def _collapse(self):
+        """Juntar los bins más bajos en el primero que se conserva"""
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins
+        target = keys[excess]
+        self.bins[target] += sum(self.bins.pop(key) for key in keys[:excess])
+
+    def quantile(self, q):
+        """Valor estimado del cuantil q (0..1); None si el sketch está vacío"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                # Punto medio del bin en escala logarítmica: error relativo <= alpha
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def percentiles(self):
+        """p50/p90/p99/p999 redondeados a 2 decimales (None si está vacío)"""
+        result = {}
+        for name, q in PERCENTILES:
+            value = self.quantile(q)
+            if value is not None and self.max is not None:
+                # El punto medio del bin puede pasarse del máximo observado
+                value = min(max(value, self.min), self.max)
+            result[name] = round(value, 2) if value is not None else None
+        return result
+
+    def count_below(self, threshold):
+        """Número aproximado de valores < threshold (precisión del bin)"""
+        if threshold <= 0:
+            return 0
+        limit = math.ceil(math.log(threshold) / self._log_gamma)
+        return self.zero_count + sum(count for key, count in self.bins.items() if key < limit)
+
+    def to_dict(self):
+        return {
+            "alpha": self.relative_accuracy,
+            "zero": self.zero_count,
+            "min": self.min,
+            "max": self.max,
+            "bins": {str(key): count for key, count in self.bins.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data.get("alpha", DEFAULT_RELATIVE_ACCURACY))
+        sketch.zero_count = data.get("zero", 0)
+        sketch.min = data.get("min")
+        sketch.max = data.get("max")
+        sketch.bins = {int(key): count for key, count in data.get("bins", {}).items()}
+        sketch.count = sketch.zero_count + sum(sketch.bins.values())
+        return sketch
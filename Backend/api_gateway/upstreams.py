@@ -0,0 +1,266 @@
+# api_gateway/upstreams.py - Balanceo entre réplicas de cada servicio upstream
+"""
+AUTH_SERVICE_URL, USER_SERVICE_URL y TASK_SERVICE_URL aceptan varias URLs separadas
+por comas; cada petición se envía a una de las réplicas disponibles:
+
+- Selección (UPSTREAM_BALANCER): `least_outstanding` elige la réplica con menos
+  peticiones en vuelo; `p2c` compara solo dos réplicas al azar (menos contención
+  entre hilos y sin efecto manada cuando varios workers ven el mismo estado).
+  En ambos casos las peticiones en vuelo se dividen por el peso de arranque lento.
+- Chequeo pasivo: UPSTREAM_FAILURE_THRESHOLD fallos seguidos (error de conexión,
+  timeout o 5xx) expulsan la réplica UPSTREAM_EJECT_SECONDS, el doble en cada
+  expulsión repetida (hasta UPSTREAM_MAX_EJECT_SECONDS).
+- Chequeo activo: solo si el servicio tiene varias réplicas, un hilo por worker
+  consulta /livez de cada una cada UPSTREAM_HEALTH_INTERVAL_SECONDS. Una réplica que
+  falla deja de recibir tráfico; vuelve tras UPSTREAM_RECOVERY_SUCCESSES chequeos
+  correctos (y, si estaba expulsada, cuando termina la expulsión). Con una sola URL no
+  hay a dónde desviar el tráfico y las sondas mantendrían despierto un servicio free
+  tier de Render: la expulsión termina por tiempo.
+- Arranque lento: una réplica que vuelve (o que arranca tras un fallo) recibe una
+  fracción creciente del tráfico durante UPSTREAM_SLOW_START_SECONDS, para que una
+  instancia recién levantada en Render no se coma de golpe toda la carga en frío.
+
+Si ninguna réplica está disponible se usan todas (modo pánico): es preferible
+intentarlo a rechazar todo el tráfico por un chequeo demasiado estricto.
+"""
+
+import os
+import random
+import threading
+import time
+
+import requests
+
+UPSTREAM_BALANCER = os.getenv('UPSTREAM_BALANCER', 'least_outstanding')
+UPSTREAM_HEALTH_INTERVAL_SECONDS = float(os.getenv('UPSTREAM_HEALTH_INTERVAL_SECONDS', 5))
+UPSTREAM_HEALTH_TIMEOUT_SECONDS = float(os.getenv('UPSTREAM_HEALTH_TIMEOUT_SECONDS', 2))
+UPSTREAM_FAILURE_THRESHOLD = int(os.getenv('UPSTREAM_FAILURE_THRESHOLD', 3))
+UPSTREAM_RECOVERY_SUCCESSES = int(os.getenv('UPSTREAM_RECOVERY_SUCCESSES', 2))
+UPSTREAM_EJECT_SECONDS = float(os.getenv('UPSTREAM_EJECT_SECONDS', 30))
+UPSTREAM_MAX_EJECT_SECONDS = float(os.getenv('UPSTREAM_MAX_EJECT_SECONDS', 300))
+UPSTREAM_SLOW_START_SECONDS = float(os.getenv('UPSTREAM_SLOW_START_SECONDS', 30))
+
+# Peso con el que empieza una réplica en arranque lento
+SLOW_START_MIN_WEIGHT = 0.1
+
+BALANCERS = ('least_outstanding', 'p2c')
+
+
+def parse_endpoints(value):
+    """Lista de URLs a partir de "url1,url2" (o de una lista ya separada)"""
+    if isinstance(value, str):
+        value = value.split(',')
+    return [url.strip().rstrip('/') for url in value if url and url.strip()]
+
+
+class Endpoint:
+    """Estado de una réplica: peticiones en vuelo, fallos y ventana de expulsión"""
+
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.check_successes = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self.readmitted_at = 0.0
+        # None = peso completo (las réplicas configuradas al arrancar no hacen slow start)
+        self.ready_since = None
+        self.stats = {'requests': 0, 'failures': 0, 'ejections': 0}
+
+    def available(self):
+        # La expulsión termina cuando el chequeo activo la readmite, no solo por tiempo
+        return self.healthy and not self.ejected_until
+
+    def weight(self, now, slow_start):
+        if self.ready_since is None or slow_start <= 0:
+            return 1.0
+        progress = (now - self.ready_since) / slow_start
+        if progress >= 1:
+            self.ready_since = None
+            return 1.0
+        return SLOW_START_MIN_WEIGHT + (1 - SLOW_START_MIN_WEIGHT) * progress
+
+    def load(self, now, slow_start):
+        return (self.outstanding + 1) / self.weight(now, slow_start)
+
+
+class Upstream:
+    """Conjunto de réplicas de un servicio con balanceo y chequeos de salud"""
+
+    def __init__(self, name, urls, balancer=UPSTREAM_BALANCER,
+                 health_path='/livez', health_interval=UPSTREAM_HEALTH_INTERVAL_SECONDS,
+                 failure_threshold=UPSTREAM_FAILURE_THRESHOLD, slow_start=UPSTREAM_SLOW_START_SECONDS):
+        if balancer not in BALANCERS:
+            raise ValueError(f"Balanceador desconocido: {balancer} (usa {', '.join(BALANCERS)})")
+        self.name = name
+        self.endpoints = [Endpoint(url) for url in parse_endpoints(urls)]
+        if not self.endpoints:
+            raise ValueError(f"{name}: se necesita al menos una URL")
+        self.balancer = balancer
+        self.health_path = health_path
+        self.health_interval = health_interval
+        self.failure_threshold = failure_threshold
+        self.slow_start = slow_start
+        self._lock = threading.Lock()
+        self._thread = None
+        self._session = None
+
+    @property
+    def url(self):
+        """URL de la primera réplica (para mensajes y compatibilidad)"""
+        return self.endpoints[0].url
+
+    # ---------- Selección ----------
+
+    def acquire(self, exclude=None):
+        """Elegir réplica y contarla como ocupada; evita las de exclude si hay alternativa"""
+        self.start()
+        now = time.monotonic()
+        with self._lock:
+            self._readmit_expired(now)
+            candidates = [e for e in self.endpoints if e.available()] or list(self.endpoints)
+            if exclude:
+                candidates = [e for e in candidates if e not in exclude] or candidates
+            if len(candidates) == 1:
+                endpoint = candidates[0]
+            elif self.balancer == 'p2c':
+                first, second = random.sample(candidates, 2)
+                endpoint = first if first.load(now, self.slow_start) <= second.load(now, self.slow_start) else second
+            else:
+                lowest = min(e.load(now, self.slow_start) for e in candidates)
+                endpoint = random.choice([e for e in candidates if e.load(now, self.slow_start) == lowest])
+            endpoint.outstanding += 1
+            endpoint.stats['requests'] += 1
+        return endpoint
+
+    def release(self, endpoint, ok=True):
+        """Liberar la réplica y aplicar el chequeo pasivo con el resultado"""
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.consecutive_failures = 0
+                return
+            endpoint.stats['failures'] += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.consecutive_failures >= self.failure_threshold and not endpoint.ejected_until:
+                self._eject(endpoint)
+
+    def _eject(self, endpoint):
+        endpoint.ejections += 1
+        endpoint.stats['ejections'] += 1
+        duration = min(UPSTREAM_EJECT_SECONDS * 2 ** (endpoint.ejections - 1), UPSTREAM_MAX_EJECT_SECONDS)
+        endpoint.ejected_until = time.monotonic() + duration
+        endpoint.consecutive_failures = 0
+        print(f"⛔ [UPSTREAM] {self.name}: {endpoint.url} expulsada {duration:.0f}s tras fallos seguidos")
+
+    def request(self, session, method, path, tried=None, **kwargs):
+        """Enviar una petición a una réplica; tried acumula las réplicas ya usadas"""
+        endpoint = self.acquire(exclude=tried)
+        if tried is not None:
+            tried.append(endpoint)
+        try:
+            resp = session.request(method, f"{endpoint.url}/{path}", **kwargs)
+        except Exception:
+            self.release(endpoint, ok=False)
+            raise
+        self.release(endpoint, ok=resp.status_code < 500)
+        return resp
+
+    # ---------- Chequeo activo ----------
+
+    @property
+    def active_checks(self):
+        """El chequeo activo solo tiene sentido con varias réplicas entre las que elegir"""
+        return len(self.endpoints) > 1
+
+    def _readmit_expired(self, now):
+        """Sin chequeo activo, readmitir las réplicas cuya expulsión terminó (con el lock tomado)"""
+        if self.active_checks:
+            return
+        for endpoint in self.endpoints:
+            if endpoint.ejected_until and now >= endpoint.ejected_until:
+                endpoint.ejected_until = 0.0
+                endpoint.readmitted_at = now
+
+    def start(self):
+        """Arrancar el hilo de chequeo activo (idempotente; tras el fork de gunicorn)"""
+        if self._thread is not None or not self.active_checks:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._session = requests.Session()
+            self._thread = threading.Thread(target=self._run, name=f'upstream-{self.name}', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            for endpoint in list(self.endpoints):
+                self._check(endpoint)
+            time.sleep(self.health_interval)
+
+    def _check(self, endpoint):
+        try:
+            resp = self._session.get(f"{endpoint.url}{self.health_path}", timeout=UPSTREAM_HEALTH_TIMEOUT_SECONDS)
+            ok = resp.status_code < 400
+        except requests.RequestException:
+            ok = False
+
+        now = time.monotonic()
+        with self._lock:
+            if not ok:
+                if endpoint.healthy:
+                    print(f"🔴 [UPSTREAM] {self.name}: {endpoint.url} no pasa el chequeo de salud")
+                endpoint.healthy = False
+                endpoint.check_successes = 0
+                return
+            if endpoint.healthy:
+                if endpoint.ejected_until and now >= endpoint.ejected_until:
+                    # Fin de la expulsión con el chequeo en verde: vuelve con arranque lento
+                    endpoint.ejected_until = 0.0
+                    endpoint.ready_since = now
+                    endpoint.readmitted_at = now
+                    print(f"🟢 [UPSTREAM] {self.name}: {endpoint.url} readmitida")
+                elif endpoint.ejections and not endpoint.ejected_until and now - endpoint.readmitted_at >= UPSTREAM_MAX_EJECT_SECONDS:
+                    # Tras un tiempo estable, la próxima expulsión vuelve a ser más corta
+                    endpoint.ejections -= 1
+                    endpoint.readmitted_at = now
+                return
+            endpoint.check_successes += 1
+            if endpoint.check_successes >= UPSTREAM_RECOVERY_SUCCESSES:
+                endpoint.healthy = True
+                endpoint.check_successes = 0
+                endpoint.ready_since = now
+                print(f"🟢 [UPSTREAM] {self.name}: {endpoint.url} recuperada")
+
+    # ---------- Estado ----------
+
+    def probe(self):
+        """Sonda para HealthMonitor: falla si ninguna réplica está disponible"""
+        self.start()
+        with self._lock:
+            self._readmit_expired(time.monotonic())
+            available = sum(1 for e in self.endpoints if e.available())
+        if not available:
+            raise RuntimeError(f"Ninguna réplica disponible de {len(self.endpoints)}")
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'balancer': self.balancer,
+                'endpoints': [
+                    {
+                        'url': e.url,
+                        'available': e.available(),
+                        'healthy': e.healthy,
+                        'ejected_for_seconds': round(max(0.0, e.ejected_until - now), 1),
+                        'outstanding': e.outstanding,
+                        'weight': round(e.weight(now, self.slow_start), 2),
+                        **e.stats
+                    }
+                    for e in self.endpoints
+                ]
+            }
@@ -1,15 +1,18 @@
 # auth_service/app_mongo.py
-from flask import Flask, jsonify, request
-import bcrypt
+from flask import Flask, jsonify, request, Response
 import os
-import pyotp
-import qrcode
-import io
-import base64
 import jwt
 import datetime
 import traceback
-from database_mongo import mongo_db
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
+from database_mongo import mongo_db, ensure_user_indexes, find_existing_user
+from deadlines import init_deadlines
+from health_probes import HealthMonitor, mongo_probe, register_health_routes
+from pymongo.errors import DuplicateKeyError
 # Importar configuración según el entorno
 import os
 if os.getenv('FLASK_ENV') == 'production':
@@ -21,20 +24,102 @@ else:
 
 app = Flask(__name__)
 
+# Liveness (/livez) y readiness (/readyz) con sondas en segundo plano
+health_monitor = HealthMonitor("Auth Service (MongoDB)")
+health_monitor.add_probe('mongodb', mongo_probe(mongo_db))
+register_health_routes(app, health_monitor)
+
+# Deadline de cada petición (cabecera del gateway) aplicado a las operaciones de MongoDB
+init_deadlines(app)
+
 
 
-print(f"[DB] Conectando a MongoDB: {config.MONGO_URI}")
 
 def hash_password(password):
     """Hashear contraseña usando bcrypt"""
+    import bcrypt  # Importación diferida: acelera el arranque en frío
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
 
 def check_password(hashed_password, user_password):
     """Verificar contraseña hasheada"""
+    import bcrypt
     if isinstance(hashed_password, str):
         hashed_password = hashed_password.encode('utf-8')
     return bcrypt.checkpw(user_password.encode('utf-8'), hashed_password)
 
+# ===========================================
+# ============ QR DE ENROLAMIENTO OTP =======
+# ===========================================
+
+QR_CACHE_SIZE = int(os.getenv('QR_CACHE_SIZE', 256))
+QR_RENDER_WORKERS = int(os.getenv('QR_RENDER_WORKERS', 2))
+QR_RENDER_TIMEOUT = 10  # segundos
+ENROLLMENT_TOKEN_MINUTES = 15
+
+# Pool acotado para renderizar: limita el CPU que el QR puede consumir en paralelo
+_qr_executor = ThreadPoolExecutor(max_workers=QR_RENDER_WORKERS, thread_name_prefix='qr-render')
+# Caché LRU (user_id, formato, hash del URI) -> Future con los bytes de la imagen
+_qr_cache = OrderedDict()
+_qr_cache_lock = threading.Lock()
+
+def build_totp_uri(user):
+    """URI otpauth:// que codifica el QR para Google Authenticator"""
+    import pyotp
+    return pyotp.totp.TOTP(user['otp_secret']).provisioning_uri(
+        name=user.get('email') or user['username'],
+        issuer_name="Task Management System"
+    )
+
+def render_qr(data, image_format):
+    """Renderizar el QR como PNG o SVG (qrcode/PIL se importan solo aquí)"""
+    import io
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    buffer = io.BytesIO()
+    if image_format == 'svg':
+        import qrcode.image.svg
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def get_qr_image(user_id, totp_uri, image_format):
+    """Obtener la imagen del QR desde la caché o encargar su renderizado al pool.
+
+    Las peticiones simultáneas del mismo usuario comparten el mismo Future, así que
+    cada QR se renderiza una sola vez.
+    """
+    key = (user_id, image_format, hashlib.sha256(totp_uri.encode('utf-8')).hexdigest())
+    with _qr_cache_lock:
+        future = _qr_cache.get(key)
+        if future is not None:
+            _qr_cache.move_to_end(key)
+        else:
+            future = _qr_executor.submit(render_qr, totp_uri, image_format)
+            _qr_cache[key] = future
+            while len(_qr_cache) > QR_CACHE_SIZE:
+                _qr_cache.popitem(last=False)
+    try:
+        return future.result(timeout=QR_RENDER_TIMEOUT)
+    except Exception:
+        with _qr_cache_lock:
+            if _qr_cache.get(key) is future and future.done():
+                del _qr_cache[key]
+        raise
+
+def create_enrollment_token(user_id):
+    """Token de corta duración que permite descargar el QR justo después del registro"""
+    payload = {
+        "user_id": user_id,
+        "purpose": "otp_enroll",
+        "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=ENROLLMENT_TOKEN_MINUTES)
+    }
+    return jwt.encode(payload, config.JWT_SECRET, algorithm="HS256")
+
 # Configuración CORS para producción
 from flask_cors import CORS
 
@@ -80,61 +165,46 @@ def register():
             return jsonify({"error": "Error de conexión a la base de datos"}), 500
         
         users_collection = mongo_db.get_collection('users')
-        
-        # Verificar si el usuario ya existe
-        existing_user = users_collection.find_one({
-            "$or": [
-                {"username": username},
-                {"email": email} if email else {"username": "nonexistent"}
-            ]
-        })
-        
-        if existing_user:
+        # Sin índices únicos, comprobación previa (no atómica) como respaldo
+        if not ensure_user_indexes(users_collection) and find_existing_user(users_collection, username, email):
             return jsonify({"error": "El usuario ya existe"}), 400
         
         # Hash de la contraseña
         hashed_password = hash_password(password)
         
-        # Generar OTP secret
+        # Generar OTP secret (el QR se genera bajo demanda en GET /otp/qr)
+        import pyotp
         otp_secret = pyotp.random_base32()
         
-        # Generar QR code para OTP
-        totp_uri = pyotp.totp.TOTP(otp_secret).provisioning_uri(
-            name=email if email else username,
-            issuer_name="Task Management System"
-        )
-        
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(totp_uri)
-        qr.make(fit=True)
-        qr_img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convertir QR a base64
-        buffer = io.BytesIO()
-        qr_img.save(buffer, format='PNG')
-        qr_code_url = base64.b64encode(buffer.getvalue()).decode()
-        
         # Crear documento de usuario
+        now = datetime.datetime.now(datetime.timezone.utc)
         user_doc = {
             "username": username,
             "email": email,
             "password": hashed_password.decode('utf-8'),
             "otp_secret": otp_secret,
             "role": "user",
-            "created_at": datetime.datetime.now(datetime.timezone.utc),
+            "created_at": now,
+            "updated_at": now,
             "require_otp": True
         }
         
-        # Insertar usuario
-        result = users_collection.insert_one(user_doc)
+        # Insertar usuario: los índices únicos detectan duplicados en una sola operación
+        try:
+            result = users_collection.insert_one(user_doc)
+        except DuplicateKeyError:
+            return jsonify({"error": "El usuario ya existe"}), 400
         
         print(f"[REGISTER] Usuario creado exitosamente: {username}")
         
+        user_id = str(result.inserted_id)
+        enrollment_token = create_enrollment_token(user_id)
+        
         return jsonify({
             "message": "Usuario registrado exitosamente",
-            "user_id": str(result.inserted_id),
+            "user_id": user_id,
             "otp_secret": otp_secret,
-            "qr_code": qr_code_url
+            "enrollment_token": enrollment_token
         }), 201
         
     except Exception as e:
@@ -144,6 +214,65 @@ def register():
         traceback.print_exc()
         return jsonify({"error": "Error interno del servidor"}), 500
 
+@app.route('/otp/qr', methods=['GET', 'OPTIONS'])
+def otp_qr():
+    """QR de enrolamiento OTP del usuario (?format=png|svg; token de enrolamiento en el header Authorization)"""
+    if request.method == 'OPTIONS':
+        return jsonify({'message': 'OK'})
+    
+    try:
+        # Solo por header: la query string acaba en los logs del gateway (request.url)
+        auth_header = request.headers.get('Authorization')
+        if not auth_header or not auth_header.startswith('Bearer '):
+            return jsonify({"error": "Token requerido"}), 401
+        token = auth_header.split(' ')[1]
+        
+        try:
+            payload = jwt.decode(token, config.JWT_SECRET, algorithms=["HS256"])
+        except jwt.ExpiredSignatureError:
+            return jsonify({"error": "Token expirado"}), 401
+        except jwt.InvalidTokenError:
+            return jsonify({"error": "Token inválido"}), 401
+        
+        # El token de sesión no sirve: el QR revela el secreto OTP y anularía el 2FA
+        if payload.get('purpose') != 'otp_enroll':
+            return jsonify({"error": "Se requiere el token de enrolamiento OTP"}), 403
+        
+        image_format = request.args.get('format')
+        if not image_format:
+            image_format = 'svg' if 'image/svg+xml' in request.headers.get('Accept', '') else 'png'
+        if image_format not in ('png', 'svg'):
+            return jsonify({"error": "Formato inválido. Debe ser 'png' o 'svg'"}), 400
+        
+        if not mongo_db.connect():
+            return jsonify({"error": "Error de conexión a la base de datos"}), 500
+        
+        users_collection = mongo_db.get_collection('users')
+        try:
+            user = users_collection.find_one(
+                {"_id": ObjectId(payload.get('user_id'))},
+                {"username": 1, "email": 1, "otp_secret": 1}
+            )
+        except Exception:
+            return jsonify({"error": "Token inválido"}), 401
+        
+        if not user:
+            return jsonify({"error": "Usuario no encontrado"}), 404
+        if not user.get('otp_secret'):
+            return jsonify({"error": "El usuario no tiene OTP configurado"}), 404
+        
+        image = get_qr_image(str(user['_id']), build_totp_uri(user), image_format)
+        
+        response = Response(image, mimetype='image/svg+xml' if image_format == 'svg' else 'image/png')
+        # El QR contiene el secreto OTP: nunca debe quedar en cachés intermedias
+        response.headers['Cache-Control'] = 'no-store, private'
+        return response
+        
+    except Exception as e:
+        print(f"Error generando QR: {e}")
+        traceback.print_exc()
+        return jsonify({"error": "Error interno del servidor"}), 500
+
 @app.route('/login', methods=['POST', 'OPTIONS'])
 def login():
     """Autenticar usuario desde MongoDB"""
@@ -222,6 +351,7 @@ def login():
                 if not otp_secret:
                     return jsonify({"error": "No se encontró el secreto OTP"}), 400
                 
+                import pyotp
                 totp = pyotp.TOTP(otp_secret)
                 if not totp.verify(otp_code):
                     return jsonify({"error": "OTP inválido"}), 401
@@ -261,26 +391,18 @@ def login():
 
 @app.route('/health', methods=['GET', 'OPTIONS'])
 def health():
-    """Verificar estado del servicio"""
     if request.method == 'OPTIONS':
         return jsonify({'message': 'OK'})
     
-    # Verificar conexión a MongoDB
-    try:
-        if mongo_db.connect():
-            # Test connection
-            mongo_db.client.admin.command('ismaster')
-            db_status = "UP"
-        else:
-            db_status = "DOWN"
-    except:
-        db_status = "DOWN"
+    # Estado de MongoDB desde la última sonda en segundo plano (no abre conexiones)
+    mongo = health_monitor.snapshot()["dependencies"]["mongodb"]
+    db_status = "UP" if mongo["status"] == "UP" else "DOWN"
     
-    # Este return debe estar FUERA del try/except
     return jsonify({
         "status": "UP" if db_status == "UP" else "DEGRADED",
         "service": "Auth Service (MongoDB)",
         "database": db_status,
+        "database_latency_ms": mongo["latency_ms"],
         "port": os.environ.get('PORT', 'N/A')
     }), 200
 
@@ -297,7 +419,10 @@ def root():
         "endpoints": {
             "register": "POST /auth/register",
             "login": "POST /auth/login",
+            "otp_qr": "GET /otp/qr?format=png|svg",
             "health": "GET /health",
+            "liveness": "GET /livez",
+            "readiness": "GET /readyz",
             "users": "GET /users"
         },
         "database": "MongoDB task_management"
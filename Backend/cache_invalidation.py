@@ -0,0 +1,283 @@
+# cache_invalidation.py - Bus de invalidación de cachés en proceso
+"""
+Invalidación de cachés a partir de los cambios en MongoDB.
+
+Un hilo por proceso sigue los change streams de las colecciones users, tasks y roles
+(cualquier escritura, venga del servicio que venga o de scripts como
+migrate_to_atlas.py) y publica eventos de invalidación a las cachés registradas.
+
+- Con replica set (Atlas): change stream; tras un corte de conexión se reanuda con el
+  último resume token, sin perder eventos.
+- Sin replica set (MongoDB local standalone): polling por `updated_at` desde el último
+  watermark. Como no todos los escritores mantienen updated_at (scripts de migración,
+  borrados físicos), cualquier cambio en el número de documentos invalida la colección
+  y además se vacía entera cada CACHE_POLL_FULL_INVALIDATION_SECONDS, que acota lo que
+  puede durar un valor obsoleto.
+
+El resume token y los watermarks se guardan en memoria, no en MongoDB: las cachés también
+están en memoria, así que un proceso nuevo empieza vacío y no tiene nada que reanudar.
+Solo si no hay punto desde el que reanudar (o el token caducó) se vacían todas las cachés.
+
+Las cachés versionan las invalidaciones: un relleno que leyó de MongoDB antes de una
+invalidación no puede reinsertar el valor antiguo después (ver InvalidatingCache.version).
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from database_mongo import mongo_db
+
+WATCHED_COLLECTIONS = ('users', 'tasks', 'roles')
+CACHE_POLL_FULL_INVALIDATION_SECONDS = int(os.getenv('CACHE_POLL_FULL_INVALIDATION_SECONDS', 60))
+
+# Códigos de error de MongoDB relevantes para los change streams
+CHANGE_STREAM_UNSUPPORTED = (40573, 40324)  # Sin replica set / etapa no soportada
+CHANGE_STREAM_HISTORY_LOST = 286            # El resume token ya no está en el oplog
+
+
+class InvalidatingCache:
+    """Caché en memoria que se vacía con los eventos del bus.
+
+    Cada entrada puede asociarse al _id del documento del que depende, de modo que
+    una invalidación por documento borra todas las claves derivadas de él.
+
+    Para rellenar sin carreras: tomar version() antes de leer de MongoDB y pasarla a
+    set(). Si entretanto llegó una invalidación del documento (o de toda la caché), el
+    valor leído puede ser anterior al cambio y set() lo descarta.
+    """
+
+    def __init__(self, name, ttl=300, max_entries=1000):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._keys_by_doc = {}
+        self._lock = threading.Lock()
+        # Contador de invalidaciones y versión de la última de cada documento (tombstones)
+        self._version = 0
+        self._cleared_at = 0
+        self._invalidated_at = {}
+
+    def version(self):
+        """Versión actual, a tomar antes de leer el valor que se va a guardar"""
+        with self._lock:
+            return self._version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return None
+            return value
+
+    def set(self, key, value, doc_id=None, version=None):
+        """Guardar un valor; con version, solo si no hubo invalidaciones que le afecten desde entonces"""
+        with self._lock:
+            doc_key = str(doc_id) if doc_id is not None else None
+            if version is not None and (
+                    self._cleared_at > version
+                    or (doc_key is not None and self._invalidated_at.get(doc_key, 0) > version)
+                    or (doc_key is None and self._version > version)):
+                return False
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                # Expulsar la entrada más antigua (los dict conservan el orden de inserción)
+                self._remove(next(iter(self._entries)))
+            self._entries[key] = (value, time.monotonic() + self.ttl, doc_key)
+            if doc_key is not None:
+                self._keys_by_doc.setdefault(doc_key, set()).add(key)
+            return True
+
+    def invalidate(self, doc_id=None):
+        """Invalidar las entradas de un documento, o toda la caché si doc_id es None"""
+        with self._lock:
+            self._version += 1
+            if doc_id is None or len(self._invalidated_at) >= self.max_entries:
+                # Vaciar todo también acota los tombstones: basta con la versión global
+                self._cleared_at = self._version
+                self._invalidated_at.clear()
+                self._entries.clear()
+                self._keys_by_doc.clear()
+                return
+            doc_key = str(doc_id)
+            self._invalidated_at[doc_key] = self._version
+            for key in self._keys_by_doc.pop(doc_key, set()):
+                self._entries.pop(key, None)
+
+    def _remove(self, key):
+        _, _, doc_key = self._entries.pop(key)
+        if doc_key is not None:
+            keys = self._keys_by_doc.get(doc_key)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_doc[doc_key]
+
+
+class InvalidationBus:
+    """Sigue los cambios de MongoDB y los reparte a las cachés suscritas"""
+
+    def __init__(self, consumer_name, collections=WATCHED_COLLECTIONS, poll_interval=5):
+        self.consumer_name = consumer_name
+        self.collections = tuple(collections)
+        self.poll_interval = poll_interval
+        self.mode = None
+
+        # Punto de reanudación en memoria: resume token o watermarks y conteos del polling
+        self._token = None
+        self._watermarks = {}
+        self._counts = {}
+
+        self._caches = {name: [] for name in self.collections}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    # ---------- Suscripción ----------
+
+    def cache(self, collection, **kwargs):
+        """Crear una caché invalidada por los cambios de `collection` y arrancar el bus"""
+        cache = InvalidatingCache(f"{collection}:{len(self._caches[collection])}", **kwargs)
+        self.subscribe(collection, cache.invalidate)
+        return cache
+
+    def subscribe(self, collection, callback):
+        """Registrar callback(doc_id) para una colección; doc_id None = invalidar todo"""
+        with self._lock:
+            self._caches[collection].append(callback)
+        self.start()
+
+    def publish(self, collection, doc_id=None):
+        with self._lock:
+            callbacks = list(self._caches.get(collection, ()))
+        for callback in callbacks:
+            try:
+                callback(doc_id)
+            except Exception as e:
+                print(f"⚠️ [CACHE] Error invalidando caché de {collection}: {e}")
+
+    def publish_all(self):
+        for collection in self.collections:
+            self.publish(collection)
+
+    # ---------- Ciclo de vida ----------
+
+    def start(self):
+        """Arrancar el hilo del bus (idempotente; se llama al registrar la primera caché)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='cache-invalidation', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                if self.mode != 'poll':
+                    self._watch_change_streams()
+                else:
+                    self._poll_updated_at()
+                backoff = 1
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAM_UNSUPPORTED:
+                    print("ℹ️ [CACHE] Change streams no disponibles (sin replica set); usando polling por updated_at")
+                    self.mode = 'poll'
+                    continue
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    # Se perdieron eventos: lo único seguro es vaciar todas las cachés
+                    print("⚠️ [CACHE] Resume token expirado; invalidando todas las cachés")
+                    self._token = None
+                    self.publish_all()
+                    continue
+                print(f"⚠️ [CACHE] Error en el bus de invalidación: {e}")
+            except PyMongoError as e:
+                print(f"⚠️ [CACHE] Error de conexión en el bus de invalidación: {e}")
+            except Exception as e:
+                print(f"⚠️ [CACHE] Error inesperado en el bus de invalidación: {e}")
+
+            # Sin punto de reanudación no se sabe qué cambió mientras tanto
+            if not self._can_resume():
+                self.publish_all()
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 60)
+
+    def _can_resume(self):
+        """Si el siguiente intento continúa donde se quedó el anterior sin perder cambios"""
+        if self.mode == 'poll':
+            return bool(self._watermarks)
+        return self._token is not None
+
+    # ---------- Change streams ----------
+
+    def _watch_change_streams(self):
+        self.mode = 'change_stream'
+        if mongo_db.db is None and not mongo_db.connect():
+            raise PyMongoError("No se pudo conectar a MongoDB")
+        pipeline = [{"$match": {"ns.coll": {"$in": list(self.collections)}}}]
+
+        # Un solo change stream a nivel de base de datos para las tres colecciones
+        with mongo_db.db.watch(pipeline, resume_after=self._token, max_await_time_ms=1000) as stream:
+            while not self._stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is not None:
+                    collection = change['ns']['coll']
+                    if change['operationType'] in ('drop', 'rename', 'invalidate'):
+                        self.publish(collection)
+                    else:
+                        self.publish(collection, change['documentKey']['_id'])
+
+                # El token avanza también sin eventos (postBatchResumeToken)
+                if stream.resume_token is not None:
+                    self._token = stream.resume_token
+
+    # ---------- Polling por updated_at ----------
+
+    def _poll_updated_at(self):
+        watermarks = self._watermarks
+        counts = self._counts
+        now = datetime.utcnow()
+        for collection in self.collections:
+            watermarks.setdefault(collection, now)
+        next_full_invalidation = time.monotonic() + CACHE_POLL_FULL_INVALIDATION_SECONDS
+
+        while not self._stop.is_set():
+            for collection in self.collections:
+                coll = mongo_db.get_collection(collection)
+                since = watermarks[collection]
+                for doc in coll.find({"updated_at": {"$gt": since}}, {"_id": 1, "updated_at": 1}).sort("updated_at", 1):
+                    self.publish(collection, doc['_id'])
+                    watermarks[collection] = doc['updated_at']
+
+                # Borrados físicos e inserciones sin updated_at: se detectan por el conteo
+                count = coll.estimated_document_count()
+                if collection in counts and count != counts[collection]:
+                    self.publish(collection)
+                counts[collection] = count
+
+            # Actualizaciones sin updated_at: no hay forma barata de verlas, se acota su duración
+            if time.monotonic() >= next_full_invalidation:
+                self.publish_all()
+                next_full_invalidation = time.monotonic() + CACHE_POLL_FULL_INVALIDATION_SECONDS
+
+            self._stop.wait(self.poll_interval)
+
+
+_buses = {}
+
+def get_invalidation_bus(consumer_name):
+    """Bus compartido del proceso para un consumidor (p. ej. 'task_service')"""
+    if consumer_name not in _buses:
+        _buses[consumer_name] = InvalidationBus(consumer_name)
+    return _buses[consumer_name]
@@ -24,10 +24,10 @@ class Config:
     TASK_SERVICE_PORT = int(os.getenv('TASK_SERVICE_PORT', 5003))
     API_GATEWAY_PORT = int(os.getenv('API_GATEWAY_PORT', 4000))
     
-    # URLs de servicios para desarrollo local
-    AUTH_SERVICE_URL = f"http://localhost:{AUTH_SERVICE_PORT}"
-    USER_SERVICE_URL = f"http://localhost:{USER_SERVICE_PORT}"
-    TASK_SERVICE_URL = f"http://localhost:{TASK_SERVICE_PORT}"
+    # URLs de servicios para desarrollo local (varias réplicas separadas por comas)
+    AUTH_SERVICE_URL = os.getenv('AUTH_SERVICE_URL', f"http://localhost:{AUTH_SERVICE_PORT}")
+    USER_SERVICE_URL = os.getenv('USER_SERVICE_URL', f"http://localhost:{USER_SERVICE_PORT}")
+    TASK_SERVICE_URL = os.getenv('TASK_SERVICE_URL', f"http://localhost:{TASK_SERVICE_PORT}")
     
     # CORS Configuration
     CORS_ORIGINS = [
@@ -24,10 +24,10 @@ class ProductionConfig:
     # Service Ports para Render
     PORT = int(os.environ.get('PORT', 10000))  # Render usa PORT
     
-    # URLs de servicios para Render (no puertos locales)
-    AUTH_SERVICE_URL = "https://microservicio-auth.onrender.com"
-    USER_SERVICE_URL = "https://microservicio-user.onrender.com"
-    TASK_SERVICE_URL = "https://microservicio-task.onrender.com"
+    # URLs de servicios para Render (no puertos locales); varias réplicas separadas por comas
+    AUTH_SERVICE_URL = os.getenv('AUTH_SERVICE_URL', "https://microservicio-auth.onrender.com")
+    USER_SERVICE_URL = os.getenv('USER_SERVICE_URL', "https://microservicio-user.onrender.com")
+    TASK_SERVICE_URL = os.getenv('TASK_SERVICE_URL', "https://microservicio-task.onrender.com")
     
     # CORS Origins para producción
     CORS_ORIGINS = [
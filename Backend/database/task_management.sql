@@ -117,6 +117,11 @@ CREATE INDEX idx_tasks_deadline ON tasks(deadline);
 CREATE INDEX idx_tasks_is_alive ON tasks(is_alive);
 CREATE INDEX idx_users_username ON users(username);
 CREATE INDEX idx_users_email ON users(email);
+-- Listado paginado por (created_at, id): InnoDB añade el id al final de cada índice secundario
+CREATE INDEX idx_tasks_alive_owner_created ON tasks(is_alive, created_by, created_at);
+CREATE INDEX idx_tasks_alive_created ON tasks(is_alive, created_at);
+-- ETL incremental a MongoDB por (updated_at, id)
+CREATE INDEX idx_tasks_updated_at ON tasks(updated_at);
 
 -- ==================================================
 -- VERIFICAR ESTRUCTURA DE TABLAS
@@ -1,32 +1,53 @@
+import os
+import threading
+import time
 from pymongo import MongoClient
 from config import config
 
+SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+# Espera antes de reintentar la creación de índices de usuarios tras un fallo
+USER_INDEX_RETRY_SECONDS = int(os.getenv('USER_INDEX_RETRY_SECONDS', 60))
+
 class MongoDB:
     def __init__(self):
         self.connection_string = config.MONGO_URI
         self.db_name = config.MONGO_DB_NAME
         self.client = None
         self.db = None
+        self._lock = threading.Lock()
         
     def connect(self):
-        try:
-            if not self.connection_string or self.connection_string == 'mongodb://localhost:27017/':
-                print("⚠️ Usando MongoDB local para desarrollo")
-                # Configuración local para desarrollo
-                self.client = MongoClient('mongodb://localhost:27017/')
-                self.db = self.client[self.db_name]
-            else:
-                print("🌐 Conectando a MongoDB Atlas")
-                self.client = MongoClient(self.connection_string)
-                self.db = self.client[self.db_name]
-            
-            # Test connection
-            self.client.admin.command('ismaster')
-            print("✅ MongoDB connection successful!")
+        """Conectar a MongoDB una sola vez por proceso; las llamadas siguientes reutilizan el cliente"""
+        if self.db is not None:
             return True
-        except Exception as e:
-            print(f"❌ MongoDB connection error: {e}")
-            return False
+        
+        with self._lock:
+            if self.db is not None:
+                return True
+            try:
+                if not self.connection_string or self.connection_string == 'mongodb://localhost:27017/':
+                    print("⚠️ Usando MongoDB local para desarrollo")
+                    # Configuración local para desarrollo
+                    client = MongoClient('mongodb://localhost:27017/', serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS)
+                else:
+                    print("🌐 Conectando a MongoDB Atlas")
+                    client = MongoClient(self.connection_string, serverSelectionTimeoutMS=SERVER_SELECTION_TIMEOUT_MS)
+                
+                # Test connection
+                client.admin.command('ismaster')
+                self.client = client
+                self.db = client[self.db_name]
+                print("✅ MongoDB connection successful!")
+                return True
+            except Exception as e:
+                print(f"❌ MongoDB connection error: {e}")
+                return False
+    
+    def warm_up(self):
+        """Conectar en segundo plano para que la primera petición no pague el handshake con Atlas"""
+        thread = threading.Thread(target=self.connect, name='mongo-warmup', daemon=True)
+        thread.start()
+        return thread
     
     def get_collection(self, collection_name):
         if self.db is None:
@@ -36,6 +57,70 @@ class MongoDB:
     def close(self):
         if self.client:
             self.client.close()
+        self.client = None
+        self.db = None
 
 # Singleton instance
 mongo_db = MongoDB()
+
+# Índices únicos de usuarios (se crean una sola vez por proceso)
+_user_indexes_ready = False
+_user_indexes_retry_at = 0.0
+
+def _has_unique_index(indexes, field):
+    """Si index_information() incluye un índice único sobre el campo"""
+    return any(
+        info.get('unique') and [key for key, _ in info['key']] == [field]
+        for info in indexes.values()
+    )
+
+def ensure_user_indexes(users_collection):
+    """Crear los índices únicos de username y email en los que se apoya el alta de usuarios.
+
+    Devuelve True si la unicidad está garantizada por los índices. Si no (conflicto con
+    un índice existente, duplicados previos, error de red...) devuelve False y el alta
+    debe comprobar los duplicados antes de insertar (find_existing_user).
+    """
+    global _user_indexes_ready, _user_indexes_retry_at
+    if _user_indexes_ready:
+        return True
+    if time.monotonic() < _user_indexes_retry_at:
+        return False
+    try:
+        # Un índice único ya existente sirve (p. ej. email_1 de una migración anterior)
+        indexes = users_collection.index_information()
+        if not _has_unique_index(indexes, 'username'):
+            users_collection.create_index("username", unique=True)
+        if not _has_unique_index(indexes, 'email'):
+            # Parcial: varios usuarios pueden no tener email (None)
+            users_collection.create_index(
+                "email",
+                unique=True,
+                name="email_unique",
+                partialFilterExpression={"email": {"$type": "string"}}
+            )
+        _user_indexes_ready = True
+    except Exception as e:
+        _user_indexes_retry_at = time.monotonic() + USER_INDEX_RETRY_SECONDS
+        print(f"⚠️ Error creando índices de usuarios (se comprobarán duplicados antes de insertar): {e}")
+    return _user_indexes_ready
+
+def find_existing_user(users_collection, username, email=None):
+    """Usuario con el mismo username o email (comprobación previa cuando faltan los índices únicos)"""
+    conditions = [{"username": username}]
+    if email:
+        conditions.append({"email": email})
+    return users_collection.find_one({"$or": conditions}, {"_id": 1})
+
+def duplicate_key_field(error):
+    """Campo que provocó un DuplicateKeyError ('username', 'email' o None)"""
+    details = getattr(error, 'details', None) or {}
+    key_pattern = details.get('keyPattern') or details.get('keyValue') or {}
+    for field in ('username', 'email'):
+        if field in key_pattern:
+            return field
+    message = str(error)
+    for field in ('username', 'email'):
+        if field in message:
+            return field
+    return None
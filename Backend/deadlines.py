@@ -0,0 +1,119 @@
+# deadlines.py - Propagación del deadline de cada petición (gateway -> servicios -> MongoDB)
+"""
+El gateway asigna a cada petición un presupuesto de tiempo según la ruta y lo envía a
+los servicios en la cabecera X-Request-Timeout-Ms con los milisegundos que quedan
+(relativo, así no depende de que los relojes de las máquinas coincidan).
+
+Cada servicio:
+- responde 504 al momento si la petición llega con el presupuesto ya agotado (el
+  gateway ha dejado de esperarla, p. ej. tras hacer cola en gunicorn);
+- ejecuta la vista dentro de pymongo.timeout(): cada operación de MongoDB recibe un
+  maxTimeMS y un timeout de socket ajustados a lo que queda, de modo que una consulta
+  lenta se cancela en el servidor en lugar de seguir ocupando Atlas sin nadie esperando.
+
+Sin cabecera (llamadas directas al servicio) se aplica SERVICE_REQUEST_TIMEOUT_MS.
+"""
+
+import os
+import time
+
+from flask import g, jsonify, request
+
+DEADLINE_HEADER = 'X-Request-Timeout-Ms'
+SERVICE_REQUEST_TIMEOUT_MS = int(os.getenv('SERVICE_REQUEST_TIMEOUT_MS', 30000))
+# Por debajo de este margen no merece la pena empezar trabajo nuevo
+DEADLINE_MIN_REMAINING_MS = int(os.getenv('DEADLINE_MIN_REMAINING_MS', 20))
+
+
+class Deadline:
+    """Instante límite de una petición sobre el reloj monotónico del proceso"""
+
+    def __init__(self, budget_ms):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000
+
+    def remaining_ms(self):
+        return max(0, int((self.expires_at - time.monotonic()) * 1000))
+
+    def remaining_seconds(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining_ms() <= DEADLINE_MIN_REMAINING_MS
+
+    def header_value(self):
+        return str(self.remaining_ms())
+
+
+def parse_deadline_header(headers):
+    """Presupuesto en ms de la cabecera (None si falta o no es un entero válido)"""
+    value = headers.get(DEADLINE_HEADER)
+    if value is None:
+        return None
+    try:
+        return max(0, int(value))
+    except ValueError:
+        return None
+
+
+def current_deadline():
+    """Deadline de la petición en curso (None fuera de una petición con deadline)"""
+    return getattr(g, 'deadline', None)
+
+
+def remaining_ms():
+    """Milisegundos que quedan para la petición en curso (None si no hay deadline)"""
+    deadline = current_deadline()
+    return deadline.remaining_ms() if deadline is not None else None
+
+
+def deadline_exceeded_response():
+    response = jsonify({"error": "Tiempo de la petición agotado"})
+    response.status_code = 504
+    return response
+
+
+def init_deadlines(app, default_ms=SERVICE_REQUEST_TIMEOUT_MS):
+    """Leer el deadline de cada petición y aplicarlo a las operaciones de MongoDB"""
+    # Import diferido: el gateway usa este módulo sin cargar pymongo
+    try:
+        import pymongo
+        from pymongo.errors import PyMongoError
+    except ImportError:
+        pymongo = None
+        PyMongoError = None
+
+    @app.before_request
+    def start_deadline():
+        budget_ms = parse_deadline_header(request.headers)
+        g.deadline = Deadline(default_ms if budget_ms is None else min(budget_ms, default_ms))
+        if request.method != 'OPTIONS' and g.deadline.expired():
+            print(f"⌛ [DEADLINE] {request.method} {request.path} llegó sin presupuesto, descartada")
+            return deadline_exceeded_response()
+        if pymongo is not None:
+            # Timeout del lado del cliente: maxTimeMS y timeout de socket de cada operación
+            g.mongo_timeout = pymongo.timeout(g.deadline.remaining_seconds())
+            g.mongo_timeout.__enter__()
+        return None
+
+    @app.after_request
+    def mark_deadline_exceeded(response):
+        # Las vistas capturan las excepciones y devuelven 500; si el motivo fue el deadline, 504
+        deadline = current_deadline()
+        if response.status_code == 500 and deadline is not None and deadline.expired():
+            response.status_code = 504
+        return response
+
+    @app.teardown_request
+    def finish_deadline(error=None):
+        mongo_timeout = g.pop('mongo_timeout', None)
+        if mongo_timeout is not None:
+            mongo_timeout.__exit__(None, None, None)
+
+    if PyMongoError is not None:
+        @app.errorhandler(PyMongoError)
+        def mongo_error(error):
+            # maxTimeMS, timeout de socket o timeout del cliente (CSOT)
+            if error.timeout:
+                return deadline_exceeded_response()
+            return jsonify({"error": f"Error de base de datos: {str(error)}"}), 500
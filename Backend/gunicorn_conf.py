@@ -0,0 +1,29 @@
+# gunicorn_conf.py - Configuración compartida de gunicorn para los servicios MongoDB
+"""
+La aplicación se carga una sola vez en el proceso maestro (preload_app) y los
+workers se crean con fork, de modo que no repiten las importaciones al arrancar.
+La conexión a MongoDB no es segura ante fork: cada worker la abre en segundo
+plano justo después de crearse (post_fork), y arranca ahí también sus hilos de
+sondas de salud.
+"""
+import os
+
+preload_app = True
+timeout = 120
+keepalive = 5
+max_requests = 1000
+max_requests_jitter = 100
+
+def post_fork(server, worker):
+    """Precalentar la conexión a MongoDB del worker y arrancar sus sondas de salud"""
+    if os.environ.get('MONGO_WARMUP', 'true').lower() == 'true':
+        try:
+            from database_mongo import mongo_db
+            mongo_db.warm_up()
+        except Exception as e:
+            server.log.warning(f"No se pudo precalentar MongoDB: {e}")
+    try:
+        from health_probes import start_monitors
+        start_monitors()
+    except Exception as e:
+        server.log.warning(f"No se pudieron arrancar las sondas de salud: {e}")
@@ -0,0 +1,130 @@
+# health_probes.py - Liveness y readiness con sondas de dependencias en caché
+"""
+/livez  -> el proceso responde (sin tocar dependencias)
+/readyz -> último resultado de las sondas de dependencias (MongoDB, servicios upstream)
+
+Las sondas se ejecutan en un hilo de fondo cada `interval` segundos; las peticiones de
+health solo leen el último resultado, así que nunca abren conexiones ni esperan a un
+Atlas lento. El hilo arranca en cada worker justo después del fork (post_fork de
+gunicorn_conf.py llama a start_monitors), de modo que /readyz ya tiene resultados
+cuando llega el primer chequeo de Render.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+from flask import jsonify
+
+HEALTH_INTERVAL_SECONDS = int(os.getenv('HEALTH_INTERVAL_SECONDS', 15))
+HEALTH_PROBE_TIMEOUT_SECONDS = float(os.getenv('HEALTH_PROBE_TIMEOUT_SECONDS', 2))
+
+# Monitores creados en el proceso, para arrancarlos desde post_fork
+_monitors = []
+
+
+def start_monitors():
+    """Arrancar el sondeo de todos los monitores del proceso (llamar tras el fork)"""
+    for monitor in list(_monitors):
+        monitor.start()
+
+
+class HealthMonitor:
+    """Ejecuta periódicamente las sondas registradas y guarda su último resultado"""
+
+    def __init__(self, service_name, interval=HEALTH_INTERVAL_SECONDS):
+        self.service_name = service_name
+        self.interval = interval
+        self.started_at = time.time()
+        self._probes = {}
+        self._results = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        _monitors.append(self)
+
+    def add_probe(self, name, probe, critical=True):
+        """Registrar una sonda: función sin argumentos que lanza excepción si la dependencia falla"""
+        self._probes[name] = (probe, critical)
+        self._results[name] = {
+            "status": "UNKNOWN",
+            "critical": critical,
+            "latency_ms": None,
+            "error": None,
+            "checked_at": None
+        }
+
+    def start(self):
+        """Arrancar el hilo de sondeo (idempotente; tras el fork de gunicorn)"""
+        with self._lock:
+            # Un hilo arrancado antes del fork no existe en el worker
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='health-monitor', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            for name, (probe, critical) in list(self._probes.items()):
+                start = time.perf_counter()
+                try:
+                    probe()
+                    status, error = "UP", None
+                except Exception as e:
+                    status, error = "DOWN", str(e)
+                result = {
+                    "status": status,
+                    "critical": critical,
+                    "latency_ms": round((time.perf_counter() - start) * 1000, 2),
+                    "error": error,
+                    "checked_at": datetime.utcnow().isoformat()
+                }
+                with self._lock:
+                    self._results[name] = result
+            time.sleep(self.interval)
+
+    def snapshot(self):
+        """Último estado conocido; ready solo si todas las dependencias críticas están UP"""
+        # Respaldo fuera de gunicorn (sin post_fork): arrancar con la primera consulta
+        self.start()
+        with self._lock:
+            dependencies = {name: dict(result) for name, result in self._results.items()}
+        ready = all(dep["status"] == "UP" for dep in dependencies.values() if dep["critical"])
+        return {
+            "status": "READY" if ready else "NOT_READY",
+            "service": self.service_name,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "dependencies": dependencies
+        }
+
+
+def mongo_probe(mongo_db, timeout=HEALTH_PROBE_TIMEOUT_SECONDS):
+    """Sonda de MongoDB sobre el cliente compartido del proceso (nunca crea uno por sonda)"""
+    # Import diferido: el gateway usa este módulo sin cargar pymongo
+    import pymongo
+
+    def probe():
+        client = mongo_db.client
+        if client is None:
+            # Relanzar el precalentamiento del cliente compartido y reportar DOWN mientras tanto
+            mongo_db.warm_up()
+            raise RuntimeError("MongoDB aún no conectado")
+        # Acota selección de servidor, socket y maxTimeMS: un Atlas colgado no bloquea el hilo
+        with pymongo.timeout(timeout):
+            client.admin.command('ping')
+    return probe
+
+
+def register_health_routes(app, monitor):
+    """Añadir /livez y /readyz a una app Flask"""
+
+    @app.route('/livez', methods=['GET'])
+    def livez():
+        return jsonify({"status": "UP", "service": monitor.service_name}), 200
+
+    @app.route('/readyz', methods=['GET'])
+    def readyz():
+        snapshot = monitor.snapshot()
+        return jsonify(snapshot), 200 if snapshot["status"] == "READY" else 503
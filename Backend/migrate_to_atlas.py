@@ -1,7 +1,32 @@
 # migrate_to_atlas.py - Migrar datos de MongoDB local a MongoDB Atlas
+"""
+Migración en streaming de MongoDB local a Atlas.
+
+- Lectura por lotes con un cursor ordenado por _id (nunca se carga la colección entera).
+- Los índices de Atlas se crean antes de migrar: los únicos de users y roles impiden
+  duplicados y el de (name, created_by) sirve a la deduplicación de tareas.
+- Escritura por lotes con bulk_write desordenado de upserts ($setOnInsert por clave
+  natural: username, (name, created_by) o name): un round trip por lote, idempotente
+  al reanudar y sin duplicar lo que ya existía en Atlas con otro _id (p. ej. tareas
+  migradas con versiones anteriores del script, que no conservaban el _id).
+- Los lotes se escriben en paralelo en un pool de hilos.
+- Checkpoint en disco (MIGRATION_CHECKPOINT_FILE): una ejecución interrumpida se
+  reanuda desde el último lote confirmado.
+- Verificación final: conteos y checksum por colección en local y en Atlas.
+
+Uso:
+    python migrate_to_atlas.py [--batch-size 500] [--workers 4] [--reset] [--verify-only]
+"""
+import argparse
+import hashlib
 import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import AutoReconnect, BulkWriteError
+from bson import ObjectId, json_util
 from datetime import datetime
 import bcrypt
 import pyotp
@@ -9,8 +34,88 @@ import pyotp
 # Cargar variables de entorno
 load_dotenv('.env.atlas')
 
+MIGRATION_CHECKPOINT_FILE = os.getenv('MIGRATION_CHECKPOINT_FILE', '.migrate_atlas_checkpoint.json')
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_WORKERS = 4
+BATCH_RETRIES = 3
+DUPLICATE_KEY_ERROR = 11000
+
+def default_created_at(doc):
+    """Fecha de creación del documento, o la del _id si no la tiene (determinista al reanudar)"""
+    if doc.get('created_at'):
+        return doc['created_at']
+    if isinstance(doc.get('_id'), ObjectId):
+        return doc['_id'].generation_time.replace(tzinfo=None)
+    return datetime.utcnow()
+
+def transform_user(user):
+    """Preparar usuario para Atlas"""
+    atlas_user = {
+        "_id": user['_id'],
+        "username": user['username'],
+        "email": user.get('email'),
+        "password": user['password'],
+        "role": user.get('role', 'user'),
+        "otp_secret": user.get('otp_secret'),
+        "require_otp": user.get('require_otp', True),
+        "created_at": default_created_at(user)
+    }
+    if user.get('updated_at'):
+        atlas_user['updated_at'] = user['updated_at']
+    return atlas_user
+
+def transform_task(task):
+    """Preparar tarea para Atlas"""
+    atlas_task = {
+        "_id": task['_id'],
+        "name": task['name'],
+        "name_lower": task['name'].lower(),
+        "description": task.get('description', ''),
+        "deadline": task.get('deadline'),
+        "status": task.get('status', 'In Progress'),
+        "created_by": task.get('created_by'),
+        "created_by_username": task.get('created_by_username'),
+        "created_at": default_created_at(task),
+        "is_alive": True
+    }
+    if task.get('updated_at'):
+        atlas_task['updated_at'] = task['updated_at']
+    return atlas_task
+
+def transform_role(role):
+    """Preparar rol para Atlas"""
+    return {
+        "_id": role['_id'],
+        "name": role['name'],
+        "description": role.get('description', '')
+    }
+
+# colección -> (filtro en local, transformación, clave natural en Atlas)
+MIGRATION_SPECS = {
+    'users': ({}, transform_user, ('username',)),
+    'tasks': ({"is_alive": True}, transform_task, ('name', 'created_by')),
+    'roles': ({}, transform_role, ('name',))
+}
+
+def document_digest(doc):
+    """Hash canónico de un documento (claves ordenadas, tipos BSON en JSON extendido)"""
+    canonical = json_util.dumps(doc, sort_keys=True)
+    return int.from_bytes(hashlib.sha256(canonical.encode('utf-8')).digest()[:16], 'big')
+
+def iter_batches(cursor, batch_size, transform):
+    """Agrupar el cursor en lotes ya transformados"""
+    batch = []
+    for doc in cursor:
+        batch.append(transform(doc))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 class AtlasMigrator:
-    def __init__(self):
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, workers=DEFAULT_WORKERS,
+                 checkpoint_file=MIGRATION_CHECKPOINT_FILE):
         # MongoDB Local
         self.local_uri = 'mongodb://localhost:27017/'
         self.local_db_name = 'task_management'
@@ -24,6 +129,13 @@ class AtlasMigrator:
         self.atlas_client = None
         self.local_db = None
         self.atlas_db = None
+        
+        # Lotes y paralelismo
+        self.batch_size = batch_size
+        self.workers = workers
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint = {}
+        self._checkpoint_lock = threading.Lock()
     
     def connect_local(self):
         """Conectar a MongoDB local"""
@@ -42,7 +154,8 @@ class AtlasMigrator:
         """Conectar a MongoDB Atlas"""
         try:
             print("🌐 Conectando a MongoDB Atlas...")
-            self.atlas_client = MongoClient(self.atlas_uri)
+            # Una conexión por hilo de escritura, más margen para la verificación
+            self.atlas_client = MongoClient(self.atlas_uri, maxPoolSize=max(self.workers * 2, 10))
             self.atlas_db = self.atlas_client[self.atlas_db_name]
             self.atlas_client.admin.command('ismaster')
             print("✅ Conexión a MongoDB Atlas exitosa")
@@ -51,179 +164,283 @@ class AtlasMigrator:
             print(f"❌ Error conectando a MongoDB Atlas: {e}")
             return False
     
-    def migrate_users(self):
-        """Migrar usuarios de local a Atlas"""
-        try:
-            print("\n👥 Migrando usuarios...")
-            
-            # Obtener usuarios de local
-            local_users = list(self.local_db.users.find({}))
-            print(f"   Usuarios encontrados en local: {len(local_users)}")
-            
-            # Migrar cada usuario
-            migrated_count = 0
-            for user in local_users:
+    # ---------- Checkpoint ----------
+    
+    def load_checkpoint(self, reset=False):
+        """Cargar el checkpoint de una ejecución anterior (o empezar de cero con reset)"""
+        if reset and os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+        if os.path.exists(self.checkpoint_file):
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                self.checkpoint = json_util.loads(f.read())
+            print(f"♻️ Reanudando desde el checkpoint {self.checkpoint_file}")
+        else:
+            self.checkpoint = {}
+    
+    def save_checkpoint(self):
+        """Guardar el checkpoint de forma atómica (escribir y renombrar)"""
+        with self._checkpoint_lock:
+            tmp_file = f"{self.checkpoint_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                f.write(json_util.dumps(self.checkpoint))
+            os.replace(tmp_file, self.checkpoint_file)
+    
+    def clear_checkpoint(self):
+        if os.path.exists(self.checkpoint_file):
+            os.remove(self.checkpoint_file)
+    
+    # ---------- Migración por lotes ----------
+    
+    def _write_batch(self, collection, docs):
+        """Upsert de un lote en Atlas; devuelve (insertados, ya_existentes, fallidos)"""
+        natural_key = MIGRATION_SPECS[collection][2]
+        # Si ya hay un documento con la misma clave natural no se toca; si no, se
+        # inserta conservando el _id local
+        operations = [
+            UpdateOne(
+                {key: doc.get(key) for key in natural_key},
+                {"$setOnInsert": doc},
+                upsert=True
+            )
+            for doc in docs
+        ]
+        for attempt in range(1, BATCH_RETRIES + 1):
+            try:
+                result = self.atlas_db[collection].bulk_write(operations, ordered=False)
+                return result.upserted_count, len(docs) - result.upserted_count, 0
+            except BulkWriteError as e:
+                # Desordenado: el resto del lote se aplicó; los duplicados (p. ej. mismo
+                # username con otro _id ya en Atlas) se cuentan como existentes
+                errors = e.details.get('writeErrors', [])
+                duplicates = sum(1 for error in errors if error.get('code') == DUPLICATE_KEY_ERROR)
+                failed = len(errors) - duplicates
+                for error in errors:
+                    if error.get('code') != DUPLICATE_KEY_ERROR:
+                        print(f"\n   ❌ Error migrando documento {error.get('op', {}).get('q')}: {error.get('errmsg')}")
+                inserted = e.details.get('nUpserted', 0)
+                return inserted, len(docs) - inserted - failed, failed
+            except AutoReconnect:
+                if attempt == BATCH_RETRIES:
+                    raise
+                time.sleep(2 ** attempt)
+    
+    def migrate_collection(self, collection):
+        """Migrar una colección en lotes paralelos; devuelve los documentos insertados"""
+        query, transform, _ = MIGRATION_SPECS[collection]
+        state = self.checkpoint.setdefault(collection, {
+            "last_id": None, "migrated": 0, "skipped": 0, "failed": 0, "done": False
+        })
+        if state['done']:
+            print(f"   ⏭️ {collection} ya migrada en una ejecución anterior ({state['migrated']} documentos)")
+            return state['migrated']
+        
+        if state['last_id'] is not None:
+            query = {"$and": [query, {"_id": {"$gt": state['last_id']}}]}
+        
+        total = self.local_db[collection].count_documents(query)
+        print(f"   Documentos pendientes en local: {total}")
+        cursor = self.local_db[collection].find(query).sort("_id", 1).batch_size(self.batch_size)
+        
+        pending = {}
+        completed = {}
+        next_to_commit = 0
+        processed = 0
+        aborted = False
+        start = time.perf_counter()
+        
+        def collect(return_when):
+            nonlocal next_to_commit, processed, aborted
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                sequence, last_id, size = pending.pop(future)
                 try:
-                    # Verificar si el usuario ya existe en Atlas
-                    existing_user = self.atlas_db.users.find_one({
-                        "$or": [
-                            {"username": user['username']},
-                            {"email": user.get('email')}
-                        ]
-                    })
-                    
-                    if existing_user:
-                        print(f"   ⚠️ Usuario {user['username']} ya existe en Atlas, saltando...")
-                        continue
-                    
-                    # Preparar usuario para Atlas
-                    atlas_user = {
-                        "username": user['username'],
-                        "email": user.get('email'),
-                        "password": user['password'],
-                        "role": user.get('role', 'user'),
-                        "otp_secret": user.get('otp_secret'),
-                        "require_otp": user.get('require_otp', True),
-                        "created_at": user.get('created_at', datetime.utcnow())
-                    }
-                    
-                    # Insertar en Atlas
-                    result = self.atlas_db.users.insert_one(atlas_user)
-                    print(f"   ✅ Usuario {user['username']} migrado (ID: {result.inserted_id})")
-                    migrated_count += 1
-                    
+                    inserted, skipped, failed = future.result()
                 except Exception as e:
-                    print(f"   ❌ Error migrando usuario {user['username']}: {e}")
+                    print(f"\n   ❌ Error escribiendo lote {sequence} de {collection}: {e}")
+                    aborted = True
+                    continue
+                state['migrated'] += inserted
+                state['skipped'] += skipped
+                state['failed'] += failed
+                processed += size
+                completed[sequence] = last_id
             
-            print(f"   🎉 Usuarios migrados exitosamente: {migrated_count}")
-            return migrated_count
+            # El checkpoint solo avanza hasta el último lote contiguo confirmado:
+            # los lotes terminan en desorden y al reanudar no debe quedar ningún hueco
+            while next_to_commit in completed:
+                state['last_id'] = completed.pop(next_to_commit)
+                next_to_commit += 1
+            self.save_checkpoint()
             
-        except Exception as e:
-            print(f"❌ Error en migración de usuarios: {e}")
-            return 0
+            elapsed = time.perf_counter() - start
+            rate = processed / elapsed if elapsed > 0 else 0
+            percent = processed * 100 / total if total else 100
+            print(f"\r   ⏳ {processed}/{total} ({percent:.0f}%) · {rate:.0f} docs/s", end='', flush=True)
+        
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for sequence, batch in enumerate(iter_batches(cursor, self.batch_size, transform)):
+                if aborted:
+                    break
+                future = executor.submit(self._write_batch, collection, batch)
+                pending[future] = (sequence, batch[-1]['_id'], len(batch))
+                # Memoria acotada: como mucho dos lotes en vuelo por hilo
+                if len(pending) >= self.workers * 2:
+                    collect(FIRST_COMPLETED)
+            while pending:
+                collect(FIRST_COMPLETED)
+        cursor.close()
+        print()
+        
+        if aborted:
+            print(f"   ⚠️ Migración de {collection} interrumpida; vuelve a ejecutar para reanudar")
+            return state['migrated']
+        
+        state['done'] = True
+        self.save_checkpoint()
+        elapsed = time.perf_counter() - start
+        print(f"   🎉 {collection}: {state['migrated']} insertados, {state['skipped']} ya existían, "
+              f"{state['failed']} con error · {elapsed:.1f}s")
+        return state['migrated']
+    
+    def migrate_users(self):
+        """Migrar usuarios de local a Atlas"""
+        print("\n👥 Migrando usuarios...")
+        return self.migrate_collection('users')
     
     def migrate_tasks(self):
         """Migrar tareas de local a Atlas"""
-        try:
-            print("\n📋 Migrando tareas...")
-            
-            # Obtener tareas de local
-            local_tasks = list(self.local_db.tasks.find({"is_alive": True}))
-            print(f"   Tareas encontradas en local: {len(local_tasks)}")
-            
-            # Migrar cada tarea
-            migrated_count = 0
-            for task in local_tasks:
-                try:
-                    # Verificar si la tarea ya existe en Atlas
-                    existing_task = self.atlas_db.tasks.find_one({
-                        "name": task['name'],
-                        "created_by": task.get('created_by')
-                    })
-                    
-                    if existing_task:
-                        print(f"   ⚠️ Tarea '{task['name']}' ya existe en Atlas, saltando...")
-                        continue
-                    
-                    # Preparar tarea para Atlas
-                    atlas_task = {
-                        "name": task['name'],
-                        "description": task.get('description', ''),
-                        "deadline": task.get('deadline'),
-                        "status": task.get('status', 'In Progress'),
-                        "created_by": task.get('created_by'),
-                        "created_by_username": task.get('created_by_username'),
-                        "created_at": task.get('created_at', datetime.utcnow()),
-                        "is_alive": True
-                    }
-                    
-                    # Insertar en Atlas
-                    result = self.atlas_db.tasks.insert_one(atlas_task)
-                    print(f"   ✅ Tarea '{task['name']}' migrada (ID: {result.inserted_id})")
-                    migrated_count += 1
-                    
-                except Exception as e:
-                    print(f"   ❌ Error migrando tarea '{task['name']}': {e}")
-            
-            print(f"   🎉 Tareas migradas exitosamente: {migrated_count}")
-            return migrated_count
-            
-        except Exception as e:
-            print(f"❌ Error en migración de tareas: {e}")
-            return 0
+        print("\n📋 Migrando tareas...")
+        return self.migrate_collection('tasks')
     
     def migrate_roles(self):
         """Migrar roles de local a Atlas"""
-        try:
-            print("\n🔐 Migrando roles...")
-            
-            # Obtener roles de local
-            local_roles = list(self.local_db.roles.find({}))
-            print(f"   Roles encontrados en local: {len(local_roles)}")
-            
-            # Migrar cada rol
-            migrated_count = 0
-            for role in local_roles:
-                try:
-                    # Verificar si el rol ya existe en Atlas
-                    existing_role = self.atlas_db.roles.find_one({
-                        "name": role['name']
-                    })
-                    
-                    if existing_role:
-                        print(f"   ⚠️ Rol '{role['name']}' ya existe en Atlas, saltando...")
-                        continue
-                    
-                    # Preparar rol para Atlas
-                    atlas_role = {
-                        "name": role['name'],
-                        "description": role.get('description', '')
-                    }
-                    
-                    # Insertar en Atlas
-                    result = self.atlas_db.roles.insert_one(atlas_role)
-                    print(f"   ✅ Rol '{role['name']}' migrado (ID: {result.inserted_id})")
-                    migrated_count += 1
-                    
-                except Exception as e:
-                    print(f"   ❌ Error migrando rol '{role['name']}': {e}")
-            
-            print(f"   🎉 Roles migrados exitosamente: {migrated_count}")
-            return migrated_count
-            
-        except Exception as e:
-            print(f"❌ Error en migración de roles: {e}")
-            return 0
+        print("\n🔐 Migrando roles...")
+        return self.migrate_collection('roles')
+    
+    # ---------- Verificación ----------
+    
+    def _verify_batch(self, collection, docs):
+        """Comparar un lote local con Atlas; devuelve (checksum_local, checksum_atlas, encontrados, distintos)"""
+        fields = {key: 1 for doc in docs for key in doc}
+        atlas_docs = {
+            doc['_id']: doc
+            for doc in self.atlas_db[collection].find({"_id": {"$in": [doc['_id'] for doc in docs]}}, fields)
+        }
+        local_checksum = 0
+        atlas_checksum = 0
+        found = 0
+        different = 0
+        for doc in docs:
+            local_digest = document_digest(doc)
+            local_checksum ^= local_digest
+            atlas_doc = atlas_docs.get(doc['_id'])
+            if atlas_doc is None:
+                different += 1
+                continue
+            found += 1
+            # Comparar solo los campos que migra el script
+            atlas_digest = document_digest({key: atlas_doc.get(key) for key in doc})
+            atlas_checksum ^= atlas_digest
+            if atlas_digest != local_digest:
+                different += 1
+        return local_checksum, atlas_checksum, found, different
+    
+    def verify_collection(self, collection):
+        """Conteos y checksum (XOR de hashes, independiente del orden) de local frente a Atlas"""
+        query, transform, _ = MIGRATION_SPECS[collection]
+        local_count = 0
+        local_checksum = 0
+        atlas_checksum = 0
+        found = 0
+        different = 0
+        
+        cursor = self.local_db[collection].find(query).sort("_id", 1).batch_size(self.batch_size)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = set()
+            results = []
+            for batch in iter_batches(cursor, self.batch_size, transform):
+                local_count += len(batch)
+                pending.add(executor.submit(self._verify_batch, collection, batch))
+                if len(pending) >= self.workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    results.extend(future.result() for future in done)
+            results.extend(future.result() for future in pending)
+        cursor.close()
+        
+        for batch_local, batch_atlas, batch_found, batch_different in results:
+            local_checksum ^= batch_local
+            atlas_checksum ^= batch_atlas
+            found += batch_found
+            different += batch_different
+        
+        ok = different == 0 and local_checksum == atlas_checksum
+        print(f"   {'✅' if ok else '⚠️'} {collection}: local={local_count} atlas={found} "
+              f"distintos={different} checksum local={local_checksum:032x}")
+        if not ok:
+            print(f"      checksum atlas={atlas_checksum:032x} "
+                  f"(los documentos que ya existían en Atlas con otro _id cuentan como distintos)")
+        return ok
+    
+    def verify_migration(self):
+        """Verificar todas las colecciones migradas"""
+        print("\n🔎 Verificando migración (conteos y checksums)...")
+        return all([self.verify_collection(collection) for collection in MIGRATION_SPECS])
     
     def create_indices(self):
-        """Crear índices en MongoDB Atlas"""
+        """Crear índices en MongoDB Atlas (antes de migrar); devuelve False si alguno falla"""
         try:
             print("\n📊 Creando índices en Atlas...")
             
             # Índices para usuarios
             self.atlas_db.users.create_index("username", unique=True)
-            self.atlas_db.users.create_index("email", unique=True)
+            # Un índice único de email ya existente (email_1 de versiones anteriores) sirve
+            email_indexes = [
+                info for info in self.atlas_db.users.index_information().values()
+                if info.get('unique') and [key for key, _ in info['key']] == ['email']
+            ]
+            if not email_indexes:
+                self.atlas_db.users.create_index(
+                    "email",
+                    unique=True,
+                    name="email_unique",
+                    partialFilterExpression={"email": {"$type": "string"}}
+                )
             print("   ✅ Índices de usuarios creados")
             
             # Índices para tareas
             self.atlas_db.tasks.create_index("created_by")
             self.atlas_db.tasks.create_index("status")
             self.atlas_db.tasks.create_index("created_at")
+            # Clave natural con la que se deduplican las tareas al migrar
+            self.atlas_db.tasks.create_index([("name", 1), ("created_by", 1)], name="name_created_by")
+            self.atlas_db.tasks.create_index([("updated_at", 1), ("_id", 1)], name="updated_at_id")
+            self.atlas_db.tasks.create_index(
+                [("name", "text"), ("description", "text")],
+                name="name_description_text",
+                weights={"name": 10, "description": 1},
+                default_language="spanish"
+            )
+            self.atlas_db.tasks.create_index([("is_alive", 1), ("name_lower", 1)], name="alive_name_lower")
             print("   ✅ Índices de tareas creados")
             
             # Índices para roles
             self.atlas_db.roles.create_index("name", unique=True)
+            self.atlas_db.users.create_index("updated_at")
+            self.atlas_db.roles.create_index("updated_at")
             print("   ✅ Índices de roles creados")
             
             print("   🎉 Todos los índices creados exitosamente")
-            
+            return True
+        
         except Exception as e:
             print(f"❌ Error creando índices: {e}")
+            return False
     
-    def run_migration(self):
+    def run_migration(self, reset=False, verify_only=False):
         """Ejecutar migración completa"""
         print("🚀 INICIANDO MIGRACIÓN A MONGODB ATLAS")
         print("=" * 50)
+        print(f"   Lotes de {self.batch_size} documentos · {self.workers} hilos de escritura")
         
         # Conectar a ambas bases de datos
         if not self.connect_local():
@@ -233,13 +450,30 @@ class AtlasMigrator:
             return False
         
         try:
+            if verify_only:
+                return self.verify_migration()
+            
+            self.load_checkpoint(reset)
+            start = time.perf_counter()
+            
+            # Índices primero: sin los únicos, la migración podría crear duplicados
+            if not self.create_indices():
+                print("\n⚠️ Migración cancelada: revisa los índices de Atlas (¿duplicados previos?)")
+                return False
+            
             # Migrar datos
             users_migrated = self.migrate_users()
             tasks_migrated = self.migrate_tasks()
             roles_migrated = self.migrate_roles()
             
-            # Crear índices
-            self.create_indices()
+            if not all(self.checkpoint.get(collection, {}).get('done') for collection in MIGRATION_SPECS):
+                print("\n⚠️ Migración incompleta; el checkpoint permite reanudarla")
+                return False
+            
+            verified = self.verify_migration()
+            elapsed = time.perf_counter() - start
+            total = sum(self.checkpoint[collection]['migrated'] + self.checkpoint[collection]['skipped']
+                        for collection in MIGRATION_SPECS)
             
             print("\n" + "=" * 50)
             print("🎉 MIGRACIÓN COMPLETADA EXITOSAMENTE")
@@ -247,10 +481,13 @@ class AtlasMigrator:
             print(f"   👥 Usuarios migrados: {users_migrated}")
             print(f"   📋 Tareas migradas: {tasks_migrated}")
             print(f"   🔐 Roles migrados: {roles_migrated}")
+            print(f"   ⏱️ {total} documentos en {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} docs/s)")
+            print(f"   🔎 Verificación: {'OK' if verified else 'con diferencias'}")
             print("=" * 50)
             
+            self.clear_checkpoint()
             return True
-            
+        
         except Exception as e:
             print(f"❌ Error durante la migración: {e}")
             return False
@@ -265,13 +502,24 @@ class AtlasMigrator:
 
 def main():
     """Función principal"""
+    parser = argparse.ArgumentParser(description='Migrar datos de MongoDB local a MongoDB Atlas')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                       help=f'Documentos por lote (default: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                       help=f'Hilos de escritura en paralelo (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--reset', action='store_true',
+                       help='Ignorar el checkpoint y empezar desde el principio')
+    parser.add_argument('--verify-only', action='store_true',
+                       help='Solo comparar conteos y checksums entre local y Atlas')
+    args = parser.parse_args()
+    
     if not os.path.exists('.env.atlas'):
         print("❌ Archivo .env.atlas no encontrado")
         print("📝 Crea el archivo .env.atlas basándote en env_atlas_example.txt")
         return
     
-    migrator = AtlasMigrator()
-    success = migrator.run_migration()
+    migrator = AtlasMigrator(batch_size=args.batch_size, workers=args.workers)
+    success = migrator.run_migration(reset=args.reset, verify_only=args.verify_only)
     
     if success:
         print("\n✅ La migración se completó exitosamente")
@@ -0,0 +1,215 @@
+# mysql_pool.py - Pool de conexiones MySQL compartido por los servicios MySQL
+"""
+Pool de conexiones para los servicios respaldados por MySQL (task/user/auth app.py).
+
+- Tamaño configurable (DB_POOL_SIZE) y espera acotada al pedir conexión (DB_POOL_TIMEOUT).
+- Comprobación de salud al sacar del pool: ping si la conexión lleva ociosa más de
+  DB_POOL_PING_AFTER segundos; si falla, se descarta y se abre otra.
+- Conexión por petición: dentro de una petición Flask todas las llamadas a
+  get_connection() reutilizan la misma conexión, que vuelve al pool al terminar.
+  Solo en las apps registradas con init_app() (que instala el teardown); en el resto
+  cada llamada entrega una conexión propia que vuelve al pool con close(). Cada pool
+  guarda su conexión de petición en su propia clave de `g`.
+- Métricas de espera (stats()) para exponer en /health.
+
+Las conexiones devueltas mantienen la API de mysql.connector: el código existente
+puede seguir llamando a connection.close(), que devuelve la conexión al pool.
+"""
+
+import os
+import queue
+import threading
+import time
+import weakref
+
+import mysql.connector
+from mysql.connector import Error
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))
+DB_POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', 30))
+
+
+class PooledConnection:
+    """Envoltorio de una conexión del pool; close() la devuelve en lugar de cerrarla"""
+
+    def __init__(self, pool, connection, scoped=False):
+        self._pool = pool
+        self._connection = connection
+        self._scoped = scoped
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def close(self):
+        # Las conexiones de petición se devuelven en el teardown de Flask
+        if self._scoped or self._released:
+            return
+        self._released = True
+        self._pool.release(self._connection)
+
+
+class MySQLPool:
+    """Pool LIFO de conexiones mysql.connector con métricas de espera"""
+
+    def __init__(self, db_config, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, ping_after=DB_POOL_PING_AFTER):
+        self.db_config = dict(db_config)
+        self.size = size
+        self.timeout = timeout
+        self.ping_after = ping_after
+        # Clave propia en `g`: dos pools en la misma app no se pisan la conexión de petición
+        self._g_key = f"_mysql_connection_{id(self)}"
+        # Apps con el teardown de este pool registrado (init_app)
+        self._apps = weakref.WeakSet()
+
+        # LIFO: reutilizar la conexión más reciente mantiene calientes las mismas conexiones
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+            'timeouts': 0,
+            'health_check_failures': 0,
+            'connections_created': 0
+        }
+
+    # ---------- Checkout / release ----------
+
+    def acquire(self):
+        """Obtener una conexión sana del pool (espera hasta `timeout` si está agotado)"""
+        start = time.perf_counter()
+        waited = False
+        while True:
+            connection = self._take_idle()
+            if connection is None:
+                connection = self._create_if_allowed()
+            if connection is None:
+                waited = True
+                remaining = self.timeout - (time.perf_counter() - start)
+                if remaining <= 0:
+                    self._record_checkout(start, waited, timed_out=True)
+                    raise Error(msg=f"Pool de conexiones agotado ({self.size}) tras {self.timeout}s")
+                try:
+                    connection = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    continue
+
+            if self._is_healthy(connection):
+                self._record_checkout(start, waited)
+                return connection
+
+            self._discard(connection)
+
+    def release(self, connection):
+        """Devolver una conexión al pool, deshaciendo cualquier transacción abierta"""
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+            connection._pool_last_used = time.monotonic()
+            self._idle.put(connection)
+        except Exception:
+            self._discard(connection)
+
+    def _take_idle(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _create_if_allowed(self):
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+        try:
+            connection = mysql.connector.connect(**self.db_config)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        connection._pool_last_used = time.monotonic()
+        with self._lock:
+            self._stats['connections_created'] += 1
+        return connection
+
+    def _is_healthy(self, connection):
+        # Ping solo si la conexión lleva tiempo ociosa: evita un round trip por petición
+        if time.monotonic() - getattr(connection, '_pool_last_used', 0) < self.ping_after:
+            return True
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception:
+            with self._lock:
+                self._stats['health_check_failures'] += 1
+            return False
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    def _record_checkout(self, start, waited, timed_out=False):
+        wait_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            if timed_out:
+                self._stats['timeouts'] += 1
+                return
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_ms_total'] += wait_ms
+                self._stats['wait_ms_max'] = max(self._stats['wait_ms_max'], wait_ms)
+
+    # ---------- API para los servicios ----------
+
+    def get_connection(self, scoped=True):
+        """Conexión del pool; dentro de una petición Flask, la misma durante toda la petición.
+
+        scoped=False entrega una conexión propia que vuelve al pool con close(), para
+        trabajos que sobreviven a la vista (p. ej. respuestas en streaming).
+        """
+        from flask import current_app, g, has_app_context
+
+        # Sin teardown registrado la conexión de petición no volvería nunca al pool
+        if scoped and has_app_context() and current_app._get_current_object() in self._apps:
+            connection = g.get(self._g_key)
+            if connection is None:
+                connection = self.acquire()
+                setattr(g, self._g_key, connection)
+            return PooledConnection(self, connection, scoped=True)
+        return PooledConnection(self, self.acquire())
+
+    def init_app(self, app):
+        """Registrar la devolución de la conexión de petición al terminar cada petición"""
+        if app in self._apps:
+            return
+        self._apps.add(app)
+
+        @app.teardown_appcontext
+        def release_request_connection(exception=None):
+            from flask import g
+            connection = g.pop(self._g_key, None)
+            if connection is not None:
+                self.release(connection)
+
+    def stats(self):
+        """Métricas del pool (tiempos de espera en ms)"""
+        with self._lock:
+            stats = dict(self._stats)
+            created = self._created
+        stats['size'] = self.size
+        stats['open_connections'] = created
+        stats['idle_connections'] = self._idle.qsize()
+        stats['in_use_connections'] = created - stats['idle_connections']
+        stats['wait_ms_avg'] = round(stats['wait_ms_total'] / stats['waits'], 2) if stats['waits'] else 0.0
+        stats['wait_ms_total'] = round(stats['wait_ms_total'], 2)
+        stats['wait_ms_max'] = round(stats['wait_ms_max'], 2)
+        return stats
@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+# mysql_to_mongo_etl.py - ETL en streaming del esquema MySQL a las colecciones de MongoDB
+"""
+Copia permisos, roles, users y tasks del esquema MySQL (database/task_management.sql)
+a las colecciones que usan los servicios app_mongo.
+
+- Lectura por bloques con keyset sobre id (o sobre (updated_at, id) en modo incremental):
+  la memoria está acotada por chunk_size x bloques en vuelo, no por el tamaño de la tabla.
+- Mapeo de esquema:
+    roles.nombre + roles_permisos   -> roles {name, permissions}
+    permisos.nombre                 -> permisos {name}
+    users.role_id                   -> users.role (nombre del rol)
+    tasks.created_by (id de MySQL)  -> tasks.created_by (ObjectId del usuario, como string)
+- Los ids enteros se traducen a ObjectId con la tabla de correspondencias `etl_id_map`;
+  si ya existe un documento con la misma clave natural (username, nombre de rol o de
+  permiso) se reutiliza su _id en lugar de duplicarlo.
+- Escritura en paralelo: cada bloque es un bulk_write desordenado. Los documentos
+  nuevos se insertan completos ($setOnInsert); en los existentes solo se actualizan
+  los campos que cambiaron, y nunca las credenciales ni el rol de los usuarios
+  (`insert_only`), que pueden haberse modificado desde los servicios MongoDB. Un
+  documento sin cambios no se toca, así que updated_at solo avanza si algo cambió.
+- Modo incremental (--incremental): solo filas con updated_at posterior al watermark
+  guardado en `etl_state`. Las tablas sin columna updated_at se copian completas.
+  Se leen solo filas con updated_at < NOW() - margen (reloj de MySQL) y el watermark
+  nunca pasa de ese punto: TIMESTAMP tiene resolución de 1 s y una transacción larga
+  puede confirmar filas con un updated_at anterior al de otras ya leídas.
+
+Uso:
+    python mysql_to_mongo_etl.py [--tables users tasks] [--incremental] [--chunk-size 1000] [--workers 4]
+                                 [--safety-lag 30]
+"""
+import argparse
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import mysql.connector
+from mysql.connector import Error
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database_mongo import mongo_db
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '.env'))
+
+# Configuración de la base de datos MySQL (mismas variables que los servicios MySQL)
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', 'localhost'),
+    'database': os.getenv('DB_NAME', 'task_management'),
+    'user': os.getenv('DB_USER'),
+    'password': os.getenv('DB_PASSWORD'),
+    'port': int(os.getenv('DB_PORT', 3306)),
+    'auth_plugin': os.getenv('DB_AUTH_PLUGIN')
+}
+
+ID_MAP_COLLECTION = 'etl_id_map'
+STATE_COLLECTION = 'etl_state'
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_WORKERS = 4
+# Margen (segundos) bajo NOW() de MySQL que el modo incremental deja sin leer
+DEFAULT_SAFETY_LAG_SECONDS = int(os.getenv('ETL_SAFETY_LAG_SECONDS', 30))
+
+def transform_permiso(row):
+    return {"name": row['nombre'], "created_at": row['created_at']}
+
+def transform_role(row):
+    permissions = row['permisos'].split(',') if row.get('permisos') else []
+    return {"name": row['nombre'], "permissions": permissions, "created_at": row['created_at']}
+
+def transform_user(row):
+    otp_secret = row.get('otp_secret')
+    return {
+        "username": row['username'],
+        "email": row['email'],
+        "password": row['password'],
+        "role": row['role'] or 'user',
+        "otp_secret": otp_secret,
+        # Sin secreto OTP no se puede exigir el segundo factor al iniciar sesión
+        "require_otp": bool(otp_secret),
+        "created_at": row['created_at']
+    }
+
+def transform_task(row):
+    return {
+        "name": row['name'],
+        "name_lower": row['name'].lower(),
+        "description": row['description'] or '',
+        "deadline": row['deadline'],
+        "status": row['status'],
+        "created_by_username": row['created_by_username'],
+        "created_at": row['created_at'],
+        "is_alive": bool(row['is_alive'])
+    }
+
+# Orden de ejecución: las tareas necesitan la correspondencia de usuarios ya creada
+TABLES = {
+    'permisos': {
+        'collection': 'permisos',
+        'natural_key': 'name',
+        'columns': ["t.id", "t.nombre", "t.created_at"],
+        'transform': transform_permiso
+    },
+    'roles': {
+        'collection': 'roles',
+        'natural_key': 'name',
+        'columns': ["t.id", "t.nombre", "t.created_at",
+                    "GROUP_CONCAT(p.nombre ORDER BY p.nombre SEPARATOR ',') AS permisos"],
+        'joins': "LEFT JOIN roles_permisos rp ON rp.role_id = t.id LEFT JOIN permisos p ON p.id = rp.permiso_id",
+        'group_by': "t.id",
+        'transform': transform_role
+    },
+    'users': {
+        'collection': 'users',
+        'natural_key': 'username',
+        'columns': ["t.id", "t.username", "t.password", "t.email", "t.created_at", "r.nombre AS role"],
+        'optional_columns': ["otp_secret"],
+        'joins': "LEFT JOIN roles r ON r.id = t.role_id",
+        # Campos que MySQL solo aporta al crear el usuario: después manda MongoDB
+        'insert_only': ["password", "otp_secret", "require_otp", "role", "email"],
+        'transform': transform_user
+    },
+    'tasks': {
+        'collection': 'tasks',
+        'natural_key': None,
+        'columns': ["t.id", "t.name", "t.description", "t.created_at", "t.deadline", "t.status",
+                    "t.is_alive", "t.created_by", "u.username AS created_by_username"],
+        'joins': "JOIN users u ON u.id = t.created_by",
+        # columna con id de MySQL -> tabla cuya correspondencia resuelve el ObjectId
+        'references': {'created_by': 'users'},
+        'transform': transform_task
+    }
+}
+
+def map_key(table, mysql_id):
+    return f"{table}:{mysql_id}"
+
+class MySQLToMongoETL:
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, workers=DEFAULT_WORKERS, incremental=False,
+                 safety_lag=DEFAULT_SAFETY_LAG_SECONDS):
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.incremental = incremental
+        self.safety_lag = safety_lag
+        self.connection = None
+
+    def connect(self):
+        """Conectar a MySQL y a MongoDB"""
+        try:
+            print("🔌 Conectando a MySQL...")
+            self.connection = mysql.connector.connect(**DB_CONFIG)
+            print("✅ Conexión a MySQL exitosa")
+        except Error as e:
+            print(f"❌ Error conectando a MySQL: {e}")
+            return False
+
+        print("🔌 Conectando a MongoDB...")
+        if not mongo_db.connect():
+            print("❌ No se pudo conectar a MongoDB")
+            return False
+        print("✅ Conexión a MongoDB exitosa")
+        return True
+
+    def table_columns(self, table):
+        """Columnas reales de la tabla (el esquema varía entre task_management.sql y database.py)"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(f"SHOW COLUMNS FROM {table}")
+            return {row[0] for row in cursor.fetchall()}
+        finally:
+            cursor.close()
+
+    def horizon(self):
+        """NOW() - safety_lag según el reloj de MySQL (el mismo que escribe updated_at)"""
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("SELECT NOW() - INTERVAL %s SECOND", [self.safety_lag])
+            return cursor.fetchone()[0]
+        finally:
+            cursor.close()
+
+    # ---------- Lectura por bloques ----------
+
+    def build_query(self, table, spec, incremental, horizon=None):
+        """SELECT de un bloque con keyset; devuelve (sql, función de parámetros)"""
+        existing = self.table_columns(table)
+        columns = list(spec['columns'])
+        columns += [f"t.{column}" for column in spec.get('optional_columns', []) if column in existing]
+        if 'updated_at' in existing:
+            columns.append("t.updated_at")
+
+        if incremental:
+            # (updated_at, id): las filas modificadas durante la lectura no se pierden ni se repiten
+            # updated_at < horizonte: las filas más recientes aún pueden tener commits pendientes por delante
+            where = "(t.updated_at > %s OR (t.updated_at = %s AND t.id > %s)) AND t.updated_at < %s"
+            order = "t.updated_at, t.id"
+            params = lambda position: [position[0], position[0], position[1], horizon]
+        else:
+            where = "t.id > %s"
+            order = "t.id"
+            params = lambda position: [position[1]]
+
+        group_by = f"GROUP BY {spec['group_by']}" if spec.get('group_by') else ""
+        sql = f"""
+            SELECT {', '.join(columns)}
+            FROM {table} t {spec.get('joins', '')}
+            WHERE {where}
+            {group_by}
+            ORDER BY {order}
+            LIMIT %s
+        """
+        return sql, params, 'updated_at' in existing
+
+    def iter_chunks(self, table, spec, start, incremental, horizon=None):
+        """Leer la tabla por bloques de chunk_size filas a partir de la posición `start`"""
+        sql, params, _ = self.build_query(table, spec, incremental, horizon)
+        position = start
+        cursor = self.connection.cursor(dictionary=True)
+        try:
+            while True:
+                cursor.execute(sql, params(position) + [self.chunk_size])
+                rows = cursor.fetchall()
+                if not rows:
+                    return
+                last = rows[-1]
+                position = (last.get('updated_at'), last['id'])
+                yield rows
+                if len(rows) < self.chunk_size:
+                    return
+        finally:
+            cursor.close()
+
+    # ---------- Correspondencia de ids ----------
+
+    def lookup_ids(self, table, mysql_ids):
+        """ObjectId ya asignados a ids de MySQL: {mysql_id: ObjectId}"""
+        id_map = mongo_db.get_collection(ID_MAP_COLLECTION)
+        keys = [map_key(table, mysql_id) for mysql_id in set(mysql_ids)]
+        return {entry['mysql_id']: entry['mongo_id'] for entry in id_map.find({"_id": {"$in": keys}})}
+
+    def resolve_ids(self, table, spec, rows, docs):
+        """Asignar un ObjectId a cada fila: tabla de correspondencias, clave natural o uno nuevo"""
+        resolved = self.lookup_ids(table, [row['id'] for row in rows])
+        pending = [(row, doc) for row, doc in zip(rows, docs) if row['id'] not in resolved]
+        if not pending:
+            return resolved
+
+        new_entries = []
+        natural_key = spec['natural_key']
+        if natural_key:
+            # Reutilizar documentos creados directamente en MongoDB (p. ej. altas por app_mongo)
+            by_key = {doc[natural_key]: row['id'] for row, doc in pending}
+            existing = mongo_db.get_collection(spec['collection']).find(
+                {natural_key: {"$in": list(by_key)}}, {natural_key: 1}
+            )
+            for doc in existing:
+                resolved[by_key[doc[natural_key]]] = doc['_id']
+
+        now = datetime.utcnow()
+        for row, _ in pending:
+            mongo_id = resolved.setdefault(row['id'], ObjectId())
+            new_entries.append({
+                "_id": map_key(table, row['id']),
+                "table": table,
+                "mysql_id": row['id'],
+                "mongo_id": mongo_id,
+                "created_at": now
+            })
+        try:
+            mongo_db.get_collection(ID_MAP_COLLECTION).insert_many(new_entries, ordered=False)
+        except BulkWriteError:
+            # Otra ejecución asignó algunos ids a la vez: la correspondencia guardada manda
+            resolved.update(self.lookup_ids(table, [row['id'] for row, _ in pending]))
+        return resolved
+
+    # ---------- Escritura ----------
+
+    def write_chunk(self, table, rows):
+        """Transformar y escribir un bloque; devuelve (escritos, sin cambios, omitidos, fallidos)"""
+        spec = TABLES[table]
+        collection = mongo_db.get_collection(spec['collection'])
+        docs = [spec['transform'](row) for row in rows]
+        ids = self.resolve_ids(table, spec, rows, docs)
+        references = {
+            column: self.lookup_ids(ref_table, [row[column] for row in rows])
+            for column, ref_table in spec.get('references', {}).items()
+        }
+        insert_only = set(spec.get('insert_only', [])) | {'created_at'}
+        current = {doc['_id']: doc for doc in collection.find({"_id": {"$in": list(ids.values())}})}
+
+        now = datetime.utcnow()
+        operations = []
+        skipped = unchanged = 0
+        for row, doc in zip(rows, docs):
+            missing_reference = False
+            for column, mapping in references.items():
+                mongo_id = mapping.get(row[column])
+                if mongo_id is None:
+                    missing_reference = True
+                    break
+                # Los servicios guardan las referencias a usuarios como string del ObjectId
+                doc[column] = str(mongo_id)
+            if missing_reference:
+                skipped += 1
+                continue
+            doc['created_at'] = doc['created_at'] or now
+            mongo_id = ids[row['id']]
+            existing = current.get(mongo_id)
+            # updated_at = momento de la escritura en MongoDB, para los consumidores
+            # de cambios (GET /tasks/changes, bus de invalidación de cachés)
+            if existing is None:
+                # Si otro escritor lo crea antes, $setOnInsert no pisa nada
+                operations.append(UpdateOne({"_id": mongo_id}, {"$setOnInsert": {**doc, "updated_at": now}}, upsert=True))
+                continue
+            changes = {
+                field: value for field, value in doc.items()
+                if field not in insert_only and existing.get(field) != value
+            }
+            if not changes:
+                unchanged += 1
+                continue
+            changes['updated_at'] = now
+            operations.append(UpdateOne({"_id": mongo_id}, {"$set": changes}))
+
+        if not operations:
+            return 0, unchanged, skipped, 0
+        try:
+            collection.bulk_write(operations, ordered=False)
+            return len(operations), unchanged, skipped, 0
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            for error in errors[:5]:
+                print(f"\n   ❌ Error escribiendo en {spec['collection']}: {error.get('errmsg')}")
+            return len(operations) - len(errors), unchanged, skipped, len(errors)
+
+    # ---------- Estado incremental ----------
+
+    def load_watermark(self, table):
+        state = mongo_db.get_collection(STATE_COLLECTION).find_one({"_id": table}) or {}
+        return state.get('updated_at'), state.get('id', 0)
+
+    def save_watermark(self, table, updated_at, last_id):
+        mongo_db.get_collection(STATE_COLLECTION).update_one(
+            {"_id": table},
+            {"$set": {"updated_at": updated_at, "id": last_id, "last_run": datetime.utcnow()}},
+            upsert=True
+        )
+
+    # ---------- Ejecución ----------
+
+    def run_table(self, table):
+        """Copiar una tabla con escritores en paralelo; devuelve el número de documentos escritos"""
+        spec = TABLES[table]
+        _, _, has_updated_at = self.build_query(table, spec, False)
+        incremental = self.incremental and has_updated_at
+        if self.incremental and not has_updated_at:
+            print(f"   ℹ️ {table} no tiene updated_at: copia completa")
+
+        start_position = (None, 0)
+        horizon = self.horizon() if has_updated_at else None
+        if incremental:
+            watermark = self.load_watermark(table)
+            if watermark[0] is not None:
+                start_position = watermark
+                print(f"   ♻️ Desde el watermark {watermark[0].isoformat()} (id {watermark[1]})")
+            else:
+                incremental = False
+                print("   ℹ️ Sin watermark previo: copia completa")
+
+        written = unchanged = skipped = failed = processed = 0
+        max_seen = (None, 0)
+        completed = {}
+        next_to_commit = 0
+        pending = {}
+        started = time.perf_counter()
+
+        def collect():
+            nonlocal written, unchanged, skipped, failed, processed, next_to_commit
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                sequence, position, size = pending.pop(future)
+                chunk_written, chunk_unchanged, chunk_skipped, chunk_failed = future.result()
+                written += chunk_written
+                unchanged += chunk_unchanged
+                skipped += chunk_skipped
+                failed += chunk_failed
+                processed += size
+                completed[sequence] = position
+
+            # En modo incremental el watermark solo avanza hasta el último bloque contiguo escrito
+            while next_to_commit in completed:
+                position = completed.pop(next_to_commit)
+                next_to_commit += 1
+                if incremental:
+                    self.save_watermark(table, *position)
+
+            elapsed = time.perf_counter() - started
+            print(f"\r   ⏳ {processed} filas · {processed / elapsed if elapsed else 0:.0f} filas/s", end='', flush=True)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for sequence, rows in enumerate(self.iter_chunks(table, spec, start_position, incremental, horizon)):
+                last = rows[-1]
+                position = (last.get('updated_at'), last['id'])
+                if has_updated_at:
+                    newest = max(rows, key=lambda row: (row['updated_at'], row['id']))
+                    if max_seen[0] is None or (newest['updated_at'], newest['id']) > max_seen:
+                        max_seen = (newest['updated_at'], newest['id'])
+                pending[executor.submit(self.write_chunk, table, rows)] = (sequence, position, len(rows))
+                # Memoria acotada: como mucho dos bloques en vuelo por escritor
+                if len(pending) >= self.workers * 2:
+                    collect()
+            while pending:
+                collect()
+        print()
+
+        # Tras una copia completa, la siguiente ejecución incremental parte de lo más reciente leído,
+        # sin pasar del horizonte: lo posterior se vuelve a leer (las escrituras son idempotentes)
+        if has_updated_at and not incremental and max_seen[0] is not None:
+            self.save_watermark(table, *(max_seen if max_seen[0] < horizon else (horizon, 0)))
+
+        elapsed = time.perf_counter() - started
+        print(f"   🎉 {table} -> {spec['collection']}: {written} escritos, {unchanged} sin cambios, {skipped} sin referencia, "
+              f"{failed} con error · {elapsed:.1f}s")
+        return written
+
+    def run(self, tables):
+        print("🚀 INICIANDO ETL MySQL -> MongoDB")
+        print("=" * 50)
+        print(f"   Modo: {'incremental' if self.incremental else 'completo'} · "
+              f"bloques de {self.chunk_size} filas · {self.workers} escritores")
+
+        if not self.connect():
+            return False
+
+        try:
+            totals = {}
+            for table in TABLES:
+                if table in tables:
+                    print(f"\n📦 {table}...")
+                    totals[table] = self.run_table(table)
+
+            print("\n" + "=" * 50)
+            print("🎉 ETL COMPLETADO")
+            print("=" * 50)
+            for table, count in totals.items():
+                print(f"   {table}: {count} documentos")
+            return True
+
+        except Exception as e:
+            print(f"\n❌ Error durante el ETL: {e}")
+            return False
+
+        finally:
+            if self.connection:
+                self.connection.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='ETL del esquema MySQL a las colecciones de MongoDB')
+    parser.add_argument('--tables', nargs='*', default=list(TABLES), choices=list(TABLES),
+                       help='Tablas a copiar (default: todas)')
+    parser.add_argument('--incremental', action='store_true',
+                       help='Solo filas con updated_at posterior al último watermark')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                       help=f'Filas por bloque (default: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                       help=f'Escritores en paralelo (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--safety-lag', type=int, default=DEFAULT_SAFETY_LAG_SECONDS,
+                       help=f'Segundos bajo NOW() que el modo incremental deja sin leer (default: {DEFAULT_SAFETY_LAG_SECONDS})')
+    args = parser.parse_args()
+
+    etl = MySQLToMongoETL(chunk_size=args.chunk_size, workers=args.workers, incremental=args.incremental,
+                          safety_lag=args.safety_lag)
+    if not etl.run(args.tables):
+        print("\n❌ El ETL falló")
+        print("🔍 Revisa los errores y la configuración de MySQL (DB_*) y MongoDB")
+
+if __name__ == '__main__':
+    main()
@@ -7,6 +7,7 @@ import sys
 import subprocess
 import time
 import signal
+import threading
 from dotenv import load_dotenv
 
 # Cargar variables de entorno para producción
@@ -51,10 +52,7 @@ def start_service_with_gunicorn(service_name, port, workers=1):
             'gunicorn',
             '--bind', f'0.0.0.0:{port}',
             '--workers', str(workers),
-            '--timeout', '120',
-            '--keep-alive', '5',
-            '--max-requests', '1000',
-            '--max-requests-jitter', '100',
+            '--config', 'gunicorn_conf.py',
             f'{service_name}.app_mongo:app'
         ]
         
@@ -112,10 +110,10 @@ def start_api_gateway():
             'gunicorn',
             '--bind', f'0.0.0.0:{port}',
             '--workers', '2',
-            '--timeout', '120',
-            '--keep-alive', '5',
-            '--max-requests', '1000',
-            '--max-requests-jitter', '100',
+            # Hilos por worker: cada conexión SSE (/events) ocupa un hilo, no un worker completo
+            '--worker-class', 'gthread',
+            '--threads', os.environ.get('GATEWAY_THREADS', '32'),
+            '--config', 'gunicorn_conf.py',
             '--access-logfile', '-',
             '--error-logfile', '-',
             'api_gateway.app_mongo:app'
@@ -144,11 +142,14 @@ def main():
     print("🚀 INICIANDO API GATEWAY EN RENDER")
     print("=" * 50)
     
-    # Verificar MongoDB Atlas
-    print("🔍 Verificando conexión a MongoDB Atlas...")
-    if not check_mongodb_connection():
-        print("❌ No se puede continuar sin conexión a MongoDB Atlas")
-        sys.exit(1)
+    # Modo de perfilado: tiempo de importación por módulo antes de arrancar
+    if os.environ.get('STARTUP_PROFILE', 'false').lower() == 'true':
+        from startup_profile import report
+        report('api_gateway.app_mongo')
+    
+    # Verificar MongoDB Atlas en segundo plano: no retrasa el arranque de gunicorn
+    print("🔍 Verificando conexión a MongoDB Atlas en segundo plano...")
+    threading.Thread(target=check_mongodb_connection, daemon=True).start()
     
     # En Render, los microservicios se ejecutan como servicios separados
     # Solo iniciamos el API Gateway
@@ -23,7 +23,7 @@ def start_service(service_name, port):
             'gunicorn',
             '--bind', f'0.0.0.0:{port}',
             '--workers', '1',
-            '--timeout', '120',
+            '--config', 'gunicorn_conf.py',
             f'{service_name}.app_mongo:app'  # Usar la versión MongoDB
         ]
         
@@ -70,7 +70,9 @@ def start_api_gateway():
             'gunicorn',
             '--bind', f'0.0.0.0:{port}',
             '--workers', '2',
-            '--timeout', '120',
+            '--worker-class', 'gthread',
+            '--threads', os.environ.get('GATEWAY_THREADS', '32'),
+            '--config', 'gunicorn_conf.py',
             'api_gateway.app_mongo:app'  # Usar versión MongoDB
         ]
         
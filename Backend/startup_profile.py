@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Perfilado de arranque: tiempo de importación por módulo de cada servicio.
+Uso:
+    python startup_profile.py                       # los cuatro app_mongo
+    python startup_profile.py auth_service.app_mongo --top 30
+También se activa desde start_render.py con STARTUP_PROFILE=1.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+DEFAULT_MODULES = [
+    'api_gateway.app_mongo',
+    'auth_service.app_mongo',
+    'user_service.app_mongo',
+    'task_service.app_mongo'
+]
+
+def profile_imports(module):
+    """Importar `module` en un proceso limpio con -X importtime.
+
+    Devuelve (tiempo_total_ms, [(módulo, profundidad, propio_ms, acumulado_ms)]).
+    """
+    env = os.environ.copy()
+    env.setdefault('FLASK_ENV', 'production')
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    entries = []
+    for line in result.stderr.splitlines():
+        # Formato: "import time:  self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        try:
+            _, self_us, cumulative_us, name = line.replace('import time:', '|', 1).split('|')
+        except ValueError:
+            continue
+        # La indentación del nombre indica el nivel de anidamiento de la importación
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), depth, int(self_us) / 1000, int(cumulative_us) / 1000))
+
+    if result.returncode != 0:
+        print(f"❌ Error importando {module}:")
+        print('\n'.join(line for line in result.stderr.splitlines() if not line.startswith('import time:'))[-2000:])
+
+    return wall_ms, entries
+
+def report(module, top=15):
+    wall_ms, entries = profile_imports(module)
+    # Solo las importaciones de primer nivel muestran el coste real de cada dependencia
+    top_level = [entry for entry in entries if entry[1] == 0]
+    top_level.sort(key=lambda entry: entry[3], reverse=True)
+
+    print(f"\n📦 {module}: {wall_ms:.0f}ms de arranque del proceso (importación + intérprete)")
+    print(f"   {'módulo':30s} {'acumulado':>10s} {'propio':>8s}")
+    for name, _, self_ms, cumulative_ms in top_level[:top]:
+        print(f"   {name:30s} {cumulative_ms:9.1f}ms {self_ms:7.1f}ms")
+    return wall_ms, top_level
+
+def main():
+    parser = argparse.ArgumentParser(description='Perfilado de tiempo de importación de los servicios')
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES,
+                       help='Módulos a perfilar (default: los cuatro app_mongo)')
+    parser.add_argument('--top', type=int, default=15,
+                       help='Número de módulos a mostrar por servicio (default: 15)')
+    args = parser.parse_args()
+
+    print("⏱️  PERFILADO DE ARRANQUE")
+    print("=" * 50)
+    for module in args.modules:
+        report(module, args.top)
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,17 @@
 # task_service/app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import mysql.connector
 from datetime import datetime
 from auth import generate_token, token_required, hash_password, check_password
 from mysql.connector import Error
+import json
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from mysql_pool import MySQLPool
+
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
 app = Flask(__name__)
@@ -24,10 +29,14 @@ DB_CONFIG = {
     'auth_plugin': os.getenv('DB_AUTH_PLUGIN')
 }
 
+# Pool de conexiones compartido del proceso (una conexión por petición)
+db_pool = MySQLPool(DB_CONFIG)
+db_pool.init_app(app)
+
 def get_db_connection():
-    """Obtener conexión a la base de datos MySQL"""
+    """Obtener conexión a la base de datos MySQL desde el pool"""
     try:
-        return mysql.connector.connect(**DB_CONFIG)
+        return db_pool.get_connection()
     except Error as e:
         print(f"Error conectando a MySQL: {e}")
         return None
@@ -69,6 +78,58 @@ def get_user_by_username_or_email(identifier):
         cursor.close()
         connection.close()
 
+# Paginación de tareas (solo si se pide con limit o cursor; sin ellos, listado completo)
+TASKS_DEFAULT_LIMIT = 100
+TASKS_MAX_LIMIT = 500
+EXPORT_BATCH_SIZE = 500
+
+# Columnas explícitas del listado (sin t.*: no arrastrar columnas que no se usan)
+TASK_COLUMNS = """t.id, t.name, t.description, t.created_at, t.deadline, t.status,
+               t.is_alive, t.created_by, t.updated_at, u.username AS created_by_username"""
+
+def encode_task_cursor(task):
+    """Codificar la posición (created_at, id) de la última tarea entregada"""
+    return f"{task['created_at'].isoformat()}|{task['id']}"
+
+def decode_task_cursor(value):
+    """Decodificar un cursor; devuelve (created_at, id) o lanza ValueError"""
+    try:
+        timestamp, task_id = value.split('|', 1)
+        return datetime.fromisoformat(timestamp), int(task_id)
+    except Exception:
+        raise ValueError(f"Cursor inválido: {value}")
+
+def build_tasks_query(user, after=None):
+    """SELECT de las tareas visibles para el usuario, en orden (created_at, id) descendente.
+
+    `after` es la posición (created_at, id) de la última tarea de la página anterior.
+    Para usuarios normales el filtro y el orden los resuelve idx_tasks_alive_owner_created.
+    """
+    conditions = ["t.is_alive = TRUE"]
+    params = []
+    if user['role_id'] != 1:  # admin ve todas las tareas
+        conditions.append("t.created_by = %s")
+        params.append(user['id'])
+    if after:
+        # Condición expandida en lugar de (a, b) < (x, y) para que MySQL use el índice como rango
+        conditions.append("(t.created_at < %s OR (t.created_at = %s AND t.id < %s))")
+        params.extend([after[0], after[0], after[1]])
+    
+    query = f"""
+        SELECT {TASK_COLUMNS}
+        FROM tasks t 
+        JOIN users u ON t.created_by = u.id 
+        WHERE {' AND '.join(conditions)}
+        ORDER BY t.created_at DESC, t.id DESC
+    """
+    return query, params
+
+def serialize_value(value):
+    """Serializar fechas a ISO 8601 en la exportación"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
 # Manejo de preflight OPTIONS
 @app.before_request
 def handle_preflight():
@@ -209,31 +270,86 @@ def listar_tasks(current_user):
         if not user:
             return jsonify({"error": "Usuario no encontrado"}), 404
         
-        if user['role_id'] == 1:  # admin
-            cursor.execute("""
-                SELECT t.*, u.username as created_by_username 
-                FROM tasks t 
-                JOIN users u ON t.created_by = u.id 
-                WHERE t.is_alive = TRUE 
-                ORDER BY t.created_at DESC
-            """)
-        else:
-            cursor.execute("""
-                SELECT t.*, u.username as created_by_username 
-                FROM tasks t 
-                JOIN users u ON t.created_by = u.id 
-                WHERE t.created_by = %s AND t.is_alive = TRUE 
-                ORDER BY t.created_at DESC
-            """, (user['id'],))
+        # Sin limit ni cursor se mantiene la respuesta completa de siempre
+        if 'limit' not in request.args and 'cursor' not in request.args:
+            query, params = build_tasks_query(user)
+            cursor.execute(query, params)
+            tasks = cursor.fetchall()
+            return jsonify({"tasks": tasks, "count": len(tasks)})
+        
+        try:
+            limit = min(int(request.args.get('limit', TASKS_DEFAULT_LIMIT)), TASKS_MAX_LIMIT)
+            if limit < 1:
+                raise ValueError()
+        except ValueError:
+            return jsonify({"error": "Parámetro limit inválido"}), 400
+        
+        after = None
+        if request.args.get('cursor'):
+            try:
+                after = decode_task_cursor(request.args['cursor'])
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+        
+        query, params = build_tasks_query(user, after)
+        cursor.execute(f"{query} LIMIT %s", params + [limit + 1])
         
         tasks = cursor.fetchall()
-        return jsonify({"tasks": tasks, "count": len(tasks)})
+        has_more = len(tasks) > limit
+        tasks = tasks[:limit]
+        next_cursor = encode_task_cursor(tasks[-1]) if has_more else None
+        return jsonify({"tasks": tasks, "count": len(tasks), "next_cursor": next_cursor, "has_more": has_more})
     except Error as e:
         return jsonify({"error": f"Error obteniendo tareas: {str(e)}"}), 500
     finally:
         cursor.close()
         connection.close()
 
+@app.route('/tasks/export', methods=['GET', 'OPTIONS'])
+@token_required
+def exportar_tasks(current_user):
+    """Exportar todas las tareas visibles como NDJSON, leyendo de un cursor sin buffer"""
+    if request.method == 'OPTIONS':
+        return handle_preflight()
+    
+    user = get_user_by_username(current_user)
+    if not user:
+        return jsonify({"error": "Usuario no encontrado"}), 404
+    
+    # Conexión propia: la respuesta se sigue generando después de que termine la vista
+    try:
+        connection = db_pool.get_connection(scoped=False)
+    except Error as e:
+        print(f"Error conectando a MySQL: {e}")
+        return jsonify({"error": "Error de conexión a la base de datos"}), 500
+    
+    query, params = build_tasks_query(user)
+    
+    def generate():
+        # buffered=False: las filas se leen del socket por lotes, sin materializar el resultado
+        cursor = connection.cursor(dictionary=True, buffered=False)
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                yield ''.join(json.dumps(row, default=serialize_value) + '\n' for row in rows)
+        except Error as e:
+            yield json.dumps({"error": f"Error exportando tareas: {str(e)}"}) + '\n'
+        finally:
+            cursor.close()
+            connection.close()
+    
+    response = Response(generate(), mimetype='application/x-ndjson', headers={
+        'Content-Disposition': 'attachment; filename=tasks.ndjson'
+    })
+    # Si el generador no llega a ejecutarse (cliente desconectado, error antes de
+    # enviar el cuerpo) la conexión se devuelve igualmente al cerrar la respuesta;
+    # close() es idempotente, así que no importa que el finally también la cierre
+    response.call_on_close(connection.close)
+    return response
+
 @app.route('/task', methods=['POST', 'OPTIONS'])
 @token_required
 def crear_task(current_user):
@@ -332,8 +448,8 @@ def task_operations(current_user, task_id):
     
     try:
         # Obtener tarea
-        cursor.execute("""
-            SELECT t.*, u.username as created_by_username 
+        cursor.execute(f"""
+            SELECT {TASK_COLUMNS}
             FROM tasks t 
             JOIN users u ON t.created_by = u.id 
             WHERE t.id = %s AND t.is_alive = TRUE
@@ -445,7 +561,7 @@ def info(current_user):
         "service": "Task Management Service",
         "version": "1.0.0",
         "user": current_user,
-        "endpoints": ["/tasks", "/task", "/login", "/register"]
+        "endpoints": ["/tasks", "/tasks/export", "/task", "/login", "/register"]
     })
 
 @app.route('/health', methods=['GET', 'OPTIONS'])
@@ -453,7 +569,7 @@ def health():
     if request.method == 'OPTIONS':
         return handle_preflight()
     
-    return jsonify({"status": "OK", "service": "Task Service"}), 200
+    return jsonify({"status": "OK", "service": "Task Service", "db_pool": db_pool.stats()}), 200
 
 if __name__ == '__main__':
     print("=" * 50)
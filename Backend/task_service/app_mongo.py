@@ -1,8 +1,13 @@
 # task_service/app_mongo.py
 from flask import Flask, request, jsonify
-from datetime import datetime
+from datetime import datetime, timedelta
+import threading
+import time
 import traceback
 from database_mongo import mongo_db
+from deadlines import init_deadlines
+from health_probes import HealthMonitor, mongo_probe, register_health_routes
+from cache_invalidation import get_invalidation_bus
 # Importar configuración según el entorno
 import os
 if os.getenv('FLASK_ENV') == 'production':
@@ -12,24 +17,50 @@ else:
     from config import config
     print("🔧 [TASK] Usando configuración de DESARROLLO")
 from bson import ObjectId
+from pymongo import ASCENDING, TEXT, UpdateOne
+import re
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = config.JWT_SECRET
 
+# Liveness (/livez) y readiness (/readyz) con sondas en segundo plano
+health_monitor = HealthMonitor("Task Service (MongoDB)")
+health_monitor.add_probe('mongodb', mongo_probe(mongo_db))
+register_health_routes(app, health_monitor)
 
+# Deadline de cada petición (cabecera del gateway) aplicado a las operaciones de MongoDB
+init_deadlines(app)
 
-print(f"[DB] Conectando a MongoDB: {config.MONGO_URI}")
+
+
+
+# Caché de usuarios invalidada por los cambios en la colección users
+_user_cache = None
+
+def get_user_cache():
+    global _user_cache
+    if _user_cache is None:
+        _user_cache = get_invalidation_bus('task_service').cache('users', ttl=300)
+    return _user_cache
 
 def get_user_by_username(username):
     """Obtener usuario por username desde MongoDB"""
     try:
+        user_cache = get_user_cache()
+        cached = user_cache.get(username)
+        if cached is not None:
+            return dict(cached)
+        
         if not mongo_db.connect():
             return None
         
+        # Versión antes de leer: si el usuario se invalida mientras tanto, no se cachea
+        version = user_cache.version()
         users_collection = mongo_db.get_collection('users')
         user = users_collection.find_one({"username": username})
         
         if user:
+            user_cache.set(username, user, doc_id=user['_id'], version=version)
             # Convertir ObjectId a string para compatibilidad
             user['id'] = str(user['_id'])
             user['role_id'] = 1 if user.get('role') == 'admin' else 2
@@ -72,6 +103,139 @@ def convert_datetime_to_string(obj):
         return obj.isoformat()
     return str(obj) if obj is not None else None
 
+def task_to_dict(task):
+    """Convertir un documento de tarea a su representación JSON"""
+    return {
+        "id": str(task['_id']),
+        "name": task['name'],
+        "description": task.get('description', ''),
+        "deadline": convert_datetime_to_string(task.get('deadline')),
+        "status": task.get('status', 'In Progress'),
+        "created_by": str(task.get('created_by', '')),
+        "created_at": convert_datetime_to_string(task.get('created_at')),
+        "updated_at": convert_datetime_to_string(task.get('updated_at')),
+        "created_by_username": task.get('created_by_username', 'Unknown')
+    }
+
+def normalize_task_name(name):
+    """Nombre normalizado para name_lower; el mismo cálculo en escrituras, rellenos y búsquedas.
+
+    Se hace en Python y no con $toLower de MongoDB, que solo convierte ASCII: con
+    'Ñandú' el prefijo 'ñan' no encontraría la tarea.
+    """
+    return name.lower()
+
+# Preparación de la colección de tareas: índices y rellenos de campos derivados.
+# Cada paso se completa una vez por proceso; si falla se reintenta pasados
+# TASK_SETUP_RETRY_SECONDS, no en cada petición.
+TASK_SETUP_RETRY_SECONDS = int(os.getenv('TASK_SETUP_RETRY_SECONDS', 60))
+TASK_BACKFILL_BATCH_SIZE = 500
+NAME_LOWER_MIGRATION = 'tasks_name_lower_python'
+_task_indexes_ready = False
+_task_indexes_retry_at = 0.0
+_task_backfill_state = {'done': False, 'running': False, 'retry_at': 0.0}
+_task_setup_lock = threading.Lock()
+
+def ensure_task_indexes(tasks_collection):
+    """Crear los índices que usan las consultas del servicio y lanzar los rellenos pendientes"""
+    global _task_indexes_ready, _task_indexes_retry_at
+    start_task_backfill(tasks_collection)
+    if _task_indexes_ready or time.monotonic() < _task_indexes_retry_at:
+        return
+    try:
+        # Índice para la sincronización incremental por watermark
+        tasks_collection.create_index([("updated_at", 1), ("_id", 1)], name="updated_at_id")
+        # Búsqueda de texto completo sobre nombre y descripción (el nombre pesa más)
+        tasks_collection.create_index(
+            [("name", TEXT), ("description", TEXT)],
+            name="name_description_text",
+            weights={"name": 10, "description": 1},
+            default_language="spanish"
+        )
+        # Autocompletado por prefijo: regex anclada sobre el nombre normalizado
+        tasks_collection.create_index([("is_alive", ASCENDING), ("name_lower", ASCENDING)], name="alive_name_lower")
+        _task_indexes_ready = True
+    except Exception as e:
+        _task_indexes_retry_at = time.monotonic() + TASK_SETUP_RETRY_SECONDS
+        print(f"⚠️ Error creando índices de tareas: {e}")
+
+def start_task_backfill(tasks_collection):
+    """Lanzar los rellenos en un hilo de fondo (fuera del deadline de la petición)"""
+    state = _task_backfill_state
+    if state['done'] or state['running'] or time.monotonic() < state['retry_at']:
+        return
+    with _task_setup_lock:
+        if state['done'] or state['running']:
+            return
+        state['running'] = True
+    threading.Thread(target=backfill_tasks, args=(tasks_collection,), name='task-backfill', daemon=True).start()
+
+def backfill_tasks(tasks_collection):
+    """Rellenar updated_at y name_lower en tareas antiguas (idempotente)"""
+    state = _task_backfill_state
+    try:
+        # Tareas heredadas sin updated_at: se les da la hora del servidor para que entren
+        # en la sincronización por watermark como cualquier otra
+        tasks_collection.update_many(
+            {"updated_at": {"$exists": False}},
+            [{"$set": {"updated_at": "$$NOW"}}]
+        )
+        # name_lower ausente, o calculado con $toLower en rellenos anteriores (nombres no
+        # ASCII); esa corrección se hace una sola vez y queda marcada en schema_migrations
+        migrations = tasks_collection.database.get_collection('schema_migrations')
+        repair_done = migrations.find_one({"_id": NAME_LOWER_MIGRATION}) is not None
+        query = {"name_lower": {"$exists": False}}
+        if not repair_done:
+            query = {"$or": [query, {"name": {"$regex": "[^\\x00-\\x7F]"}}]}
+        cursor = tasks_collection.find(query, {"name": 1, "name_lower": 1})
+        operations = []
+        for task in cursor:
+            name_lower = normalize_task_name(task.get('name') or '')
+            if task.get('name_lower') != name_lower:
+                # Con el nombre en el filtro, un renombrado concurrente no queda pisado
+                operations.append(UpdateOne({"_id": task['_id'], "name": task.get('name')}, {"$set": {"name_lower": name_lower}}))
+            if len(operations) >= TASK_BACKFILL_BATCH_SIZE:
+                tasks_collection.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            tasks_collection.bulk_write(operations, ordered=False)
+        if not repair_done:
+            migrations.update_one({"_id": NAME_LOWER_MIGRATION}, {"$set": {"applied_at": datetime.utcnow()}}, upsert=True)
+        state['done'] = True
+    except Exception as e:
+        state['retry_at'] = time.monotonic() + TASK_SETUP_RETRY_SECONDS
+        print(f"⚠️ Error rellenando campos de tareas (reintento en {TASK_SETUP_RETRY_SECONDS}s): {e}")
+    finally:
+        state['running'] = False
+
+# Parámetros de /tasks/search
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+PREFIX_DEFAULT_LIMIT = 10
+SEARCH_FIELDS = ['name', 'description', 'deadline', 'status', 'created_by',
+                 'created_at', 'updated_at', 'created_by_username']
+
+# Watermarks para /tasks/changes: "<updated_at ISO>|<ObjectId>"
+CHANGES_DEFAULT_LIMIT = 500
+CHANGES_MAX_LIMIT = 1000
+# El watermark devuelto nunca pasa de ahora - este margen: una escritura en vuelo o de
+# un proceso con el reloj algo atrasado puede guardar un updated_at anterior al último
+# entregado, y con el margen se vuelve a leer en la siguiente consulta
+CHANGES_SAFETY_LAG_SECONDS = float(os.getenv('CHANGES_SAFETY_LAG_SECONDS', 2))
+WATERMARK_MIN_ID = ObjectId('0' * 24)
+
+def encode_watermark(updated_at, task_id):
+    """Codificar la posición (updated_at, _id) de la última tarea entregada"""
+    return f"{updated_at.isoformat()}|{task_id}"
+
+def decode_watermark(watermark):
+    """Decodificar un watermark; devuelve (updated_at, ObjectId) o lanza ValueError"""
+    try:
+        timestamp, task_id = watermark.split('|', 1)
+        return datetime.fromisoformat(timestamp), ObjectId(task_id)
+    except Exception:
+        raise ValueError(f"Watermark inválido: {watermark}")
+
 # Configuración CORS para producción
 from flask_cors import CORS
 
@@ -108,19 +272,7 @@ def listar_tasks():
         tasks = list(tasks_collection.find({"is_alive": True}))
         
         # Convertir ObjectId a string y procesar fechas
-        processed_tasks = []
-        for task in tasks:
-            task_dict = {
-                "id": str(task['_id']),
-                "name": task['name'],
-                "description": task.get('description', ''),
-                "deadline": convert_datetime_to_string(task.get('deadline')),
-                "status": task.get('status', 'In Progress'),
-                "created_by": str(task.get('created_by', '')),
-                "created_at": convert_datetime_to_string(task.get('created_at')),
-                "created_by_username": task.get('created_by_username', 'Unknown')
-            }
-            processed_tasks.append(task_dict)
+        processed_tasks = [task_to_dict(task) for task in tasks]
         
         return jsonify({"tasks": processed_tasks, "count": len(processed_tasks)})
         
@@ -128,6 +280,173 @@ def listar_tasks():
         print(f"Error obteniendo tareas: {e}")
         return jsonify({"error": f"Error obteniendo tareas: {str(e)}"}), 500
 
+@app.route('/tasks/changes', methods=['GET', 'OPTIONS'])
+def tasks_changes():
+    """Sincronización incremental: tareas modificadas o eliminadas desde un watermark"""
+    if request.method == 'OPTIONS':
+        return jsonify({'message': 'OK'})
+    
+    try:
+        auth_header = request.headers.get('Authorization')
+        if not auth_header:
+            return jsonify({"error": "Token de autorización requerido"}), 401
+        
+        since = request.args.get('since')
+        try:
+            limit = min(int(request.args.get('limit', CHANGES_DEFAULT_LIMIT)), CHANGES_MAX_LIMIT)
+            if limit < 1:
+                raise ValueError()
+        except ValueError:
+            return jsonify({"error": "Parámetro limit inválido"}), 400
+        
+        if not mongo_db.connect():
+            return jsonify({"error": "Error de conexión a la base de datos"}), 500
+        
+        tasks_collection = mongo_db.get_collection('tasks')
+        ensure_task_indexes(tasks_collection)
+        
+        if since:
+            try:
+                since_time, since_id = decode_watermark(since)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            
+            # Keyset sobre (updated_at, _id): incluye las tareas eliminadas (is_alive False)
+            query = {"$or": [
+                {"updated_at": {"$gt": since_time}},
+                {"updated_at": since_time, "_id": {"$gt": since_id}}
+            ]}
+        else:
+            # Sin watermark: instantánea inicial de las tareas activas
+            query = {"is_alive": True}
+        
+        cursor = tasks_collection.find(query).sort([("updated_at", 1), ("_id", 1)]).limit(limit + 1)
+        changed = list(cursor)
+        has_more = len(changed) > limit
+        changed = changed[:limit]
+        
+        tasks = []
+        deleted = []
+        deleted_owners = {}
+        for task in changed:
+            if task.get('is_alive', True):
+                tasks.append(task_to_dict(task))
+            else:
+                deleted.append(str(task['_id']))
+                deleted_owners[str(task['_id'])] = str(task.get('created_by', ''))
+        
+        # MongoDB guarda fechas con precisión de milisegundos
+        horizon = datetime.utcnow() - timedelta(seconds=CHANGES_SAFETY_LAG_SECONDS)
+        horizon = horizon.replace(microsecond=horizon.microsecond // 1000 * 1000)
+        if changed:
+            position = (changed[-1].get('updated_at') or horizon, changed[-1]['_id'])
+        elif since:
+            position = (since_time, since_id)
+        else:
+            position = (horizon, WATERMARK_MIN_ID)
+        # Con has_more el cliente pide ya la página siguiente: retroceder lo haría repetirla
+        if not has_more and position[0] >= horizon:
+            position = (horizon, WATERMARK_MIN_ID)
+        watermark = encode_watermark(*position)
+        
+        return jsonify({
+            "tasks": tasks,
+            "deleted": deleted,
+            "deleted_owners": deleted_owners,
+            "count": len(tasks),
+            "watermark": watermark,
+            "has_more": has_more
+        })
+        
+    except Exception as e:
+        print(f"Error obteniendo cambios de tareas: {e}")
+        return jsonify({"error": f"Error obteniendo cambios: {str(e)}"}), 500
+
+@app.route('/tasks/search', methods=['GET', 'OPTIONS'])
+def search_tasks():
+    """Buscar tareas por nombre/descripción (texto completo) o por prefijo del nombre"""
+    if request.method == 'OPTIONS':
+        return jsonify({'message': 'OK'})
+    
+    try:
+        auth_header = request.headers.get('Authorization')
+        if not auth_header:
+            return jsonify({"error": "Token de autorización requerido"}), 401
+        
+        q = (request.args.get('q') or '').strip()
+        if not q:
+            return jsonify({"error": "Parámetro q requerido"}), 400
+        
+        mode = request.args.get('mode', 'text')
+        if mode not in ('text', 'prefix'):
+            return jsonify({"error": "Parámetro mode inválido. Debe ser 'text' o 'prefix'"}), 400
+        
+        try:
+            default_limit = PREFIX_DEFAULT_LIMIT if mode == 'prefix' else SEARCH_DEFAULT_LIMIT
+            limit = min(int(request.args.get('limit', default_limit)), SEARCH_MAX_LIMIT)
+            page = int(request.args.get('page', 1))
+            if limit < 1 or page < 1:
+                raise ValueError()
+        except ValueError:
+            return jsonify({"error": "Parámetros page/limit inválidos"}), 400
+        
+        # Proyección: solo los campos pedidos (el id siempre se incluye)
+        fields = request.args.get('fields')
+        if fields:
+            fields = [field.strip() for field in fields.split(',') if field.strip()]
+            invalid = [field for field in fields if field not in SEARCH_FIELDS]
+            if invalid:
+                return jsonify({"error": f"Campos inválidos: {invalid}. Permitidos: {SEARCH_FIELDS}"}), 400
+        else:
+            fields = ['name'] if mode == 'prefix' else SEARCH_FIELDS
+        projection = {field: 1 for field in fields}
+        
+        if not mongo_db.connect():
+            return jsonify({"error": "Error de conexión a la base de datos"}), 500
+        
+        tasks_collection = mongo_db.get_collection('tasks')
+        ensure_task_indexes(tasks_collection)
+        
+        skip = (page - 1) * limit
+        if mode == 'prefix':
+            # Regex anclada y sensible a mayúsculas sobre name_lower: usa el índice alive_name_lower
+            query = {"is_alive": True, "name_lower": {"$regex": f"^{re.escape(normalize_task_name(q))}"}}
+            cursor = tasks_collection.find(query, projection).sort("name_lower", ASCENDING)
+        else:
+            projection["score"] = {"$meta": "textScore"}
+            query = {"$text": {"$search": q}, "is_alive": True}
+            cursor = tasks_collection.find(query, projection).sort([("score", {"$meta": "textScore"})])
+        
+        results = list(cursor.skip(skip).limit(limit + 1))
+        has_more = len(results) > limit
+        
+        tasks = []
+        for task in results[:limit]:
+            task_dict = {"id": str(task['_id'])}
+            for field in fields:
+                value = task.get(field)
+                if field == 'created_by' and value is not None:
+                    value = str(value)
+                elif hasattr(value, 'isoformat'):
+                    value = convert_datetime_to_string(value)
+                task_dict[field] = value
+            if 'score' in task:
+                task_dict['score'] = round(task['score'], 4)
+            tasks.append(task_dict)
+        
+        return jsonify({
+            "tasks": tasks,
+            "count": len(tasks),
+            "page": page,
+            "limit": limit,
+            "has_more": has_more,
+            "mode": mode
+        })
+        
+    except Exception as e:
+        print(f"Error buscando tareas: {e}")
+        return jsonify({"error": f"Error buscando tareas: {str(e)}"}), 500
+
 @app.route('/task', methods=['POST', 'OPTIONS'])
 def crear_task():
     if request.method == 'OPTIONS':
@@ -182,14 +501,17 @@ def crear_task():
                 return jsonify({"error": f"Error procesando fecha: {str(e)}"}), 400
         
         # Crear documento de tarea
+        now = datetime.utcnow()
         task_doc = {
             "name": data['name'],
+            "name_lower": normalize_task_name(data['name']),
             "description": data.get('description', ''),
             "deadline": deadline,
             "status": data.get('status', 'In Progress'),
             "created_by": user['id'],
             "created_by_username": user['username'],
-            "created_at": datetime.utcnow(),
+            "created_at": now,
+            "updated_at": now,
             "is_alive": True
         }
         
@@ -248,17 +570,7 @@ def task_operations(task_id):
             return jsonify({"error": "No tienes permisos para acceder a esta tarea"}), 403
         
         if request.method == 'GET':
-            task_dict = {
-                "id": str(task['_id']),
-                "name": task['name'],
-                "description": task.get('description', ''),
-                "deadline": convert_datetime_to_string(task.get('deadline')),
-                "status": task.get('status', 'In Progress'),
-                "created_by": str(task.get('created_by', '')),
-                "created_at": convert_datetime_to_string(task.get('created_at')),
-                "created_by_username": task.get('created_by_username', 'Unknown')
-            }
-            return jsonify({"task": task_dict})
+            return jsonify({"task": task_to_dict(task)})
         
         elif request.method == 'PUT':
             data = request.get_json()
@@ -269,6 +581,7 @@ def task_operations(task_id):
             
             if 'name' in data:
                 update_fields['name'] = data['name']
+                update_fields['name_lower'] = normalize_task_name(data['name'])
             
             if 'description' in data:
                 update_fields['description'] = data['description']
@@ -314,6 +627,8 @@ def task_operations(task_id):
             if not update_fields:
                 return jsonify({"error": "No hay campos para actualizar"}), 400
             
+            update_fields['updated_at'] = datetime.utcnow()
+            
             # Actualizar tarea
             tasks_collection.update_one(
                 {"_id": ObjectId(task_id)},
@@ -326,7 +641,7 @@ def task_operations(task_id):
             # Soft delete - marcar como no activa
             tasks_collection.update_one(
                 {"_id": ObjectId(task_id)},
-                {"$set": {"is_alive": False}}
+                {"$set": {"is_alive": False, "updated_at": datetime.utcnow()}}
             )
             
             return jsonify({"message": "Tarea eliminada exitosamente"})
@@ -357,19 +672,7 @@ def tasks_by_status(status):
         }))
         
         # Convertir ObjectId a string y procesar fechas
-        processed_tasks = []
-        for task in tasks:
-            task_dict = {
-                "id": str(task['_id']),
-                "name": task['name'],
-                "description": task.get('description', ''),
-                "deadline": convert_datetime_to_string(task.get('deadline')),
-                "status": task.get('status', 'In Progress'),
-                "created_by": str(task.get('created_by', '')),
-                "created_at": convert_datetime_to_string(task.get('created_at')),
-                "created_by_username": task.get('created_by_username', 'Unknown')
-            }
-            processed_tasks.append(task_dict)
+        processed_tasks = [task_to_dict(task) for task in tasks]
         
         return jsonify({"tasks": processed_tasks, "count": len(processed_tasks)})
         
@@ -392,8 +695,12 @@ def root():
             "create_task": "POST /task",
             "task_operations": "GET/PUT/DELETE /task/{id}",
             "tasks_by_status": "GET /tasks/status/{status}",
+            "tasks_changes": "GET /tasks/changes?since={watermark}",
+            "search_tasks": "GET /tasks/search?q={texto}&mode=text|prefix",
             "info": "GET /info",
-            "health": "GET /health"
+            "health": "GET /health",
+            "liveness": "GET /livez",
+            "readiness": "GET /readyz"
         },
         "database": "MongoDB task_management"
     }), 200
@@ -407,7 +714,7 @@ def info():
         "service": "Task Management Service (MongoDB)",
         "version": "1.0.0",
         "user": "admin",  # Simulado
-        "endpoints": ["/tasks", "/task", "/tasks/status/<status>"]
+        "endpoints": ["/tasks", "/task", "/tasks/status/<status>", "/tasks/changes", "/tasks/search"]
     })
 
 @app.route('/health', methods=['GET', 'OPTIONS'])
@@ -415,22 +722,15 @@ def health():
     if request.method == 'OPTIONS':
         return jsonify({'message': 'OK'})
     
-    # Verificar conexión a MongoDB
-    try:
-        if mongo_db.connect():
-            # Test connection
-            mongo_db.client.admin.command('ismaster')
-            db_status = "UP"
-        else:
-            db_status = "DOWN"
-    except:
-        db_status = "DOWN"
+    # Estado de MongoDB desde la última sonda en segundo plano (no abre conexiones)
+    mongo = health_monitor.snapshot()["dependencies"]["mongodb"]
+    db_status = "UP" if mongo["status"] == "UP" else "DOWN"
     
-    # Este return debe estar FUERA del try/except
     return jsonify({
         "status": "UP" if db_status == "UP" else "DEGRADED",
         "service": "Task Service (MongoDB)",
         "database": db_status,
+        "database_latency_ms": mongo["latency_ms"],
         "port": os.environ.get('PORT', 'N/A')
     }), 200
 
@@ -2,8 +2,12 @@
 import mysql.connector
 from mysql.connector import Error
 import os
+import sys
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from mysql_pool import MySQLPool
+
 class DatabaseConfig:
     """Configuración centralizada de la base de datos"""
     
@@ -17,13 +21,26 @@ class DatabaseConfig:
         'auth_plugin': 'mysql_native_password'
     }
 
+    # Pool compartido, creado en la primera petición de conexión
+    _pool = None
+
+    @staticmethod
+    def get_pool():
+        """Pool de conexiones del proceso"""
+        if DatabaseConfig._pool is None:
+            DatabaseConfig._pool = MySQLPool(DatabaseConfig.DB_CONFIG)
+        return DatabaseConfig._pool
+
+    @staticmethod
+    def init_app(app):
+        """Compartir una conexión por petición en `app` y devolverla al pool al terminar"""
+        DatabaseConfig.get_pool().init_app(app)
+
     @staticmethod
     def get_connection():
-        """Obtener conexión a la base de datos MySQL"""
+        """Obtener conexión a la base de datos MySQL desde el pool"""
         try:
-            connection = mysql.connector.connect(**DatabaseConfig.DB_CONFIG)
-            if connection.is_connected():
-                return connection
+            return DatabaseConfig.get_pool().get_connection()
         except Error as e:
             print(f"Error conectando a MySQL: {e}")
             return None
@@ -123,6 +140,11 @@ class DatabaseConfig:
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_deadline ON tasks(deadline)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_is_alive ON tasks(is_alive)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)")
+            # Listado paginado por (created_at, id) de usuarios normales y de admin
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_alive_owner_created ON tasks(is_alive, created_by, created_at)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_alive_created ON tasks(is_alive, created_at)")
+            # ETL incremental a MongoDB (mysql_to_mongo_etl.py --incremental)
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_updated_at ON tasks(updated_at)")
             
             # Insertar datos iniciales
             DatabaseConfig._insert_initial_data(cursor)
@@ -0,0 +1,99 @@
+import os
+import tempfile
+
+from flask import Flask, jsonify
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from api_gateway.ip_rules import ALLOW, DENY, IPRules
+
+def build_rules(allowed=(), blocked=(), path=None):
+    """Reglas solo con las listas dadas (sin fichero salvo que se indique)"""
+    return IPRules(allowed=list(allowed), blocked=list(blocked), path=path)
+
+def test_longest_prefix_wins():
+    print("🧪 Gana el prefijo más largo...")
+    rules = build_rules(allowed=['10.1.2.3', '10.1.0.0/16'], blocked=['10.0.0.0/8', '10.1.2.0/24'])
+    assert rules.match('10.1.2.3') == ALLOW      # /32 dentro del deny /24
+    assert rules.match('10.1.2.4') == DENY       # /24 dentro del allow /16
+    assert rules.match('10.1.9.9') == ALLOW      # /16 dentro del deny /8
+    assert rules.match('10.200.0.1') == DENY     # solo el /8
+    assert rules.match('11.0.0.1') is None       # sin regla
+    print("   ✅ allow /32 > deny /24 > allow /16 > deny /8")
+
+def test_deny_wins_with_same_prefix():
+    print("🧪 Con el mismo prefijo gana deny...")
+    for allowed, blocked in ((['192.168.1.0/24'], ['192.168.1.0/24']), (['192.168.1.7'], ['192.168.1.7/32'])):
+        rules = build_rules(allowed=allowed, blocked=blocked)
+        assert rules.match('192.168.1.7') == DENY
+        assert rules.is_blocked('192.168.1.7') and not rules.is_allowed('192.168.1.7')
+    # El orden de inserción no importa: el fichero se añade después de las listas
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'ip_rules.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("deny 172.16.0.0/12\n# comentario\nallow 172.16.0.0/12\nregla rota\n")
+        rules = build_rules(path=path)
+        assert rules.match('172.20.1.1') == DENY
+    print("   ✅ deny gana en listas y en el fichero de reglas")
+
+def test_ipv4_mapped_and_ipv6():
+    print("🧪 Direcciones IPv4 mapeadas en IPv6 e IPv6 nativas...")
+    rules = build_rules(allowed=['10.1.2.3', 'localhost', '2001:db8::1'], blocked=['10.0.0.0/8', '2001:db8::/32'])
+    assert rules.match('::ffff:10.1.2.3') == ALLOW
+    assert rules.match('::ffff:10.9.9.9') == DENY
+    assert rules.match('::1') == ALLOW and rules.match('127.0.0.1') == ALLOW
+    assert rules.match('2001:db8::1') == ALLOW
+    assert rules.match('2001:db8::2') == DENY
+    assert rules.match('2001:db9::1') is None
+    assert rules.match('no-es-una-ip') is None
+    print("   ✅ ::ffff:a.b.c.d usa las reglas IPv4; IPv6 con prefijo más largo")
+
+def test_client_ip_behind_proxy():
+    print("🧪 IP del cliente detrás del proxy de Render (X-Forwarded-For)...")
+    app = Flask(__name__)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+    rules = build_rules(blocked=['203.0.113.0/24'])
+    rules.init_app(app)
+
+    @app.route('/ping')
+    def ping():
+        return jsonify({"ok": True})
+
+    proxy = {'REMOTE_ADDR': '10.0.0.5'}
+    with app.test_client() as client:
+        blocked = client.get('/ping', headers={'X-Forwarded-For': '203.0.113.9'}, environ_base=proxy)
+        assert blocked.status_code == 403
+        allowed = client.get('/ping', headers={'X-Forwarded-For': '198.51.100.1'}, environ_base=proxy)
+        assert allowed.status_code == 200
+        # Solo cuenta el salto que añade el proxy: una IP inventada por el cliente delante no sirve
+        spoofed = client.get('/ping', headers={'X-Forwarded-For': '198.51.100.1, 203.0.113.9'}, environ_base=proxy)
+        assert spoofed.status_code == 403
+    print("   ✅ Se evalúa la IP que añade el proxy, no la del proxy ni la del cliente")
+
+def test_blocked_ip_before_rate_limit():
+    print("🧪 Una IP bloqueada recibe 403 sin consumir cupo del rate limiting...")
+    app = Flask(__name__)
+    # Como en el gateway: el Limiter registra su before_request antes que las reglas de IP
+    limiter = Limiter(get_remote_address, app=app, default_limits=["2 per minute"], storage_uri="memory://")
+    rules = build_rules(blocked=['203.0.113.0/24'])
+    rules.init_app(app, limiter)
+
+    @app.route('/ping')
+    def ping():
+        return jsonify({"ok": True})
+
+    with app.test_client() as client:
+        statuses = [client.get('/ping', environ_base={'REMOTE_ADDR': '203.0.113.9'}).status_code for _ in range(5)]
+        assert statuses == [403] * 5
+        # El cupo de otra IP no se ve afectado
+        assert client.get('/ping', environ_base={'REMOTE_ADDR': '198.51.100.1'}).status_code == 200
+    print("   ✅ 403 en todas las peticiones bloqueadas, nunca 429")
+
+if __name__ == "__main__":
+    test_longest_prefix_wins()
+    test_deny_wins_with_same_prefix()
+    test_ipv4_mapped_and_ipv6()
+    test_client_ip_behind_proxy()
+    test_blocked_ip_before_rate_limit()
+    print("\n🎉 Pruebas de reglas de IP completadas!")
@@ -19,7 +19,14 @@ def test_register():
                 print(f"   ✅ Usuario creado exitosamente")
                 print(f"   User ID: {data.get('user_id')}")
                 print(f"   OTP Secret: {data.get('otp_secret')}")
-                print(f"   QR Code: {'Sí' if data.get('qr_code') else 'No'}")
+                print(f"   Enrollment token: {'Sí' if data.get('enrollment_token') else 'No'}")
+                
+                # El QR se pide bajo demanda
+                qr_response = client.get(
+                    "/otp/qr?format=svg",
+                    headers={"Authorization": f"Bearer {data.get('enrollment_token')}"}
+                )
+                print(f"   QR (SVG): {qr_response.status_code} {qr_response.mimetype} {len(qr_response.data)} bytes")
             else:
                 print(f"   ❌ Error en registro: {data.get('error')}")
         
@@ -0,0 +1,176 @@
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from pymongo import monitoring
+from pymongo.errors import DuplicateKeyError
+
+class UsersCommandCounter(monitoring.CommandListener):
+    """Contar los comandos enviados a MongoDB sobre la colección users"""
+    def __init__(self):
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def started(self, event):
+        if event.command.get(event.command_name) == 'users':
+            with self.lock:
+                self.counts[event.command_name] = self.counts.get(event.command_name, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+# El listener debe registrarse antes de que se cree el MongoClient
+counter = UsersCommandCounter()
+monitoring.register(counter)
+
+from auth_service.app_mongo import app as auth_app
+from user_service.app_mongo import app as user_app
+from database_mongo import mongo_db, ensure_user_indexes
+
+CONCURRENCY = 20
+
+def skip(reason):
+    """Omitir la prueba: pytest.skip bajo pytest, aviso al ejecutarse como script"""
+    print(f"⏭️ {reason}")
+    if 'pytest' in sys.modules:
+        import pytest
+        pytest.skip(reason)
+
+def run_concurrently(create, payloads):
+    """Lanzar create(payload) en paralelo; devuelve [(status, latencia_ms)]"""
+    results = [None] * len(payloads)
+    barrier = threading.Barrier(len(payloads))
+
+    def worker(index, payload):
+        barrier.wait()
+        start = time.perf_counter()
+        status = create(payload)
+        results[index] = (status, (time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=worker, args=(i, p)) for i, p in enumerate(payloads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def post_to(app, path):
+    """Alta por HTTP contra el servicio (cliente de pruebas de Flask)"""
+    def create(payload):
+        with app.test_client() as client:
+            return client.post(path, json=payload).status_code
+    return create
+
+def old_create(users_collection):
+    """Alta previa a los índices únicos: find_one + insert_one + relectura del documento"""
+    def create(payload):
+        conditions = [{"username": payload['username']}]
+        if payload.get('email'):
+            conditions.append({"email": payload['email']})
+        if users_collection.find_one({"$or": conditions}):
+            return 400
+        result = users_collection.insert_one(dict(payload, created_at=datetime.utcnow()))
+        users_collection.find_one({"_id": result.inserted_id})
+        return 201
+    return create
+
+def new_create(users_collection):
+    """Alta actual: un solo insert_one, los índices únicos detectan el duplicado"""
+    def create(payload):
+        try:
+            users_collection.insert_one(dict(payload, created_at=datetime.utcnow()))
+        except DuplicateKeyError:
+            return 400
+        return 201
+    return create
+
+def report(name, results):
+    statuses = [status for status, _ in results]
+    latencies = sorted(latency for _, latency in results)
+    print(f"   {name}: 201={statuses.count(201)} 400={statuses.count(400)} otros={len(statuses) - statuses.count(201) - statuses.count(400)}")
+    print(f"   Latencia p50: {latencies[len(latencies) // 2]:.1f}ms | máx: {latencies[-1]:.1f}ms")
+    return statuses, latencies[len(latencies) // 2]
+
+def run_scenario(name, create, payloads):
+    """Ejecutar un escenario contando solo sus comandos; devuelve (statuses, p50, counts)"""
+    with counter.lock:
+        counter.counts.clear()
+    statuses, p50 = report(name, run_concurrently(create, payloads))
+    with counter.lock:
+        counts = dict(counter.counts)
+    print(f"   Comandos sobre users: {counts}")
+    return statuses, p50, counts
+
+def test_register_concurrency():
+    print("🧪 Probando altas concurrentes de usuarios en MongoDB...")
+
+    if not mongo_db.connect():
+        skip("MongoDB no disponible, se omiten las pruebas de concurrencia")
+        return
+
+    users_collection = mongo_db.get_collection('users')
+    # Sin índices únicos las altas vuelven a la comprobación previa y los conteos no aplican
+    assert ensure_user_indexes(users_collection), "No se pudieron crear los índices únicos de users"
+
+    suffix = uuid.uuid4().hex[:8]
+    created = []
+
+    try:
+        # 1. Mismo username en paralelo: solo una alta debe ganar
+        print(f"\n1️⃣ {CONCURRENCY} registros simultáneos con el mismo username...")
+        username = f"race_{suffix}"
+        payloads = [{"username": username, "password": "Race123!", "email": f"race{i}_{suffix}@example.com"}
+                    for i in range(CONCURRENCY)]
+        created.append({"username": username})
+        statuses, _, counts = run_scenario("/register", post_to(auth_app, '/register'), payloads)
+        assert statuses.count(201) == 1
+        assert statuses.count(400) == CONCURRENCY - 1
+        assert counts.get('insert', 0) == CONCURRENCY and counts.get('find', 0) == 0
+        print("   ✅ Exactamente una alta creada, un insert por intento y ningún find")
+
+        # 2. Mismo email en paralelo por el User Service
+        print(f"\n2️⃣ {CONCURRENCY} altas simultáneas con el mismo email...")
+        email = f"shared_{suffix}@example.com"
+        payloads = [{"username": f"shared{i}_{suffix}", "password": "Shared123!", "email": email}
+                    for i in range(CONCURRENCY)]
+        created.append({"email": email})
+        statuses, _, counts = run_scenario("/users", post_to(user_app, '/users'), payloads)
+        assert statuses.count(201) == 1
+        assert statuses.count(400) == CONCURRENCY - 1
+        assert counts.get('insert', 0) == CONCURRENCY and counts.get('find', 0) == 0
+        print("   ✅ Exactamente una alta creada, un insert por intento y ningún find")
+
+        # 3. Altas distintas en paralelo: un solo insert por alta, sin find previo ni relectura
+        print(f"\n3️⃣ {CONCURRENCY} altas simultáneas distintas...")
+        payloads = [{"username": f"bulk{i}_{suffix}", "password": "Bulk123!"} for i in range(CONCURRENCY)]
+        created.append({"username": {"$regex": f"^bulk\\d+_{suffix}$"}})
+        statuses, _, counts = run_scenario("/users", post_to(user_app, '/users'), payloads)
+        assert statuses.count(201) == CONCURRENCY
+        assert counts.get('insert', 0) == CONCURRENCY and counts.get('find', 0) == 0
+        print("   ✅ Todas las altas creadas con un insert cada una")
+
+        # 4. Misma carga con la secuencia anterior y la actual, directamente sobre la colección
+        #    (sin bcrypt ni HTTP, que dominarían la latencia)
+        print(f"\n4️⃣ {CONCURRENCY} altas distintas: find_one + insert_one frente a insert_one...")
+        created.append({"username": {"$regex": f"^(old|new)\\d+_{suffix}$"}})
+        old_payloads = [{"username": f"old{i}_{suffix}"} for i in range(CONCURRENCY)]
+        old_statuses, old_p50, old_counts = run_scenario("find_one + insert_one", old_create(users_collection), old_payloads)
+        new_payloads = [{"username": f"new{i}_{suffix}"} for i in range(CONCURRENCY)]
+        new_statuses, new_p50, new_counts = run_scenario("insert_one", new_create(users_collection), new_payloads)
+        assert old_statuses.count(201) == CONCURRENCY and new_statuses.count(201) == CONCURRENCY
+        assert old_counts.get('find', 0) == 2 * CONCURRENCY and old_counts.get('insert', 0) == CONCURRENCY
+        assert new_counts.get('find', 0) == 0 and new_counts.get('insert', 0) == CONCURRENCY
+        print(f"   ✅ Round trips por alta: 3 -> 1 | latencia p50: {old_p50:.1f}ms -> {new_p50:.1f}ms")
+
+        print("\n🎉 Pruebas de concurrencia completadas!")
+
+    finally:
+        for query in created:
+            users_collection.delete_many(query)
+
+if __name__ == "__main__":
+    test_register_concurrency()
@@ -4,9 +4,13 @@ import mysql.connector
 from mysql.connector import Error
 import bcrypt
 import os
+import sys
 from datetime import datetime
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from mysql_pool import MySQLPool
+
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), '..', '.env'))
 
 app = Flask(__name__)
@@ -23,12 +27,14 @@ DB_CONFIG = {
     'auth_plugin': os.getenv('DB_AUTH_PLUGIN')
 }
 
+# Pool de conexiones compartido del proceso (una conexión por petición)
+db_pool = MySQLPool(DB_CONFIG)
+db_pool.init_app(app)
+
 def get_db_connection():
-    """Obtener conexión a la base de datos MySQL"""
+    """Obtener conexión a la base de datos MySQL desde el pool"""
     try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        if connection.is_connected():
-            return connection
+        return db_pool.get_connection()
     except Error as e:
         print(f"Error conectando a MySQL: {e}")
         return None
@@ -421,6 +427,7 @@ def health():
         "status": "UP" if db_status == "UP" else "DEGRADED",
         "service": "User Service",
         "database": db_status,
+        "db_pool": db_pool.stats(),
         "port": 5002
     }), 200
 
@@ -1,10 +1,12 @@
 # user_service/app_mongo.py
 from flask import Flask, jsonify, request
-import bcrypt
 import os
 from datetime import datetime
 import traceback
-from database_mongo import mongo_db
+from database_mongo import mongo_db, ensure_user_indexes, find_existing_user, duplicate_key_field
+from deadlines import init_deadlines
+from health_probes import HealthMonitor, mongo_probe, register_health_routes
+from pymongo.errors import DuplicateKeyError
 # Importar configuración según el entorno
 import os
 if os.getenv('FLASK_ENV') == 'production':
@@ -16,12 +18,20 @@ else:
 
 app = Flask(__name__)
 
+# Liveness (/livez) y readiness (/readyz) con sondas en segundo plano
+health_monitor = HealthMonitor("User Service (MongoDB)")
+health_monitor.add_probe('mongodb', mongo_probe(mongo_db))
+register_health_routes(app, health_monitor)
+
+# Deadline de cada petición (cabecera del gateway) aplicado a las operaciones de MongoDB
+init_deadlines(app)
+
 
 
-print(f"[DB] Conectando a MongoDB: {config.MONGO_URI}")
 
 def hash_password(password):
     """Hashear contraseña usando bcrypt"""
+    import bcrypt  # Importación diferida: acelera el arranque en frío
     return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
 
 def convert_datetime_to_string(obj):
@@ -158,43 +168,35 @@ def create_user():
             return jsonify({"error": "Error de conexión a la base de datos"}), 500
         
         users_collection = mongo_db.get_collection('users')
+        # Sin índices únicos, comprobación previa (no atómica) como respaldo
+        if not ensure_user_indexes(users_collection) and find_existing_user(users_collection, username, email):
+            return jsonify({"error": "El usuario o email ya existe"}), 400
         
         try:
-            # Verificar si el usuario ya existe
-            existing_user = users_collection.find_one({
-                "$or": [
-                    {"username": username},
-                    {"email": email} if email else {"username": "nonexistent"}
-                ]
-            })
-            
-            if existing_user:
-                return jsonify({"error": "El usuario o email ya existe"}), 400
-            
             # Crear documento de usuario
+            now = datetime.utcnow()
             user_doc = {
                 "username": username,
                 "password": hashed_pw.decode('utf-8'),
                 "email": email,
                 "role": role,
-                "created_at": datetime.utcnow()
+                "created_at": now,
+                "updated_at": now
             }
             
-            # Insertar usuario
-            result = users_collection.insert_one(user_doc)
-            
-            # Obtener información del usuario creado
-            new_user = users_collection.find_one({"_id": result.inserted_id}, {
-                "password": 0,
-                "otp_secret": 0
-            })
+            # Insertar usuario: los índices únicos detectan duplicados en una sola operación
+            try:
+                result = users_collection.insert_one(user_doc)
+            except DuplicateKeyError:
+                return jsonify({"error": "El usuario o email ya existe"}), 400
             
+            # La respuesta se construye con el documento insertado, sin releerlo
             user_data = {
-                "id": str(new_user['_id']),
-                "username": new_user['username'],
-                "email": new_user.get('email'),
-                "role": new_user.get('role', 'user'),
-                "created_at": convert_datetime_to_string(new_user.get('created_at'))
+                "id": str(result.inserted_id),
+                "username": user_doc['username'],
+                "email": user_doc.get('email'),
+                "role": user_doc.get('role', 'user'),
+                "created_at": convert_datetime_to_string(user_doc.get('created_at'))
             }
             
             return jsonify({
@@ -271,11 +273,19 @@ def update_user(user_id):
             if not update_fields:
                 return jsonify({"error": "No hay campos para actualizar"}), 400
             
+            update_fields['updated_at'] = datetime.utcnow()
+            
             # Actualizar usuario
-            users_collection.update_one(
-                {"_id": ObjectId(user_id)},
-                {"$set": update_fields}
-            )
+            try:
+                users_collection.update_one(
+                    {"_id": ObjectId(user_id)},
+                    {"$set": update_fields}
+                )
+            except DuplicateKeyError as e:
+                # Escritura concurrente entre la verificación previa y la actualización
+                if duplicate_key_field(e) == 'email':
+                    return jsonify({"error": "El email ya está registrado"}), 400
+                return jsonify({"error": "El nombre de usuario ya está en uso"}), 400
             
             # Obtener usuario actualizado
             updated_user = users_collection.find_one({"_id": ObjectId(user_id)}, {
@@ -342,26 +352,18 @@ def delete_user(user_id):
 
 @app.route('/health', methods=['GET', 'OPTIONS'])
 def health():
-    """Verificar estado del servicio"""
     if request.method == 'OPTIONS':
         return jsonify({'message': 'OK'})
     
-    # Verificar conexión a MongoDB
-    try:
-        if mongo_db.connect():
-            # Test connection
-            mongo_db.client.admin.command('ismaster')
-            db_status = "UP"
-        else:
-            db_status = "DOWN"
-    except:
-        db_status = "DOWN"
+    # Estado de MongoDB desde la última sonda en segundo plano (no abre conexiones)
+    mongo = health_monitor.snapshot()["dependencies"]["mongodb"]
+    db_status = "UP" if mongo["status"] == "UP" else "DOWN"
     
-    # Este return debe estar FUERA del try/except
     return jsonify({
         "status": "UP" if db_status == "UP" else "DEGRADED",
         "service": "User Service (MongoDB)",
         "database": db_status,
+        "database_latency_ms": mongo["latency_ms"],
         "port": os.environ.get('PORT', 'N/A')
     }), 200
 
@@ -409,7 +411,9 @@ def root():
             "update_user": "PUT /users/{id}",
             "delete_user": "DELETE /users/{id}",
             "get_roles": "GET /roles",
-            "health": "GET /health"
+            "health": "GET /health",
+            "liveness": "GET /livez",
+            "readiness": "GET /readyz"
         },
         "database": "MongoDB task_management"
     }), 200
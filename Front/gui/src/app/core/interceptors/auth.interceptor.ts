@@ -20,7 +20,8 @@ export class AuthInterceptor implements HttpInterceptor {
     
     // Clonar la request y añadir el token si existe
     let authRequest = request;
-    if (token) {
+    // No pisar un token explícito (p. ej. el de enrolamiento OTP)
+    if (token && !request.headers.has('Authorization')) {
       authRequest = request.clone({
         setHeaders: {
           Authorization: `Bearer ${token}`
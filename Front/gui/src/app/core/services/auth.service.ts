@@ -30,6 +30,9 @@ export interface AuthResponse {
 
 export interface RegisterResponse {
   message: string;
+  user_id?: string;
+  otp_secret?: string;
+  enrollment_token?: string;
 }
 
 @Injectable({
@@ -112,6 +115,18 @@ export class AuthService {
       );
   }
 
+  /**
+   * QR de enrolamiento OTP (se genera bajo demanda en el Auth Service).
+   * El token va en el header, nunca en la URL, para que no quede en logs ni historial.
+   */
+  getOtpQr(enrollmentToken: string, format: 'png' | 'svg' = 'svg'): Observable<Blob> {
+    const headers = new HttpHeaders({
+      'Authorization': `Bearer ${enrollmentToken}`
+    });
+
+    return this.http.get(`${this.API_URL}/otp/qr?format=${format}`, { headers, responseType: 'blob' });
+  }
+
   register(userData: RegisterRequest): Observable<RegisterResponse> {
     const headers = new HttpHeaders({
       'Content-Type': 'application/json'
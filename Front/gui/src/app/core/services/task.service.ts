@@ -24,6 +24,14 @@ export interface TaskResponse {
   status?: string;
 }
 
+export interface TaskChangesResponse {
+  tasks: Task[];
+  deleted: string[];
+  count: number;
+  watermark: string;
+  has_more: boolean;
+}
+
 export interface TaskDetailResponse {
   task: Task;
 }
@@ -64,6 +72,14 @@ export class TaskService {
     return this.http.get<TaskResponse>(`${this.API_URL}/tasks`);
   }
 
+  /**
+   * Obtener solo las tareas modificadas o eliminadas desde el último watermark
+   */
+  getTaskChanges(since?: string): Observable<TaskChangesResponse> {
+    const params: { [key: string]: string } = since ? { since } : {};
+    return this.http.get<TaskChangesResponse>(`${this.API_URL}/tasks/changes`, { params });
+  }
+
   /**
    * Obtener una tarea específica por ID
    */
@@ -38,7 +38,7 @@ export class RegisterComponent implements OnInit {
   registerForm: FormGroup;
   isLoading = false;
   messages: Message[] = [];
-  qrBase64: string | null = null;
+  qrUrl: string | null = null;
 
   constructor(
     private readonly fb: FormBuilder,
@@ -176,13 +176,18 @@ private handleSuccess(response: any): void {
     summary: 'Éxito',
     detail: response.message || 'Registro completado con éxito'
   }];
-  this.qrBase64 = response.otp_qr || null;
   // Solo redirigir si no hay QR (por compatibilidad)
-  if (!this.qrBase64) {
+  if (!response.enrollment_token) {
+    this.qrUrl = null;
     setTimeout(() => {
       this.router.navigate(['/auth/login']);
     }, 1500);
+    return;
   }
+  this.authService.getOtpQr(response.enrollment_token).subscribe({
+    next: (blob) => this.qrUrl = URL.createObjectURL(blob),
+    error: (error) => console.error('Error obteniendo el QR OTP:', error)
+  });
 }
 
 private handleError(error: any): void {